@@ -1,14 +1,27 @@
-import argparse, traceback
+import argparse, glob, traceback
 from pathlib import Path
-import json, re, os, sys
+import contextlib, contextvars, functools, io, json, random, re, os, shutil, signal, sys, threading, time, uuid, zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timezone
-from docx import Document
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Iterator, Callable, Sequence
+from xml.etree import ElementTree
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.feather as pa_feather
+import pyarrow.parquet as pq
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.chart import BarChart, Reference
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
 from openpyxl.utils import get_column_letter
 
 # Configuration
@@ -21,28 +34,758 @@ AWS_REGION = "ap-southeast-2"
 S3_ARN="arn:aws:s3:::bhp-poc-bucket"
 S3_URI="arn:aws:s3:ap-southeast-2:562078167090:accesspoint/bhp-results"
 
+# Pipeline stage timing (same helpers as server/metrics.py; main() prints the records)
+_stage_observers: List[Callable[["StageRecord"], None]] = []
+_current_stage: contextvars.ContextVar = contextvars.ContextVar("current_stage", default=None)
+
+
+class StageRecord:
+    """Measurements of one run of a pipeline stage."""
+
+    def __init__(self, stage: str, rows_in: Optional[int] = None):
+        self.stage = stage
+        self.rows_in = rows_in
+        self.rows_out: Optional[int] = None
+        self.seconds = 0.0
+        self.process_peak_rss_bytes: Optional[int] = None   # of the process so far, not of this stage
+        self.failed = False
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process so far, or None where it is not available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024   # kilobytes on Linux
+
+
+def add_stage_observer(observer: Callable[[StageRecord], None]) -> None:
+    """Call observer with the StageRecord of every stage that finishes in this process."""
+    if observer not in _stage_observers:
+        _stage_observers.append(observer)
+
+
+def remove_stage_observer(observer: Callable[[StageRecord], None]) -> None:
+    """Stop calling an observer added with add_stage_observer."""
+    if observer in _stage_observers:
+        _stage_observers.remove(observer)
+
+
+@contextlib.contextmanager
+def stage_timer(stage: str, rows_in: Optional[int] = None) -> Iterator[StageRecord]:
+    """
+    Time a pipeline stage; set rows_out on the yielded record before the block ends.
+
+    Args:
+        stage: Stage name, e.g. "merge"
+        rows_in: Rows the stage consumes, if known up front (see count_stage_rows_in)
+    """
+    record = StageRecord(stage, rows_in)
+    token = _current_stage.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        record.failed = True
+        raise
+    finally:
+        record.seconds = time.perf_counter() - started
+        _current_stage.reset(token)
+        if _stage_observers:
+            record.process_peak_rss_bytes = peak_rss_bytes()
+            for observer in list(_stage_observers):
+                try:
+                    observer(record)
+                except Exception as e:   # instrumentation never fails the pipeline
+                    print(f"✗ Recording stage {stage} failed: {e}")
+
+
+def timed_stage(stage: str, rows_in: Optional[Callable[..., Optional[int]]] = None,
+                rows_out: Optional[Callable[[Any], Optional[int]]] = None):
+    """
+    Decorator running a function inside stage_timer.
+
+    Args:
+        stage: Stage name
+        rows_in: Optional function of the call arguments returning the rows consumed
+        rows_out: Optional function of the return value returning the rows produced
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage, rows_in(*args, **kwargs) if rows_in else None) as record:
+                result = func(*args, **kwargs)
+                if rows_out is not None:
+                    record.rows_out = rows_out(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def count_stage_rows_in(rows: int) -> None:
+    """Add rows to the rows_in of the innermost running stage (for inputs read incrementally)."""
+    record = _current_stage.get()
+    if record is not None:
+        record.rows_in = (record.rows_in or 0) + rows
+
+
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")   # e.g. a local MinIO/moto server for testing
+S3_PART_SIZE = 8 * 1024 * 1024                        # S3 requires at least 5MB for every part but the last
+S3_MAX_PARTS = 10000
+S3_MAX_CONCURRENCY = 8
+S3_MAX_PART_ATTEMPTS = 3
+# errors worth sending a request again for; anything else (AccessDenied, NoSuchBucket,
+# NoSuchUpload, ...) fails the upload straight away
+S3_TRANSIENT_ERROR_CODES = frozenset({
+    "Throttling", "ThrottlingException", "ThrottledException", "RequestThrottled", "SlowDown",
+    "RequestLimitExceeded", "TooManyRequestsException", "ProvisionedThroughputExceededException",
+    "RequestTimeout", "RequestTimeoutException", "InternalError", "ServiceUnavailable",
+})
+
+_s3_clients: Dict[Tuple[Optional[str], int], Any] = {}
+_s3_clients_lock = threading.Lock()
+
+
+def get_s3_client(endpoint_url: Optional[str] = None, max_pool_connections: int = S3_MAX_CONCURRENCY):
+    """
+    Return the S3 client of this process for an endpoint, created on first use.
+    
+    boto3 clients are thread-safe and keep a pool of HTTPS connections, so every
+    upload of the process (and every part of it) reuses the same connections.
+    With an endpoint_url (a local S3 stand-in) credentials come from the
+    environment instead of the constants above. botocore's own retries are
+    off: S3Uploader retries transient errors itself, once per part.
+    """
+    key = (endpoint_url, max_pool_connections)
+    with _s3_clients_lock:
+        client = _s3_clients.get(key)
+        if client is None:
+            import boto3
+            from botocore.config import Config
+            credentials = {} if endpoint_url else dict(aws_access_key_id=AWS_ACCESS_KEY_ID,
+                                                       aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+                                                       aws_session_token=AWS_SESSION_TOKEN)
+            client = boto3.client(
+                "s3",
+                region_name=AWS_REGION,
+                endpoint_url=endpoint_url,
+                config=Config(max_pool_connections=max_pool_connections,
+                              retries={"max_attempts": 1, "mode": "standard"},
+                              tcp_keepalive=True),
+                **credentials
+            )
+            _s3_clients[key] = client
+    return client
+
+
+def is_transient_s3_error(error: BaseException) -> bool:
+    """True for throttling, 5xx and connection/timeout errors, which may succeed when sent again."""
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):   # botocore ClientError
+        code = response.get("Error", {}).get("Code")
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return code in S3_TRANSIENT_ERROR_CODES or status == 429 or status >= 500
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    try:
+        from botocore.exceptions import ConnectionError as BotoConnectionError, HTTPClientError
+    except ImportError:
+        return False
+    # EndpointConnectionError, ConnectTimeoutError, ReadTimeoutError, ConnectionClosedError
+    return isinstance(error, (BotoConnectionError, HTTPClientError))
+
+
 class S3Uploader:
-    """Upload files to AWS S3 bucket."""
-    
-    def __init__(self, bucket_name: str):
-        import boto3
-        self.s3_client = boto3.client(
-            "s3",
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            aws_session_token=AWS_SESSION_TOKEN,
-            region_name=AWS_REGION
-        )
+    """Upload files and in-memory buffers to AWS S3 in concurrent multipart transfers."""
+    
+    def __init__(self, bucket_name: str, client: Any = None,
+                 endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+                 part_size: int = S3_PART_SIZE,
+                 max_concurrency: int = S3_MAX_CONCURRENCY,
+                 max_part_attempts: int = S3_MAX_PART_ATTEMPTS):
+        """
+        Initialise uploader.
+        
+        Args:
+            bucket_name: Bucket name or access point ARN
+            client: S3 client to use (e.g. one bound to a local stand-in); default: get_s3_client,
+                called on the first upload, so an uploader can be created before S3 is reachable
+            endpoint_url: S3 endpoint when no client is given (default: $S3_ENDPOINT_URL, else AWS)
+            part_size: Bytes per part; smaller objects are sent in a single PUT
+            max_concurrency: Parts in flight at the same time
+            max_part_attempts: Attempts per part (or single PUT) on transient errors
+                before the whole upload is aborted
+        """
+        self._client = client
+        self.endpoint_url = endpoint_url
         self.bucket_name = bucket_name
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.max_part_attempts = max_part_attempts
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    @property
+    def s3_client(self) -> Any:
+        """The injected client, or the shared client of this process for endpoint_url."""
+        if self._client is not None:
+            return self._client
+        return get_s3_client(self.endpoint_url, self.max_concurrency)
+    
+    def upload_file(self, file_path: str, s3_key: str) -> Dict[str, Any]:
+        """
+        Upload a file to S3; each part is read from disk when it is sent.
+        
+        Returns:
+            Upload result (see upload_buffer)
+        """
+        def read_part(offset: int, length: int) -> bytes:
+            with open(file_path, "rb") as f:
+                f.seek(offset)
+                return f.read(length)
+        
+        return self._upload(read_part, os.path.getsize(file_path), s3_key, str(file_path))
+    
+    def upload_buffer(self, buffer: Any, s3_key: str) -> Dict[str, Any]:
+        """
+        Upload an in-memory buffer (bytes or a BytesIO, e.g. from export_report_buffers) to S3.
+        
+        Returns:
+            bucket, key, bytes, parts, etag and seconds of the finished upload
+        
+        Raises:
+            Exception: the error of the part (or request) that failed; a failed
+                multipart upload is aborted, so S3 does not keep its parts
+        """
+        data = buffer.getvalue() if isinstance(buffer, io.BytesIO) else bytes(buffer)
+        view = memoryview(data)
+        return self._upload(lambda offset, length: view[offset:offset + length].tobytes(), len(view),
+                            s3_key, getattr(buffer, "name", s3_key))
+    
+    def close(self) -> None:
+        """Stop the part upload threads."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+    
+    def _upload(self, read_part: Callable[[int, int], bytes], size: int, s3_key: str, name: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            with stage_timer("upload"):
+                if size <= self.part_size:
+                    parts = 1
+                    etag = self._with_retries(s3_key, lambda: self.s3_client.put_object(
+                        Bucket=self.bucket_name, Key=s3_key, Body=read_part(0, size)))["ETag"]
+                else:
+                    parts, etag = self._upload_multipart(read_part, size, s3_key)
+        except Exception as e:
+            print(f"Error uploading {name} to S3: {e}")
+            raise
+        
+        result = {"bucket": self.bucket_name, "key": s3_key, "bytes": size, "parts": parts,
+                  "etag": etag, "seconds": round(time.perf_counter() - started, 3)}
+        print(f"✓ Uploaded {name} to s3://{self.bucket_name}/{s3_key} "
+              f"({size} bytes, {parts} parts, {result['seconds']}s)")
+        return result
+    
+    def _upload_multipart(self, read_part: Callable[[int, int], bytes], size: int, s3_key: str) -> Tuple[int, str]:
+        part_size = max(self.part_size, -(-size // S3_MAX_PARTS))
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="s3-part")
+        upload_id = self.s3_client.create_multipart_upload(Bucket=self.bucket_name, Key=s3_key)["UploadId"]
+        futures = []
+        try:
+            futures = [self._executor.submit(self._upload_part, s3_key, upload_id, number, read_part,
+                                             offset, min(part_size, size - offset))
+                       for number, offset in enumerate(range(0, size, part_size), start=1)]
+            completed = [future.result() for future in futures]
+            response = self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id,
+                MultipartUpload={"Parts": completed})
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            try:
+                self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id)
+            except Exception as e:
+                print(f"✗ Failed to abort multipart upload of {s3_key}: {e}")
+            raise
+        return len(completed), response["ETag"]
+    
+    def _upload_part(self, s3_key: str, upload_id: str, number: int,
+                     read_part: Callable[[int, int], bytes], offset: int, length: int) -> Dict[str, Any]:
+        # only this part is sent again when it fails, the parts already uploaded are kept
+        response = self._with_retries(f"{s3_key} part {number}", lambda: self.s3_client.upload_part(
+            Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id, PartNumber=number,
+            Body=read_part(offset, length)))
+        return {"PartNumber": number, "ETag": response["ETag"]}
     
-    def upload_file(self, file_path: str, s3_key: str) -> None:
-        """Upload a file to S3."""
+    def _with_retries(self, what: str, send: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        for attempt in range(1, self.max_part_attempts + 1):
+            try:
+                return send()
+            except Exception as e:
+                if attempt == self.max_part_attempts or not is_transient_s3_error(e):
+                    raise
+                delay = min(0.5 * 2 ** attempt, 10)
+                print(f"✗ Uploading {what} failed (attempt {attempt}/{self.max_part_attempts}), "
+                      f"retrying in {delay}s: {e}")
+                time.sleep(delay)
+
+# Publish queue journal (same layout as server/publish_queue.py)
+PUBLISH_JOURNAL_SUFFIX = ".json"
+PUBLISH_DATA_SUFFIX = ".data"
+PUBLISH_LOCK_SUFFIX = ".lock"
+PUBLISH_FAILED_FOLDER = "failed"
+PUBLISH_ORPHAN_MIN_AGE_SECONDS = 60 * 60
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True   # exists, owned by someone else
+    return True
+
+
+class PublishQueue:
+    """On-disk journal of artifacts to publish, drained by a bounded pool of background threads."""
+
+    def __init__(self, spool_dir: str, publish: Callable[[str, str], Any],
+                 max_workers: int = 4,
+                 max_attempts: int = 10,
+                 base_delay_seconds: float = 2,
+                 max_delay_seconds: float = 600,
+                 poll_interval_seconds: float = 5):
+        """
+        Initialise queue.
+
+        Args:
+            spool_dir: Directory holding the journal and the spooled artifact copies
+            publish: Called with the spooled file path and the object key; raises on failure
+            max_workers: Uploads running at the same time in this process
+            max_attempts: Attempts before an entry is moved to failed/
+            base_delay_seconds: Delay after the first failure, doubled after every further one
+            max_delay_seconds: Upper bound for the delay between attempts
+            poll_interval_seconds: How often the journal is rescanned for entries of other processes
+        """
+        self.spool_dir = spool_dir
+        self.failed_dir = os.path.join(spool_dir, PUBLISH_FAILED_FOLDER)
+        self.publish = publish
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.published = 0
+        self.retried = 0
+        self.given_up = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+    def enqueue(self, path: str, key: str) -> str:
+        """
+        Copy a file into the spool and journal it for publishing under key.
+
+        Returns:
+            The entry id
+        """
+        return self._add(key, os.path.basename(path), lambda data_path: shutil.copyfile(path, data_path))
+
+    def enqueue_bytes(self, data: bytes, key: str) -> str:
+        """Same as enqueue, for an artifact held in memory."""
+        def write(data_path: str) -> None:
+            with open(data_path, "wb") as f:
+                f.write(data)
+        return self._add(key, os.path.basename(key), write)
+
+    def start(self) -> None:
+        """Start draining the journal on a daemon thread (once per process)."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._remove_orphans()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="publish")
+        self._thread = threading.Thread(target=self._run, name="publish-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        """Stop taking new entries; with wait, let running uploads finish."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def drain(self, timeout: Optional[float] = None) -> int:
+        """
+        Wait until the journal is empty (published or given up), or until timeout.
+
+        Returns:
+            Number of entries still pending
+        """
+        self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = len(self._journal_ids())
+            if remaining == 0 or (deadline is not None and time.monotonic() >= deadline):
+                return remaining
+            time.sleep(0.1)
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Return the journal entries waiting to be published, oldest first."""
+        entries = [entry for entry in map(self._read_entry, self._journal_ids()) if entry is not None]
+        return sorted(entries, key=lambda entry: entry["createdAt"])
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the journal size and this process's publish counters."""
+        return {
+            "pid": os.getpid(),
+            "pending": len(self._journal_ids()),
+            "failed": sum(name.endswith(PUBLISH_JOURNAL_SUFFIX) for name in os.listdir(self.failed_dir)),
+            **self._counters(),
+        }
+
+    def _counters(self) -> Dict[str, int]:
+        with self._lock:
+            return {"published": self.published, "retried": self.retried, "givenUp": self.given_up}
+
+    def _add(self, key: str, name: str, write_data: Callable[[str], None]) -> str:
+        entry_id = uuid.uuid4().hex
+        data_path = self._path(entry_id, PUBLISH_DATA_SUFFIX)
+        write_data(data_path)
+        self._fsync(data_path)
+        # the journal entry is written after its data, so a journaled entry always has its file
+        self._write_entry({"id": entry_id, "key": key, "name": name, "attempts": 0,
+                           "nextAttemptAt": time.time(), "lastError": None,
+                           "createdAt": datetime.now().isoformat(timespec="milliseconds")})
+        self._wake.set()
+        return entry_id
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.clear()
+            next_due = time.time() + self.poll_interval_seconds
+            try:
+                for entry in self.pending():
+                    if entry["nextAttemptAt"] > time.time():
+                        next_due = min(next_due, entry["nextAttemptAt"])
+                        continue
+                    if not self._slots.acquire(blocking=False):
+                        break   # all workers busy, a finishing upload wakes the loop
+                    if not self._claim(entry["id"]):
+                        self._slots.release()
+                        continue
+                    self._executor.submit(self._publish, entry["id"])
+            except Exception as e:
+                print(f"✗ Scanning publish journal {self.spool_dir} failed: {e}")
+            self._wake.wait(max(0.0, next_due - time.time()))
+
+    def _publish(self, entry_id: str) -> None:
         try:
-            self.s3_client.upload_file(file_path, self.bucket_name, s3_key)
-            print(f"✓ Uploaded {file_path} to s3://{self.bucket_name}/{s3_key}")
+            entry = self._read_entry(entry_id)   # re-read: another process may have finished it
+            if entry is None:
+                return
+            data_path = self._path(entry_id, PUBLISH_DATA_SUFFIX)
+            try:
+                self.publish(data_path, entry["key"])
+            except Exception as e:
+                self._failed(entry, e)
+                return
+            self._remove(entry_id)
+            with self._lock:
+                self.published += 1
+            print(f"✓ Published {entry['name']} -> {entry['key']}")
         except Exception as e:
-            print(f"Error uploading {file_path} to S3: {e}")
+            print(f"✗ Publishing entry {entry_id} failed: {e}")
+        finally:
+            self._release(entry_id)
+            self._slots.release()
+            self._wake.set()
+
+    def _failed(self, entry: Dict[str, Any], error: Exception) -> None:
+        entry["attempts"] += 1
+        entry["lastError"] = f"{type(error).__name__}: {error}"
+        if entry["attempts"] >= self.max_attempts:
+            for suffix in (PUBLISH_DATA_SUFFIX, PUBLISH_JOURNAL_SUFFIX):
+                os.replace(self._path(entry["id"], suffix),
+                           os.path.join(self.failed_dir, f"{entry['id']}{suffix}"))
+            with self._lock:
+                self.given_up += 1
+            print(f"✗ Giving up publishing {entry['name']} after {entry['attempts']} attempts: {error}")
+            return
+        # full jitter on the upper half, so workers retrying together spread out
+        delay = min(self.base_delay_seconds * 2 ** (entry["attempts"] - 1), self.max_delay_seconds)
+        delay *= random.uniform(0.5, 1.0)
+        entry["nextAttemptAt"] = time.time() + delay
+        self._write_entry(entry)
+        with self._lock:
+            self.retried += 1
+        print(f"✗ Publishing {entry['name']} failed (attempt {entry['attempts']}/{self.max_attempts}), "
+              f"retrying in {delay:.1f}s: {error}")
+
+    def _claim(self, entry_id: str) -> bool:
+        lock_path = self._path(entry_id, PUBLISH_LOCK_SUFFIX)
+        for _ in range(2):
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    with open(lock_path, "r") as f:
+                        owner = int(f.read() or 0)
+                except (OSError, ValueError):
+                    return False   # being written by its owner
+                if owner and _pid_alive(owner):
+                    return False
+                try:
+                    os.remove(lock_path)   # owner exited mid-upload, take the entry over
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+
+    def _release(self, entry_id: str) -> None:
+        try:
+            os.remove(self._path(entry_id, PUBLISH_LOCK_SUFFIX))
+        except FileNotFoundError:
+            pass
+
+    def _journal_ids(self) -> List[str]:
+        return [name[:-len(PUBLISH_JOURNAL_SUFFIX)] for name in os.listdir(self.spool_dir)
+                if name.endswith(PUBLISH_JOURNAL_SUFFIX)]
+
+    def _read_entry(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(entry_id, PUBLISH_JOURNAL_SUFFIX), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):   # published meanwhile
+            return None
+
+    def _write_entry(self, entry: Dict[str, Any]) -> None:
+        path = self._path(entry["id"], PUBLISH_JOURNAL_SUFFIX)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _remove(self, entry_id: str) -> None:
+        # journal first: an entry without its journal file is never picked up again
+        for suffix in (PUBLISH_JOURNAL_SUFFIX, PUBLISH_DATA_SUFFIX):
+            try:
+                os.remove(self._path(entry_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _remove_orphans(self) -> None:
+        # spooled data whose journal entry was never written (crash inside enqueue), or
+        # was removed before the data (crash after publishing); younger files may belong
+        # to an enqueue still in progress in another process
+        journaled = set(self._journal_ids())
+        cutoff = time.time() - PUBLISH_ORPHAN_MIN_AGE_SECONDS
+        for entry in os.scandir(self.spool_dir):
+            entry_id = entry.name.split(".", 1)[0]
+            if not entry.is_file() or entry_id in journaled:
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def _path(self, entry_id: str, suffix: str) -> str:
+        return os.path.join(self.spool_dir, f"{entry_id}{suffix}")
+
+    @staticmethod
+    def _fsync(path: str) -> None:
+        with open(path, "rb") as f:
+            os.fsync(f.fileno())
+
+# Opt-in profiling of a run (same as server/profiling.py; --profile)
+PROFILE_METADATA_NAME = "metadata.json"
+PROFILE_STATS_LINES = 60
+PROFILE_KEEP = 20   # captures retained in output/profiles/
+
+
+class ProfileCapture:
+    """cProfile + tracemalloc captures of single runs, with bounded retention."""
+
+    def __init__(self, profiles_dir: str, keep: int = 20, top_allocations: int = 30,
+                 traceback_frames: int = 1):
+        """
+        Initialise capture store.
+
+        Args:
+            profiles_dir: Directory receiving one sub-directory per capture
+            keep: Captures retained; older ones are removed when a new one is written
+            top_allocations: Source lines listed in allocations.txt
+            traceback_frames: Frames tracemalloc stores per allocation
+        """
+        self.profiles_dir = profiles_dir
+        self.keep = keep
+        self.top_allocations = top_allocations
+        self.traceback_frames = traceback_frames
+        self._busy = threading.Lock()
+
+    @contextlib.contextmanager
+    def capture(self, label: str, profile_id: Optional[str] = None) -> Iterator[Optional[str]]:
+        """
+        Profile the enclosed block.
+
+        Args:
+            label: What is profiled, e.g. "upload", stored in the metadata
+            profile_id: Name of the capture directory (default: timestamp + random suffix)
+
+        Yields:
+            The capture id, or None when another capture is running in this process
+        """
+        if not self._busy.acquire(blocking=False):
+            print(f"✗ Profiling already running in this process, {label} runs unprofiled")
+            yield None
+            return
+
+        import cProfile
+        import tracemalloc
+
+        profile_id = profile_id or f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(self.traceback_frames)
+        tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+        metadata: Dict[str, Any] = {"profileId": profile_id, "label": label, "pid": os.getpid(),
+                                    "createdAt": datetime.now().isoformat(timespec="seconds"), "error": None}
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            yield profile_id
+        except BaseException as e:
+            metadata["error"] = f"{type(e).__name__}: {e}"
             raise
+        finally:
+            profiler.disable()
+            metadata["seconds"] = round(time.perf_counter() - started, 3)
+            try:
+                snapshot = tracemalloc.take_snapshot()
+                metadata["tracedPeakBytes"] = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+                self._write(profile_id, profiler, snapshot, metadata)
+                self._enforce_retention()
+                print(f"✓ Profile {profile_id} written to {self.path(profile_id)}")
+            except Exception as e:   # a failed capture never fails the run it profiled
+                print(f"✗ Writing profile {profile_id} failed: {e}")
+            finally:
+                self._busy.release()
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Return the metadata of every retained capture, newest first."""
+        captures = []
+        for name in self._capture_names():
+            try:
+                with open(os.path.join(self.profiles_dir, name, PROFILE_METADATA_NAME), "r", encoding="utf-8") as f:
+                    captures.append(json.load(f))
+            except (OSError, ValueError):   # still being written, or removed meanwhile
+                continue
+        return captures
+
+    def path(self, profile_id: str) -> Optional[str]:
+        """Return the directory of a finished capture, or None."""
+        path = os.path.join(self.profiles_dir, profile_id)
+        return path if os.path.exists(os.path.join(path, PROFILE_METADATA_NAME)) else None
+
+    def _write(self, profile_id: str, profiler, snapshot, metadata: Dict[str, Any]) -> None:
+        import pstats
+        import tracemalloc
+
+        path = os.path.join(self.profiles_dir, profile_id)
+        os.makedirs(path, exist_ok=True)
+        profiler.dump_stats(os.path.join(path, "profile.prof"))
+        with open(os.path.join(path, "profile.txt"), "w", encoding="utf-8") as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(PROFILE_STATS_LINES)
+
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                           tracemalloc.Filter(False, "<frozen importlib._bootstrap>")])
+        with open(os.path.join(path, "allocations.txt"), "w", encoding="utf-8") as f:
+            f.write(f"Peak traced memory: {metadata['tracedPeakBytes'] / 2 ** 20:.1f} MB\n\n")
+            for stat in snapshot.statistics("lineno")[:self.top_allocations]:
+                f.write(f"{stat}\n")
+
+        # written last: a capture without metadata is still being written
+        with open(os.path.join(path, PROFILE_METADATA_NAME), "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2)
+
+    def _capture_names(self) -> List[str]:
+        entries = []
+        if os.path.isdir(self.profiles_dir):
+            for entry in os.scandir(self.profiles_dir):
+                if entry.is_dir():
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.name))
+                    except FileNotFoundError:
+                        continue
+        return [name for _, name in sorted(entries, reverse=True)]
+
+    def _enforce_retention(self) -> None:
+        for name in self._capture_names()[self.keep:]:
+            shutil.rmtree(os.path.join(self.profiles_dir, name), ignore_errors=True)   # another worker may get there first
+
+
+# XLSX report styling
+TITLE_FILL = PatternFill(start_color="D45A16", end_color="D45A16", fill_type="solid")
+TITLE_FONT = Font(color="FFFFFF", bold=True, size=12)
+BAND_FILL = PatternFill(start_color="F2AA84", end_color="F2AA84", fill_type="solid")
+BAND_FONT = Font(bold=True, size=11)
+CENTER_ALIGN = Alignment(horizontal="center", vertical="center")
+# column headers keep the look DataFrame.to_excel gave them
+COLUMN_HEADER_FONT = Font(bold=True)
+COLUMN_HEADER_ALIGN = Alignment(horizontal="center", vertical="top")
+THIN_BORDER = Border(
+    left=Side(style='thin'),
+    right=Side(style='thin'),
+    top=Side(style='thin'),
+    bottom=Side(style='thin')
+)
+# Named styles registered once per workbook and shared by all header cells
+TITLE_STYLE = "Report Title"
+BAND_STYLE = "Report Band"
+COLUMN_HEADER_STYLE = "Report Column Header"
+COLUMN_WIDTH = 20
+DATE_FORMAT = "YYYY-MM-DD"
+DATETIME_FORMAT = "YYYY-MM-DD HH:MM:SS"
+# Comparison sheet: variance_hours (6th column) is dropped in favour of its absolute value
+COMPARISON_DROPPED_COLUMN = 5
+COMPARISON_HEADERS = ["UID", "Services Performed", "Service Date", "Invoice Hours", "System Hours",
+                      "Variance (Hours)", "Variance (Percentage)", "Mismatch Hours", "Policy Conflict"]
+COMPARISON_BAND_FILLS = (
+    [BAND_FILL] * 4
+    + [PatternFill(start_color="538DD5", end_color="538DD5", fill_type="solid")]
+    + [PatternFill(start_color="CCC0DA", end_color="CCC0DA", fill_type="solid")] * 4
+)
+COMPARISON_INDEX_SHEET = "Comparison Index"
+# Report artifacts (df1, df2, the merged calculation and the variance comparison)
+# and the formats they can be written in
+REPORT_ARTIFACTS = ("df1", "df2", "calculation", "comparison")
+REPORT_FORMATS = ("xlsx", "csv", "parquet", "json")
+# Sheets longer than Excel allows continue on further sheets or workbooks
+EXCEL_MAX_ROWS = 1_048_576
+EXCEL_MAX_SHEET_NAME = 31
+REPORT_HEADER_ROWS = 3          # title, band and column header rows above the data
+EXPORT_BLOCK_ROWS = 65_536      # rows converted to cell values at a time
+
 
 class DataFrameMergeWithVariance:
     """Merge DataFrames with variance calculation and XLSX export."""
@@ -50,7 +793,8 @@ class DataFrameMergeWithVariance:
     def __init__(self, df1: pd.DataFrame, df1_name: str,
                  df2: pd.DataFrame, df2_name: str,
                  key_columns: list,
-                 variance_threshold: float = 12.0):
+                 variance_threshold: float = 12.0,
+                 lookup_keys: Optional[Callable[[pd.DataFrame], list]] = None):
         """
         Initialise merger.
         
@@ -60,6 +804,11 @@ class DataFrameMergeWithVariance:
             df2: Second DataFrame (e.g., actual hours from attendance)
             df2_name: Display name for df2 (e.g. Attendance Summary Data)
             key_columns: List of column names to merge on
+            lookup_keys: Optional function returning df1's join keys (one array per
+                index level) when df2 is a prebuilt lookup index, e.g. from
+                build_agreement_index. Matching is then a single hash join on that
+                index instead of an outer merge, and df2 rows with no df1 match
+                are not kept.
         """
         self.df1 = df1.copy()
         self.df2 = df2.copy()
@@ -69,6 +818,7 @@ class DataFrameMergeWithVariance:
         self.merged_df = None
         self.variance_df = None
         self.variance_threshold = variance_threshold
+        self.lookup_keys = lookup_keys
     
     def merge_dataframes(self) -> pd.DataFrame:
         """ Merge two DataFrames on key columns."""
@@ -86,14 +836,44 @@ class DataFrameMergeWithVariance:
         #                     suffixes=(f'_{self.df1_name}', f'_{self.df2_name}'))
         if self.key_columns is None or len(self.key_columns)==0:
             raise ValueError(f"No key columns specified for merging. cannot map records.: {self.df2_name} & {self.df1_name}")
-        else:
-            self.merged_df = pd.merge(self.df1, self.df2, 
-                            on=self.key_columns, 
-                            how='outer',
-                            suffixes=(f'_{self.df1_name}', f'_{self.df2_name}'))
+        with stage_timer("merge", rows_in=len(self.df1) + len(self.df2)) as stage:
+            if self.lookup_keys is not None:
+                self.merged_df = self._lookup_join()
+            else:
+                self._align_categorical_keys()
+                self.merged_df = pd.merge(self.df1, self.df2, 
+                                on=self.key_columns, 
+                                how='outer',
+                                suffixes=(f'_{self.df1_name}', f'_{self.df2_name}'))
+            stage.rows_out = len(self.merged_df)
         print(f"✓ Merged {len(self.df2)} + {len(self.df1)} records → {len(self.merged_df)} records")
         return self.merged_df
     
+    def _lookup_join(self) -> pd.DataFrame:
+        """Left hash join of df1 onto df2's prebuilt index, ordered like the key-sorted outer merge."""
+        keys = pd.MultiIndex.from_arrays(self.lookup_keys(self.df1))
+        positions = self.df2.index.get_indexer(keys)   # -1 where df1 has no match
+        
+        right = self.df2.drop(columns=[c for c in self.key_columns if c in self.df2.columns])
+        right = right.reset_index(drop=True).reindex(positions).reset_index(drop=True)
+        left = self.df1.reset_index(drop=True)
+        
+        overlap = left.columns.intersection(right.columns)
+        left = left.rename(columns={c: f'{c}_{self.df1_name}' for c in overlap})
+        right = right.rename(columns={c: f'{c}_{self.df2_name}' for c in overlap})
+        
+        merged = pd.concat([left, right], axis=1)
+        return merged.sort_values(self.key_columns, kind='stable', ignore_index=True)
+    
+    def _align_categorical_keys(self) -> None:
+        """Give categorical key columns the same categories on both sides so the merge joins integer codes."""
+        for col in self.key_columns:
+            left, right = self.df1[col], self.df2[col]
+            if isinstance(left.dtype, pd.CategoricalDtype) and isinstance(right.dtype, pd.CategoricalDtype):
+                categories = left.cat.categories.union(right.cat.categories)
+                self.df1[col] = left.cat.set_categories(categories)
+                self.df2[col] = right.cat.set_categories(categories)
+    
     def calculate_variance(self, 
                           df1_hours_col: str,
                           df2_hours_col: str,
@@ -111,32 +891,34 @@ class DataFrameMergeWithVariance:
         if self.merged_df is None:
             self.merge_dataframes()
         
-        # Convert to numeric Prepare data for calculation
-        self.merged_df[df1_hours_col] = pd.to_numeric(
-            self.merged_df[df1_hours_col], errors='coerce').fillna(0)
-        self.merged_df[df2_hours_col] = pd.to_numeric(
-            self.merged_df[df2_hours_col], errors='coerce').fillna(0)
-        
-        # Calculate variance
-        self.merged_df[variance_col] = (
-            self.merged_df[df2_hours_col] - self.merged_df[df1_hours_col])
-        
-        # Calculate absolute variance
-        self.merged_df[f'abs_{variance_col}'] = np.abs(self.merged_df[variance_col])
-        
-        # Calculate percentage (handle division by zero)
-        actual = self.merged_df[df1_hours_col].to_numpy(dtype=float)
-        allowed = self.merged_df[df2_hours_col].to_numpy(dtype=float)
-        variance = self.merged_df[variance_col].to_numpy(dtype=float)
-        
-        with np.errstate(divide='ignore', invalid='ignore'):
-            pct = np.where(
-                allowed == 0,
-                np.where(variance == 0, 0.0, np.nan),
-                (variance / actual) * 100.0
-            )
+        with stage_timer("variance", rows_in=len(self.merged_df)) as stage:
+            # Convert to numeric Prepare data for calculation
+            self.merged_df[df1_hours_col] = pd.to_numeric(
+                self.merged_df[df1_hours_col], errors='coerce').fillna(0)
+            self.merged_df[df2_hours_col] = pd.to_numeric(
+                self.merged_df[df2_hours_col], errors='coerce').fillna(0)
+        
+            # Calculate variance
+            self.merged_df[variance_col] = (
+                self.merged_df[df2_hours_col] - self.merged_df[df1_hours_col])
+        
+            # Calculate absolute variance
+            self.merged_df[f'abs_{variance_col}'] = np.abs(self.merged_df[variance_col])
+        
+            # Calculate percentage (handle division by zero)
+            actual = self.merged_df[df1_hours_col].to_numpy(dtype=float)
+            allowed = self.merged_df[df2_hours_col].to_numpy(dtype=float)
+            variance = self.merged_df[variance_col].to_numpy(dtype=float)
+        
+            with np.errstate(divide='ignore', invalid='ignore'):
+                pct = np.where(
+                    allowed == 0,
+                    np.where(variance == 0, 0.0, np.nan),
+                    (variance / actual) * 100.0
+                )
         
-        self.merged_df[pct_col] = np.abs(np.round(pct, 2))
+            self.merged_df[pct_col] = np.abs(np.round(pct, 2))
+            stage.rows_out = len(self.merged_df)
         
         print(f"✓ Calculated variance and percentages")
         return self.merged_df
@@ -152,306 +934,1303 @@ class DataFrameMergeWithVariance:
         ]
         available_cols = [c for c in summary_cols if c in self.merged_df.columns]
         
-        self.variance_df = self.merged_df[available_cols].copy()
-        # self.variance_df = self.variance_df.rename(columns={
-        #     'hoursWorked': 'systemHours'  # assuming hoursWorked from df1 is allowed
-        # })
-        self.variance_df = self.variance_df[self.variance_df['attendanceDate'].notna()]
-        self.variance_df["hours_mismatch"] = np.abs(self.variance_df["variance_pct"]) > 10.0
-        self.variance_df["policy_error"] = self.variance_df["totalHoursWorked"] > self.variance_threshold
+        with stage_timer("summary", rows_in=len(self.merged_df)) as stage:
+            self.variance_df = self.merged_df[available_cols].copy()
+            # self.variance_df = self.variance_df.rename(columns={
+            #     'hoursWorked': 'systemHours'  # assuming hoursWorked from df1 is allowed
+            # })
+            self.variance_df = self.variance_df[self.variance_df['attendanceDate'].notna()]
+            self.variance_df["hours_mismatch"] = np.abs(self.variance_df["variance_pct"]) > 10.0
+            self.variance_df["policy_error"] = self.variance_df["totalHoursWorked"] > self.variance_threshold
+            stage.rows_out = len(self.variance_df)
         return self.variance_df
     
     def export_to_csv(self, output_file: str) -> None:
         if self.merged_df is None:
             self.merge_dataframes()
     
+    def export_report(self, output_prefix: str,
+                      df1_hours_col: str = None,
+                      df2_hours_col: str = None,
+                      artifacts: Sequence[str] = REPORT_ARTIFACTS,
+                      formats: Sequence[str] = ("xlsx",),
+                      split_workbooks: bool = False,
+                      max_sheet_rows: int = EXCEL_MAX_ROWS) -> List[str]:
+        """
+        Compute and write only the requested report artifacts.
+        
+        The xlsx format writes one workbook (<output_prefix>.xlsx) with a sheet per
+        artifact; csv, parquet and json write one file per artifact, named
+        <output_prefix>_<artifact>.<format>. Frames no requested artifact needs
+        are not computed.
+        
+        Args:
+            output_prefix: Output path without extension
+            df1_hours_col: Hours column from df1
+            df2_hours_col: Hours column from df2
+            artifacts: Any of REPORT_ARTIFACTS
+            formats: Any of REPORT_FORMATS
+            split_workbooks: When a sheet would exceed max_sheet_rows, write
+                <output_prefix>.zip with several workbooks instead of adding
+                continuation sheets to one workbook
+            max_sheet_rows: Rows per sheet, including the three header rows
+        
+        Returns:
+            Paths of the written files
+        """
+        return self._export_report(output_prefix, lambda path: path, df1_hours_col, df2_hours_col,
+                                   artifacts, formats, split_workbooks, max_sheet_rows)
+    
+    def export_report_buffers(self, name_prefix: str,
+                              df1_hours_col: str = None,
+                              df2_hours_col: str = None,
+                              artifacts: Sequence[str] = REPORT_ARTIFACTS,
+                              formats: Sequence[str] = ("xlsx",),
+                              split_workbooks: bool = False,
+                              max_sheet_rows: int = EXCEL_MAX_ROWS) -> Dict[str, io.BytesIO]:
+        """
+        Same as export_report, but write each file into memory instead of to disk.
+        
+        Args:
+            name_prefix: File name without extension, e.g. "result"
+            (other arguments as for export_report)
+        
+        Returns:
+            Buffers keyed by file name, rewound to the start
+        """
+        buffers: Dict[str, io.BytesIO] = {}
+        
+        def open_buffer(name: str) -> io.BytesIO:
+            buffers[name] = io.BytesIO()
+            buffers[name].name = name   # used for log lines and zip entry names
+            return buffers[name]
+        
+        self._export_report(name_prefix, open_buffer, df1_hours_col, df2_hours_col,
+                            artifacts, formats, split_workbooks, max_sheet_rows)
+        for buffer in buffers.values():
+            buffer.seek(0)
+        return buffers
+    
+    def _export_report(self, output_prefix: str, open_output: Callable[[str], Any],
+                       df1_hours_col: str, df2_hours_col: str, artifacts: Sequence[str],
+                       formats: Sequence[str], split_workbooks: bool, max_sheet_rows: int) -> List[str]:
+        """Write the report files, each to open_output(<file name>) (a path or a binary stream)."""
+        artifacts = self._check_choices(artifacts, REPORT_ARTIFACTS, "artifact")
+        formats = self._check_choices(formats, REPORT_FORMATS, "format")
+        self._prepare_artifacts(artifacts, df1_hours_col, df2_hours_col)
+        
+        paths = []
+        for fmt in formats:
+            if fmt == "xlsx":
+                if split_workbooks and self._needs_split(artifacts, max_sheet_rows):
+                    paths.append(f"{output_prefix}.zip")
+                    self.export_to_xlsx_zip(open_output(paths[-1]), df1_hours_col, df2_hours_col,
+                                            artifacts, max_sheet_rows)
+                else:
+                    paths.append(f"{output_prefix}.xlsx")
+                    self.export_to_xlsx(open_output(paths[-1]), df1_hours_col, df2_hours_col,
+                                        artifacts, max_sheet_rows)
+                continue
+            for artifact in artifacts:
+                frame = self._artifact_frame(artifact)
+                if frame is None:
+                    continue
+                paths.append(f"{output_prefix}_{artifact}.{fmt}")
+                with stage_timer(f"{fmt}_write", rows_in=len(frame)):
+                    self._write_frame(frame, open_output(paths[-1]), fmt)
+                print(f"✓ {fmt.upper()} file created: {paths[-1]} ({len(frame)} records)")
+        return paths
+    
     def export_to_xlsx(self, output_file: str,
                       df1_hours_col: str = None,
-                      df2_hours_col: str = None) -> None:
+                      df2_hours_col: str = None,
+                      artifacts: Sequence[str] = REPORT_ARTIFACTS,
+                      max_sheet_rows: int = EXCEL_MAX_ROWS) -> None:
         """
-        Export all three DataFrames to XLSX with merged headers.
+        Export the requested DataFrames to XLSX with merged headers.
+        
+        Frames longer than a sheet allows continue on numbered sheets, e.g.
+        "Calculation (2)". A split Comparison gets a "Comparison Index" sheet
+        listing the uid range of each part.
         
         Args:
-            output_file: Output XLSX file path
+            output_file: Output XLSX file path, or a writable binary stream
             df1_hours_col: Hours column from df1
             df2_hours_col: Hours column from df2
+            artifacts: Sheets to write, any of REPORT_ARTIFACTS (default: all)
+            max_sheet_rows: Rows per sheet, including the three header rows
         """
-        if self.merged_df is None:
-            self.merge_dataframes()
+        artifacts = self._check_choices(artifacts, REPORT_ARTIFACTS, "artifact")
+        self._prepare_artifacts(artifacts, df1_hours_col, df2_hours_col)
         
-        if self.variance_df is None and df1_hours_col and df2_hours_col:
-            self.calculate_variance(df1_hours_col, df2_hours_col)
-            self.get_variance_summary()
-        
-        # Create Excel file with multiple sheets
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            # Sheet 1: Original df1
-            self.df1.to_excel(writer, sheet_name=self.df1_name, 
-                            startrow=2, index=False)
-            
-            # Sheet 2: Original df2
-            self.df2.to_excel(writer, sheet_name=self.df2_name, 
-                            startrow=2, index=False)
-            
-            # Sheet 3: Merged data
-            self.merged_df.to_excel(writer, sheet_name='Calculation', 
-                                   startrow=2, index=False)
-            
-            # Sheet 4: Variance summary
-            if self.variance_df is not None:
-                self.variance_df.to_excel(writer, sheet_name='Comparison', 
-                                         startrow=2, index=False)
-
-        # Format all sheets
-        wb = openpyxl.load_workbook(output_file)
-        
-        self._format_sheet(wb[self.df1_name], self.df1_name, len(self.df1.columns))
-        wb[self.df1_name].sheet_properties.tabColor = 'F2AA84' # Dark Brown
-        self._format_sheet(wb[self.df2_name], self.df2_name, len(self.df2.columns))
-        wb[self.df2_name].sheet_properties.tabColor = '538DD5' # Dark Blue
-        self._format_sheet(wb['Calculation'], 'Calculated Data', len(self.merged_df.columns))
-        wb['Calculation'].sheet_properties.tabColor = 'CCC0DA' # Dark Blue
-        
-        
-        if self.variance_df is not None:
-            self._format_sheet(wb['Comparison'], 'Variance Analysis', 
-                             len(self.variance_df.columns))
-        # format Comparison sheet
-        comp_worksheet = wb['Comparison']
-        fill = PatternFill(start_color="538DD5", end_color="538DD5", 
-                              fill_type="solid")
-        cell = comp_worksheet.cell(row=2, column=5)
-        cell.fill = fill
-        # delete variance_hours column
-        variance_col_idx = 6
-        comp_worksheet.delete_cols(variance_col_idx)
-        purple_fill = PatternFill(start_color="CCC0DA", end_color="CCC0DA", 
-                              fill_type="solid")
-        for col in range(6, 10):
-            cell = comp_worksheet.cell(row=2, column=col)
-            cell.fill = purple_fill
-        comp_worksheet.merge_cells('A1:I1')
-        comp_worksheet.delete_cols(10)
-        
-        # renaming columns
-        comp_worksheet.cell(row=3, column=1).value = "UID"
-        comp_worksheet.cell(row=3, column=2).value = "Services Performed"
-        comp_worksheet.cell(row=3, column=3).value = "Service Date"
-        comp_worksheet.cell(row=3, column=4).value = "Invoice Hours"
-        comp_worksheet.cell(row=3, column=5).value = "System Hours"
-        comp_worksheet.cell(row=3, column=6).value = "Variance (Hours)"
-        comp_worksheet.cell(row=3, column=7).value = "Variance (Percentage)"
-        comp_worksheet.cell(row=3, column=8).value = "Mismatch Hours"
-        comp_worksheet.cell(row=3, column=9).value = "Policy Conflict"
-        comp_worksheet.column_dimensions['B'].width = 50
-        # Activate dashboard sheet
-        wb.active = wb.sheetnames.index("Comparison")
-        wb.save(output_file)
+        # Each sheet is written once, row by row, with its formatting applied as it goes
+        specs = self._sheet_specs(artifacts)
+        with stage_timer("xlsx_write", rows_in=sum(len(spec[3]) for spec in specs)):
+            wb = self._report_workbook()
+            for artifact, sheet_name, header_name, df, options in specs:
+                parts = self._row_parts(len(df), max_sheet_rows)
+                names = [self._part_sheet_name(sheet_name, part) for part in range(len(parts))]
+                if artifact == 'comparison' and len(parts) > 1:
+                    self._write_index_sheet(wb, df, parts, sheets=names)
+                for part, (start, stop) in enumerate(parts):
+                    self._write_sheet(wb, names[part], self._part_title(header_name, part, len(parts)),
+                                      df, start=start, stop=stop, **options)
+        
+        if not wb.sheetnames:
+            raise ValueError("No sheets to write: the requested artifacts have not been computed")
+        self._activate_dashboard(wb)
+        with stage_timer("xlsx_save"):
+            wb.save(output_file)
        
-        print(f"✓ XLSX file created: {output_file}")
-        print(f"  - Sheet1 : {self.df1_name} ({len(self.df1)} records)")
-        print(f"  - Sheet2 : {self.df2_name} ({len(self.df2)} records)")
-        print(f"  - Merged : Combined data ({len(self.merged_df)} records)")
-        if self.variance_df is not None:
-            print(f"  - Comparison : Summary ({len(self.variance_df)} records)")
+        print(f"✓ XLSX file created: {self._output_name(output_file)}")
+        self._print_sheet_summary(artifacts)
     
-    def _format_sheet(self, worksheet, header_name: str, num_cols: int) -> None:
-        """Format worksheet with merged headers and styling."""
-        # Merge cells for main header
-        if header_name == 'Variance Analysis':
-            worksheet.merge_cells(f'A1:I1')
-        else:
-            worksheet.merge_cells(f'A1:{get_column_letter(num_cols)}1')
-        header_cell = worksheet['A1']
-        header_cell.value = header_name
-        
-        # Header styling
-        header_fill = PatternFill(start_color="D45A16", end_color="D45A16", 
-                                 fill_type="solid")
-        header_font = Font(color="FFFFFF", bold=True, size=12)
-        center_align = Alignment(horizontal="center", vertical="center")
-        
-        header_cell.fill = header_fill
-        header_cell.font = header_font
-        header_cell.alignment = center_align
-        worksheet.row_dimensions[1].height = 25
+    def export_to_xlsx_zip(self, output_file: str,
+                           df1_hours_col: str = None,
+                           df2_hours_col: str = None,
+                           artifacts: Sequence[str] = REPORT_ARTIFACTS,
+                           max_sheet_rows: int = EXCEL_MAX_ROWS) -> List[str]:
+        """
+        Export the requested DataFrames as several workbooks in one zip file.
         
-        # Column header styling (row 2)
-        sub_fill = PatternFill(start_color="F2AA84", end_color="F2AA84", 
-                              fill_type="solid")
-        sub_font = Font(bold=True, size=11)
-        
-        for col in range(1, num_cols + 1):
-            cell = worksheet.cell(row=2, column=col)
-            cell.fill = sub_fill
-            cell.font = sub_font
-            cell.alignment = center_align
-        
-        # Auto-adjust column widths
-        for col in range(1, num_cols + 1):
-            worksheet.column_dimensions[get_column_letter(col)].width = 20
-        
-        # Add borders
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        
-        for row in worksheet.iter_rows(min_row=2, max_row=worksheet.max_row,
-                                       min_col=1, max_col=num_cols):
-            for cell in row:
-                cell.border = thin_border
-
-# TASK-1:: Extract data from DOCX agreement file
-def extract_agreement_data(docx_filepath: str) -> Dict[str, Any]:
-    """
-    Extract structured data from a DOCX agreement file and return as JSON.
-    
-        UID: 88888888
-        system hours: 7
-        services performed: electrical, engineering, plumbing
-
-    Args:
-        docx_filepath: Path to the DOCX file
+        Workbook N holds part N of every artifact that is long enough, so each
+        sheet keeps its usual name. Workbooks are streamed straight into zip64
+        entries, one at a time. When the Comparison is split, the first workbook
+        gets a "Comparison Index" sheet listing the workbook and uid range of
+        each part.
         
-    Returns:
-        Dictionary with extracted data in the required format
-    """
-     # Check file exists
-    if not os.path.exists(docx_filepath) or not os.path.isfile(docx_filepath):
-        raise FileNotFoundError(f"DOCX file not found: {docx_filepath}")
+        Args:
+            output_file: Output zip file path, or a writable, seekable binary stream
+            df1_hours_col: Hours column from df1
+            df2_hours_col: Hours column from df2
+            artifacts: Sheets to write, any of REPORT_ARTIFACTS (default: all)
+            max_sheet_rows: Rows per sheet, including the three header rows
+        
+        Returns:
+            Names of the workbooks inside the zip file
+        """
+        artifacts = self._check_choices(artifacts, REPORT_ARTIFACTS, "artifact")
+        self._prepare_artifacts(artifacts, df1_hours_col, df2_hours_col)
+        
+        specs = self._sheet_specs(artifacts)
+        if not specs:
+            raise ValueError("No sheets to write: the requested artifacts have not been computed")
+        spec_parts = [self._row_parts(len(spec[3]), max_sheet_rows) for spec in specs]
+        stem = os.path.splitext(os.path.basename(self._output_name(output_file)))[0]
+        workbook_names = [f"{stem}_part{number}.xlsx"
+                          for number in range(1, max(len(parts) for parts in spec_parts) + 1)]
+        
+        # workbooks are written and saved one at a time, so both stages are timed together here
+        with stage_timer("xlsx_write", rows_in=sum(len(spec[3]) for spec in specs)), \
+                zipfile.ZipFile(output_file, 'w', allowZip64=True) as archive:
+            for number, workbook_name in enumerate(workbook_names):
+                wb = self._report_workbook()
+                for (artifact, sheet_name, header_name, df, options), parts in zip(specs, spec_parts):
+                    if artifact == 'comparison' and number == 0 and len(parts) > 1:
+                        self._write_index_sheet(wb, df, parts, sheets=[sheet_name] * len(parts),
+                                                workbooks=workbook_names[:len(parts)])
+                    if number < len(parts):
+                        start, stop = parts[number]
+                        self._write_sheet(wb, sheet_name, self._part_title(header_name, number, len(parts)),
+                                          df, start=start, stop=stop, **options)
+                self._activate_dashboard(wb)
+                # xlsx files are already deflated, so entries are stored as they are written
+                entry = zipfile.ZipInfo(workbook_name, time.localtime()[:6])
+                with archive.open(entry, 'w', force_zip64=True) as stream:
+                    wb.save(stream)
+        
+        print(f"✓ XLSX zip created: {self._output_name(output_file)} ({len(workbook_names)} workbooks)")
+        self._print_sheet_summary(artifacts)
+        return workbook_names
     
+    def _print_sheet_summary(self, artifacts: Sequence[str]) -> None:
+        if 'df1' in artifacts:
+            print(f"  - Sheet1 : {self.df1_name} ({len(self.df1)} records)")
+        if 'df2' in artifacts:
+            print(f"  - Sheet2 : {self.df2_name} ({len(self.df2)} records)")
+        if 'calculation' in artifacts:
+            print(f"  - Merged : Combined data ({len(self.merged_df)} records)")
+        if 'comparison' in artifacts and self.variance_df is not None:
+            print(f"  - Comparison : Summary ({len(self.variance_df)} records)")
     
-    # Read the DOCX file
-    doc = Document(docx_filepath)
+    def _prepare_artifacts(self, artifacts: Sequence[str],
+                           df1_hours_col: Optional[str], df2_hours_col: Optional[str]) -> None:
+        """Compute only the frames the requested artifacts need."""
+        if 'calculation' not in artifacts and 'comparison' not in artifacts:
+            return
+        if self.merged_df is None:
+            self.merge_dataframes()
+        if self.variance_df is None and df1_hours_col and df2_hours_col:
+            if 'variance_pct' not in self.merged_df.columns:
+                self.calculate_variance(df1_hours_col, df2_hours_col)
+            if 'comparison' in artifacts:
+                self.get_variance_summary()
     
-    # Extract all text from the document
-    full_text = "\n".join([para.text for para in doc.paragraphs])
+    def _artifact_frame(self, artifact: str) -> Optional[pd.DataFrame]:
+        return {
+            'df1': self.df1,
+            'df2': self.df2,
+            'calculation': self.merged_df,
+            'comparison': self.variance_df,
+        }[artifact]
     
-    # Split records by UID pattern
-    records = []
-    uid_pattern = r"UID:\s*(\d+)"
-    hours_pattern = r"system\s+hours:\s*(\d+)"
-    services_pattern = r"services\s+performed:\s*(.*\n)"
+    def _sheet_specs(self, artifacts: Sequence[str]) -> List[Tuple[str, str, str, pd.DataFrame, Dict[str, Any]]]:
+        """(artifact, sheet name, title, frame, _write_sheet options) of each sheet to write."""
+        specs = []
+        if 'df1' in artifacts:
+            specs.append(('df1', self.df1_name, self.df1_name, self.df1,
+                          {'tab_color': 'F2AA84'})) # Dark Brown
+        if 'df2' in artifacts:
+            specs.append(('df2', self.df2_name, self.df2_name, self.df2,
+                          {'tab_color': '538DD5'})) # Dark Blue
+        if 'calculation' in artifacts:
+            specs.append(('calculation', 'Calculation', 'Calculated Data', self.merged_df,
+                          {'tab_color': 'CCC0DA'})) # Dark Blue
+        if 'comparison' in artifacts and self.variance_df is not None:
+            # Comparison sheet: variance_hours is left out and the columns get display names
+            columns = [col for idx, col in enumerate(self.variance_df.columns)
+                       if idx != COMPARISON_DROPPED_COLUMN]
+            headers = COMPARISON_HEADERS + [str(col) for col in columns[len(COMPARISON_HEADERS):]]
+            widths = {get_column_letter(col): COLUMN_WIDTH
+                      for col in range(1, len(self.variance_df.columns) + 1)}
+            widths['B'] = 50
+            specs.append(('comparison', 'Comparison', 'Variance Analysis', self.variance_df,
+                          {'columns': columns, 'headers': headers,
+                           'band_fills': COMPARISON_BAND_FILLS, 'widths': widths}))
+        return specs
     
-    # Find all UID positions
-    uid_matches = list(re.finditer(uid_pattern, full_text, re.IGNORECASE))
+    def _needs_split(self, artifacts: Sequence[str], max_sheet_rows: int) -> bool:
+        return any(len(self._row_parts(len(spec[3]), max_sheet_rows)) > 1
+                   for spec in self._sheet_specs(artifacts))
     
-    for i, uid_match in enumerate(uid_matches):
-        # Get the text section for this record
-        start_pos = uid_match.start()
-        end_pos = uid_matches[i + 1].start() if i + 1 < len(uid_matches) else len(full_text)
-        record_text = full_text[start_pos:end_pos]
-        
-        # Extract fields for this record
-        uid_match_obj = re.search(uid_pattern, record_text, re.IGNORECASE)
-        hours_match_obj = re.search(hours_pattern, record_text, re.IGNORECASE)
-        services_match_obj = re.search(services_pattern, record_text, re.IGNORECASE)
-        
-        if uid_match_obj:
-            record = {
-                "uid": int(uid_match_obj.group(1)),
-                "systemHours": int(hours_match_obj.group(1)) if hours_match_obj else None,
-                "servicesPerformed": services_match_obj.group(1) if services_match_obj else None
-            }
-            if record["systemHours"] is not None and record["servicesPerformed"] is not None:
-                record["servicesPerformed"] = record["servicesPerformed"].strip() # clean up whitespace
-                records.append(record)
+    @staticmethod
+    def _row_parts(num_rows: int, max_sheet_rows: int) -> List[Tuple[int, int]]:
+        """(start, stop) data row ranges that fit one sheet each, at least one."""
+        rows_per_sheet = max_sheet_rows - REPORT_HEADER_ROWS
+        if rows_per_sheet < 1:
+            raise ValueError(f"max_sheet_rows must be larger than {REPORT_HEADER_ROWS}")
+        return [(start, min(start + rows_per_sheet, num_rows))
+                for start in range(0, num_rows, rows_per_sheet)] or [(0, 0)]
     
-    # Create the final JSON structure
-    result = {
-        "documentName": "agreement.docx",
-        "totalRecord": len(records),
-        "records": records
-    }
+    @staticmethod
+    def _part_sheet_name(sheet_name: str, part: int) -> str:
+        """Sheet name of a continuation part, kept within Excel's 31 characters."""
+        if part == 0:
+            return sheet_name
+        suffix = f" ({part + 1})"
+        return sheet_name[:EXCEL_MAX_SHEET_NAME - len(suffix)] + suffix
     
-    return result
-
-# TASK-1.1::  Assume PatternExtractor is defined elsewhere and imported to process documents
-def parse_document_text(text):
-    """
-    Contains the custom business logic to parse the document text
-    and extract structured data using regular expressions.
-    """
+    @staticmethod
+    def _part_title(header_name: str, part: int, num_parts: int) -> str:
+        return header_name if num_parts == 1 else f"{header_name} (part {part + 1} of {num_parts})"
     
-    # This regex looks for the three-line pattern,
-    # capturing the data for each field.
-    # It accounts for potential whitespace and newlines between blocks.
-    pattern = re.compile(
-        r"UID:\s*(\d+)\s*\n+"
-        r"system hours:\s*(\d+)\s*\n+"
-        r"services performed:\s*([\w\s]+)",
-        re.IGNORECASE | re.MULTILINE
-    )
+    def _write_index_sheet(self, workbook, df: pd.DataFrame, parts: List[Tuple[int, int]],
+                           sheets: List[str], workbooks: Optional[List[str]] = None) -> None:
+        """Write the Comparison Index sheet: where each uid range of a split frame lives."""
+        uids = df[self.key_columns[0]]
+        index = pd.DataFrame({
+            'Sheet': sheets,
+            'First Row': [start + 1 for start, _ in parts],
+            'Last Row': [stop for _, stop in parts],
+            'First UID': [uids.iloc[start] for start, _ in parts],
+            'Last UID': [uids.iloc[stop - 1] for _, stop in parts],
+        })
+        if workbooks is not None:
+            index.insert(0, 'Workbook', workbooks)
+        self._write_sheet(workbook, COMPARISON_INDEX_SHEET, 'Comparison Index', index)
     
-    records=[] # List to hold all extracted records
+    @staticmethod
+    def _activate_dashboard(workbook) -> None:
+        # Activate dashboard sheet (the index of a split Comparison comes first)
+        for name in (COMPARISON_INDEX_SHEET, 'Comparison'):
+            if name in workbook.sheetnames:
+                workbook.active = workbook.sheetnames.index(name)
+                return
     
-    for match in pattern.finditer(text):
-        try:
-            record = {
-                "uid": int(match.group(1)),
-                "systemHours": int(match.group(2)),
-                "servicesPerformed": match.group(3).strip()
-            }
-            records.append(record)
-        except (ValueError, TypeError):
-            # Log and skip malformed records
-            print(f"Skipping malformed record: {match.groups()}")
-            
-    # Construct the final JSON object in the user-specified format
-    output_json = {
-        "documentName": "attendance",
-        "totalRecord": len(records),
-        "records": records
-    }
+    @staticmethod
+    def _check_choices(values: Sequence[str], choices: Sequence[str], kind: str) -> List[str]:
+        """Validate requested artifacts/formats, keeping the canonical order."""
+        unknown = [value for value in values if value not in choices]
+        if unknown:
+            raise ValueError(f"Unknown report {kind}: {', '.join(unknown)} "
+                             f"(choose from {', '.join(choices)})")
+        return [choice for choice in choices if choice in values]
     
-    return output_json
+    @staticmethod
+    def _output_name(output_file: Any) -> str:
+        """Path of an output, or the name of an in-memory one."""
+        if isinstance(output_file, str):
+            return output_file
+        return getattr(output_file, "name", None) or "report"
+    
+    @staticmethod
+    def _write_frame(frame: pd.DataFrame, path: Any, fmt: str) -> None:
+        """Write one artifact frame as csv, parquet or json (without the row index) to a path or binary stream."""
+        if fmt == 'csv':
+            frame.to_csv(path, index=False)
+        elif fmt == 'parquet':
+            frame.to_parquet(path, index=False)
+        elif fmt == 'json':
+            frame.to_json(path, orient='records', date_format='iso')
+    
+    def _report_workbook(self):
+        """Empty write-only workbook with the report's named styles."""
+        wb = openpyxl.Workbook(write_only=True)
+        for style in self._report_styles():
+            wb.add_named_style(style)
+        return wb
+    
+    def _write_sheet(self, workbook, sheet_name: str, header_name: str, df: pd.DataFrame,
+                     tab_color: Optional[str] = None, columns: Optional[list] = None,
+                     headers: Optional[List[str]] = None,
+                     band_fills: Optional[List[PatternFill]] = None,
+                     widths: Optional[Dict[str, float]] = None,
+                     start: int = 0, stop: Optional[int] = None) -> None:
+        """
+        Write one formatted sheet to a write-only workbook in a single pass.
+        
+        Row 1 holds the merged title, row 2 a coloured band, row 3 the column
+        headers and the data starts at row 4. Header rows use the named styles
+        from _report_styles; data cells carry only values (and a number format
+        on date columns) and get their grid from one conditional format over the
+        whole data range, so styling cost does not grow with the number of rows.
+        Rows are converted EXPORT_BLOCK_ROWS at a time to bound memory.
+        
+        Args:
+            workbook: Workbook created with write_only=True
+            sheet_name: Name of the sheet (tab)
+            header_name: Title written into the merged first row
+            df: Data to write
+            tab_color: Tab colour as RGB hex
+            columns: Columns of df to write (default: all)
+            headers: Header text for each written column (default: column names)
+            band_fills: Row 2 fill for each written column (default: BAND_FILL)
+            widths: Column widths by letter (default: COLUMN_WIDTH for each written column)
+            start: First row of df to write
+            stop: Row of df to stop before (default: all rows)
+        """
+        columns = list(df.columns) if columns is None else columns
+        headers = [str(col) for col in columns] if headers is None else headers
+        stop = len(df) if stop is None else stop
+        num_cols = len(columns)
+        if band_fills is None:
+            band_fills = [BAND_FILL] * num_cols
+        if widths is None:
+            widths = {get_column_letter(col): COLUMN_WIDTH for col in range(1, num_cols + 1)}
+        
+        # Sheet properties and dimensions go out before the first row
+        worksheet = workbook.create_sheet(title=sheet_name)
+        if tab_color:
+            worksheet.sheet_properties.tabColor = tab_color
+        for letter, width in widths.items():
+            worksheet.column_dimensions[letter].width = width
+        worksheet.row_dimensions[1].height = 25
+        worksheet.merged_cells.add(f'A1:{get_column_letter(num_cols)}1')
+        
+        # Merged title, coloured band and column headers
+        worksheet.append([self._styled_cell(worksheet, header_name, style=TITLE_STYLE)])
+        worksheet.append([self._styled_cell(worksheet, None, style=BAND_STYLE,
+                                            fill=None if fill is BAND_FILL else fill)
+                          for fill in band_fills[:num_cols]])
+        worksheet.append([self._styled_cell(worksheet, header, style=COLUMN_HEADER_STYLE)
+                          for header in headers])
+        
+        # Grid borders of the data rows as a single range-level rule
+        if stop > start and num_cols:
+            worksheet.conditional_formatting.add(
+                f'A{REPORT_HEADER_ROWS + 1}:{get_column_letter(num_cols)}{stop - start + REPORT_HEADER_ROWS}',
+                FormulaRule(formula=['TRUE'], border=THIN_BORDER))
+        
+        # one formatted cell per date column, reused for every data row:
+        # append() writes the row out before returning
+        date_cells = []
+        for idx, col in enumerate(columns):
+            number_format = self._excel_number_format(df[col])
+            if number_format is not None:
+                date_cells.append((idx, self._styled_cell(worksheet, None,
+                                                          number_format=number_format)))
+        
+        for block_start in range(start, stop, EXPORT_BLOCK_ROWS):
+            block = df.iloc[block_start:min(block_start + EXPORT_BLOCK_ROWS, stop)]
+            values = [self._excel_values(block[col]) for col in columns]
+            if not date_cells:
+                for row in zip(*values):
+                    worksheet.append(row)
+                continue
+            for row in zip(*values):
+                row = list(row)
+                for idx, cell in date_cells:
+                    if row[idx] is not None:
+                        cell.value = row[idx]
+                        row[idx] = cell
+                worksheet.append(row)
+    
+    @staticmethod
+    def _report_styles() -> List[NamedStyle]:
+        """Named styles of the report headers (new objects, as they bind to one workbook)."""
+        return [
+            NamedStyle(name=TITLE_STYLE, font=TITLE_FONT, fill=TITLE_FILL, alignment=CENTER_ALIGN),
+            NamedStyle(name=BAND_STYLE, font=BAND_FONT, fill=BAND_FILL, alignment=CENTER_ALIGN,
+                       border=THIN_BORDER),
+            NamedStyle(name=COLUMN_HEADER_STYLE, font=COLUMN_HEADER_FONT,
+                       alignment=COLUMN_HEADER_ALIGN, border=THIN_BORDER),
+        ]
+    
+    @staticmethod
+    def _styled_cell(worksheet, value, style: Optional[str] = None,
+                     fill: Optional[PatternFill] = None,
+                     number_format: Optional[str] = None) -> WriteOnlyCell:
+        """Create a write-only cell with a named style and optional overrides."""
+        cell = WriteOnlyCell(worksheet, value)
+        if style is not None:
+            cell.style = style
+        if fill is not None:
+            cell.fill = fill
+        if number_format is not None:
+            cell.number_format = number_format
+        return cell
+    
+    @staticmethod
+    def _excel_number_format(series: pd.Series) -> Optional[str]:
+        """Number format DataFrame.to_excel gives a column's dates, None for other columns."""
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            return DATETIME_FORMAT
+        if series.dtype == object:
+            kind = pd.api.types.infer_dtype(series, skipna=True)
+            if kind == 'datetime':
+                return DATETIME_FORMAT
+            if kind == 'date':
+                return DATE_FORMAT
+        return None
+    
+    @staticmethod
+    def _excel_values(series: pd.Series) -> list:
+        """Cell values of a column, converted like DataFrame.to_excel does."""
+        # Missing values become blank cells
+        values = series.astype(object).where(series.notna(), None).tolist()
+        if pd.api.types.is_float_dtype(series.dtype) and np.isinf(series.to_numpy()).any():
+            # infinities are written as text, like to_excel's inf_rep
+            values = [('inf' if value > 0 else '-inf') if value is not None and np.isinf(value) else value
+                      for value in values]
+        return values
 
-# TASK-2:: Extract data from CSV attendance file
-def extract_attendance_data(csv_filepath: str) -> Dict[str, Any]:
-    """
-    Extract structured data from a CSV attendance file and return as JSON.
-    """
-    # Check file exists
-    if not os.path.exists(csv_filepath) or not os.path.isfile(csv_filepath):
-        raise FileNotFoundError(f"CSV file not found: {csv_filepath}")
+# TASK-1:: Extract data from DOCX agreement file
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DOCUMENT_XML_PART = "word/document.xml"
 
-    # Read the CSV file to data frame
-    df = pd.read_csv(csv_filepath)
+# One alternation for the three agreement fields, so the text is walked once.
+# Like the values, the services list may sit on the paragraph after its label,
+# but never starts with another field's label.
+RECORD_TOKEN_PATTERN = re.compile(
+    r"UID:\s*(?P<uid>\d+)"
+    r"|system\s+hours:\s*(?P<hours>\d+)"
+    r"|services\s+performed:\s*(?P<services>(?!UID:|system\s+hours:|services\s+performed:).*)",
+    re.IGNORECASE
+)
 
-    # Validate required columns
-    required_columns = ["uid", "punchInDateTime", "punchOutDateTime", "servicesPerformed"]
-    for col in required_columns:
-        if col not in df.columns:
-            raise ValueError(f"Missing required column in CSV: {col}")
 
-    # Convert DataFrame to list of records
-    records = df.to_dict(orient="records")
+# Inputs are paths, or bytes / seekable binary file objects for uploads kept in memory
+BUFFER_TYPES = (bytes, bytearray, memoryview)
 
-    # constructing document summary
-    doc_summary = {
-        "documentName": "attendance",
+
+def _is_path(source) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+
+def source_name(source, name: Optional[str] = None) -> str:
+    """
+    File name used to pick the reader for an input.
+
+    Paths name themselves; buffers and file objects use the given name, falling
+    back to the object's own ``name`` attribute when that is a string.
+    """
+    if _is_path(source):
+        return os.fspath(source)
+    if name is None:
+        name = getattr(source, "name", None)
+    return name if isinstance(name, str) else ""
+
+
+def _binary_stream(source):
+    """Path or binary file object; bytes-like buffers are wrapped in BytesIO."""
+    if isinstance(source, BUFFER_TYPES):
+        return io.BytesIO(source)
+    return source
+
+
+def _arrow_source(source):
+    """Path or file object for Arrow readers; bytes-like buffers are read without a copy."""
+    if isinstance(source, BUFFER_TYPES):
+        return pa.BufferReader(pa.py_buffer(source))
+    return source
+
+
+def _rewind(source) -> None:
+    """Seek a file object back to the start so it can be read again."""
+    if not _is_path(source) and hasattr(source, "seek"):
+        source.seek(0)
+
+
+def _iter_docx_paragraphs(docx_filepath: str) -> Iterator[str]:
+    """
+    Yield the text of each top-level body paragraph of a DOCX file.
+
+    Reads word/document.xml straight out of the zip with incremental XML
+    parsing, so only the paragraph being assembled is kept in memory. The
+    text matches python-docx's ``Document(...).paragraphs[i].text``.
+    docx_filepath may also be a seekable binary file object.
+    """
+    body_tag = f"{WORD_NAMESPACE}body"
+    paragraph_tag = f"{WORD_NAMESPACE}p"
+    run_tag = f"{WORD_NAMESPACE}r"
+    hyperlink_tag = f"{WORD_NAMESPACE}hyperlink"
+    run_text = {
+        f"{WORD_NAMESPACE}tab": "\t",
+        f"{WORD_NAMESPACE}ptab": "\t",
+        f"{WORD_NAMESPACE}br": "\n",
+        f"{WORD_NAMESPACE}cr": "\n",
+        f"{WORD_NAMESPACE}noBreakHyphen": "-",
+    }
+    text_tag = f"{WORD_NAMESPACE}t"
+    # run content lives at w:p/w:r or w:p/w:hyperlink/w:r
+    run_paths = ([paragraph_tag, run_tag], [paragraph_tag, hyperlink_tag, run_tag])
+
+    with zipfile.ZipFile(docx_filepath) as archive:
+        with archive.open(DOCUMENT_XML_PART) as document_xml:
+            body = None
+            path: List[str] = []   # tags from the body down to the current element
+            parts: List[str] = []
+            for event, elem in ElementTree.iterparse(document_xml, events=("start", "end")):
+                if event == "start":
+                    if body is not None:
+                        path.append(elem.tag)
+                    elif elem.tag == body_tag:
+                        body = elem
+                    continue
+                if elem is body:
+                    break
+                if body is None:
+                    continue
+
+                tag = path.pop()
+                if tag == text_tag and path in run_paths:
+                    parts.append(elem.text or "")
+                elif tag in run_text and path in run_paths:
+                    parts.append(run_text[tag])
+                elif not path:
+                    # a top-level block just closed; drop it so the tree never grows
+                    if tag == paragraph_tag:
+                        yield "".join(parts)
+                    parts = []
+                    body.clear()
+
+
+class AgreementRecordScanner:
+    """
+    Single-pass scanner turning agreement text into record tuples.
+
+    Text is fed in pieces (e.g. one paragraph at a time) and scanned once with
+    RECORD_TOKEN_PATTERN. A UID starts a new block; the first system hours and
+    services performed inside the block complete it. Blocks missing a field and
+    fields found outside any block are collected in ``skipped``.
+    """
+
+    def __init__(self):
+        self.skipped: List[Dict[str, Any]] = []
+        self._buffer = ""
+        self._uid: Optional[int] = None
+        self._hours: Optional[int] = None
+        self._services: Optional[str] = None
+
+    def feed(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """Scan more text and yield (uid, systemHours, servicesPerformed) for finished blocks."""
+        self._buffer += text
+        yield from self._scan(final=False)
+
+    def close(self) -> Iterator[Tuple[int, int, str]]:
+        """Scan whatever is left and yield the last block."""
+        yield from self._scan(final=True)
+        yield from self._finish_block()
+        self._buffer = ""
+
+    def _scan(self, final: bool) -> Iterator[Tuple[int, int, str]]:
+        buffer = self._buffer
+        resume = 0
+        for match in RECORD_TOKEN_PATTERN.finditer(buffer):
+            if not final and match.end() == len(buffer):
+                # the token may still grow with the next piece of text
+                resume = match.start()
+                break
+            resume = match.end()
+            field = match.lastgroup
+            if field == "uid":
+                yield from self._finish_block()
+                self._uid = int(match.group("uid"))
+            elif self._uid is None:
+                self.skipped.append({
+                    "uid": None,
+                    "reason": f"{match.group(0).split(':')[0].strip()} outside a UID block"
+                })
+            elif field == "hours":
+                if self._hours is None:
+                    self._hours = int(match.group("hours"))
+            elif self._services is None:
+                self._services = match.group("services").strip() # clean up whitespace
+        else:
+            if not final:
+                # a partial token can only start on the last non-blank line
+                last_line = buffer.rfind("\n", 0, len(buffer.rstrip())) + 1
+                resume = max(resume, last_line)
+        self._buffer = buffer[resume:]
+
+    def _finish_block(self) -> Iterator[Tuple[int, int, str]]:
+        if self._uid is None:
+            return
+        if self._hours is None:
+            self.skipped.append({"uid": self._uid, "reason": "missing system hours"})
+        elif not self._services:
+            self.skipped.append({"uid": self._uid, "reason": "missing services performed"})
+        else:
+            yield self._uid, self._hours, self._services
+        self._uid = self._hours = self._services = None
+
+
+def iter_agreement_records(docx_filepath: str,
+                           scanner: Optional[AgreementRecordScanner] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream agreement records out of a DOCX agreement file.
+
+    Each paragraph is fed to an AgreementRecordScanner as soon as it has been
+    read, and every completed UID block is yielded straight away.
+
+    Args:
+        docx_filepath: Path to the DOCX file, or a seekable binary file object
+        scanner: Optional scanner to use, e.g. to inspect ``scanner.skipped`` afterwards
+
+    Yields:
+        Dictionaries with uid, systemHours and servicesPerformed
+    """
+    if scanner is None:
+        scanner = AgreementRecordScanner()
+
+    for paragraph in _iter_docx_paragraphs(docx_filepath):
+        for uid, hours, services in scanner.feed(paragraph + "\n"):
+            yield {"uid": uid, "systemHours": hours, "servicesPerformed": services}
+    for uid, hours, services in scanner.close():
+        yield {"uid": uid, "systemHours": hours, "servicesPerformed": services}
+
+
+# Parquet and Arrow IPC (Feather) inputs are read column-wise, memory-mapped where possible
+COLUMNAR_EXTENSIONS = (".parquet", ".feather", ".arrow")
+AGREEMENT_RECORD_COLUMNS = ["uid", "systemHours", "servicesPerformed"]
+
+
+def is_columnar_file(filepath: str) -> bool:
+    """True for Parquet and Feather/Arrow files."""
+    return os.path.splitext(filepath)[1].lower() in COLUMNAR_EXTENSIONS
+
+
+def _is_parquet(filepath: str) -> bool:
+    return filepath.lower().endswith(".parquet")
+
+
+def _validate_columns(columns: List[str], required: List[str], source: str) -> None:
+    """Raise ValueError naming the first required column that is missing."""
+    for col in required:
+        if col not in columns:
+            raise ValueError(f"Missing required column in {source}: {col}")
+
+
+def _open_ipc_file(filepath):
+    """Memory-map an Arrow IPC path; in-memory inputs are read as they are (and left open)."""
+    if _is_path(filepath):
+        return pa.memory_map(filepath)
+    return contextlib.nullcontext(_arrow_source(filepath))
+
+
+def read_columnar_schema(filepath: str, name: Optional[str] = None) -> pa.Schema:
+    """Read only the schema of a Parquet or Feather/Arrow file (path, bytes or file object)."""
+    if _is_parquet(source_name(filepath, name)):
+        return pq.read_schema(_arrow_source(filepath), memory_map=True)
+    with _open_ipc_file(filepath) as source:
+        return pa.ipc.open_file(source).schema
+
+
+def read_columnar_table(filepath: str, columns: List[str], source: str,
+                        name: Optional[str] = None) -> pa.Table:
+    """
+    Read the given columns of a Parquet or Feather/Arrow file.
+
+    Args:
+        filepath: Path to the file, or its bytes / a seekable binary file object
+        columns: Columns to read; all of them are required
+        source: File description used in the missing column error
+        name: File name of an in-memory input, used to tell Parquet from Feather
+
+    Returns:
+        Arrow table with only the requested columns
+    """
+    _validate_columns(read_columnar_schema(filepath, name).names, columns, source)
+    if _is_parquet(source_name(filepath, name)):
+        return pq.read_table(_arrow_source(filepath), columns=columns, memory_map=True)
+    return pa_feather.read_table(_arrow_source(filepath), columns=columns, memory_map=True)
+
+
+def iter_columnar_batches(filepath: str, columns: List[str], source: str,
+                          batch_size: int, name: Optional[str] = None) -> Iterator[pa.RecordBatch]:
+    """
+    Yield record batches of the given columns of a Parquet or Feather/Arrow file.
+
+    Parquet files are read in batches of batch_size rows; Arrow IPC files are
+    memory-mapped and yield the batches they were written with. In-memory
+    inputs are accepted as for read_columnar_table.
+    """
+    _validate_columns(read_columnar_schema(filepath, name).names, columns, source)
+    if _is_parquet(source_name(filepath, name)):
+        yield from pq.ParquetFile(_arrow_source(filepath), memory_map=True).iter_batches(
+            batch_size=batch_size, columns=columns)
+        return
+    with _open_ipc_file(filepath) as source_file:
+        reader = pa.ipc.open_file(source_file)
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i).select(columns)
+
+
+def _extract_columnar_agreement_records(filepath: str, name: Optional[str] = None
+                                        ) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+    """Read pre-extracted agreement records, skipping rows without uid or system hours."""
+    table = read_columnar_table(filepath, AGREEMENT_RECORD_COLUMNS, "agreement file", name)
+    records = pd.DataFrame({
+        "uid": table["uid"].cast(pa.int64()).to_pandas(),
+        "systemHours": table["systemHours"].cast(pa.int64()).to_pandas(),
+        "servicesPerformed": table["servicesPerformed"].cast(pa.string()).to_pandas(),
+    })
+    missing_hours = records["systemHours"].isna()
+    skipped = [{"uid": None if pd.isna(uid) else int(uid), "reason": "missing system hours"}
+               for uid in records.loc[missing_hours, "uid"]]
+    skipped += [{"uid": None, "reason": "missing uid"}] * int(records["uid"].isna().sum())
+    records = records[records["uid"].notna() & ~missing_hours].reset_index(drop=True)
+    return records.astype({"uid": "int64", "systemHours": "int64"}), skipped
+
+
+@timed_stage("docx_extract", rows_out=lambda result: result["totalRecord"])
+def extract_agreement_data(docx_filepath: str, name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Extract structured data from a DOCX agreement file and return as JSON.
+    
+        UID: 88888888
+        system hours: 7
+        services performed: electrical, engineering, plumbing
+
+    Agreements that were already extracted can be passed as a Parquet or
+    Feather/Arrow file with uid, systemHours and servicesPerformed columns;
+    their records are then returned as a DataFrame instead of a list of dicts
+    (group_agreement_records accepts both).
+
+    Args:
+        docx_filepath: Path to the DOCX file (or Parquet/Feather/Arrow records file),
+            or its bytes / a seekable binary file object, so uploads can be read
+            without saving them first
+        name: File name of an in-memory input (defaults to the object's ``name``);
+            a .parquet/.feather/.arrow name selects the records reader
+        
+    Returns:
+        Dictionary with extracted data in the required format
+    """
+     # Check file exists
+    if _is_path(docx_filepath) and (not os.path.exists(docx_filepath) or not os.path.isfile(docx_filepath)):
+        raise FileNotFoundError(f"DOCX file not found: {docx_filepath}")
+    
+    filename = source_name(docx_filepath, name)
+    if is_columnar_file(filename):
+        records, skipped = _extract_columnar_agreement_records(docx_filepath, filename)
+    else:
+        # Stream records out of word/document.xml without building a Document tree
+        scanner = AgreementRecordScanner()
+        records = list(iter_agreement_records(_binary_stream(docx_filepath), scanner))
+        skipped = scanner.skipped
+    if skipped:
+        print(f"Skipped {len(skipped)} malformed agreement blocks")
+    
+    # Create the final JSON structure
+    result = {
+        "documentName": os.path.basename(filename) if is_columnar_file(filename) else "agreement.docx",
+        "totalRecord": len(records),
+        "records": records,
+        "skippedRecords": skipped
+    }
+    
+    return result
+
+# TASK-1.1::  Assume PatternExtractor is defined elsewhere and imported to process documents
+def parse_document_text(text):
+    """
+    Contains the custom business logic to parse the document text
+    and extract structured data using regular expressions.
+    """
+    
+    # AgreementRecordScanner walks the text once with the combined
+    # uid / system hours / services performed pattern.
+    scanner = AgreementRecordScanner()
+    
+    records=[] # List to hold all extracted records
+    
+    for uid, hours, services in [*scanner.feed(text), *scanner.close()]:
+        record = {
+            "uid": uid,
+            "systemHours": hours,
+            "servicesPerformed": services
+        }
+        records.append(record)
+    for skipped in scanner.skipped:
+        # Log and skip malformed records
+        print(f"Skipping malformed record: {skipped}")
+            
+    # Construct the final JSON object in the user-specified format
+    output_json = {
+        "documentName": "attendance",
         "totalRecord": len(records),
         "records": records
     }
+    
+    return output_json
+
+# Services performed are held as bits of a categorical vocabulary
+SERVICE_SEPARATOR = ", "
+MAX_SERVICES = 64  # one bit per service in a uint64 mask; larger vocabularies use Python ints
+AGREEMENT_INDEX_NAMES = ["uidKey", "servicesKey"]
+
+
+class ServiceVocabulary:
+    """
+    Categorical vocabulary of individual services, one bit per service.
+
+    A set of services (e.g. all punches of one uid-day) is a uint64 bitmask, so
+    aggregating and joining service sets are integer operations. Human-readable
+    strings are only rebuilt once per distinct mask, in alphabetical order.
+
+    servicesPerformed is free text, so a file may hold more than MAX_SERVICES
+    distinct services (spelling and casing variants alone get there). Masks are
+    then arbitrary-precision Python ints in object arrays: slower, but the same
+    sets and the same results.
+    """
+
+    def __init__(self):
+        self.services: List[str] = []
+        self._bits: Dict[str, int] = {}
+        self._masks: Dict[str, int] = {}
+
+    def mask_of(self, value: Optional[str]) -> int:
+        """Bitmask of a comma separated services string, adding unseen services."""
+        mask = self._masks.get(value)
+        if mask is None:
+            mask = 0
+            for service in (value or "").split(","):
+                service = service.strip()
+                if not service:
+                    continue
+                if service not in self._bits:
+                    self._bits[service] = 1 << len(self.services)
+                    self.services.append(service)
+                mask |= self._bits[service]
+            self._masks[value] = mask
+        return mask
+
+    @property
+    def wide(self) -> bool:
+        """True once the services no longer fit a uint64 mask."""
+        return len(self.services) > MAX_SERVICES
+
+    def encode(self, values) -> np.ndarray:
+        """Encode an Arrow array or pandas Series of services strings as masks (see mask_array)."""
+        if isinstance(values, pa.ChunkedArray):
+            values = values.combine_chunks()
+        elif not isinstance(values, pa.Array):
+            values = pa.array(values, type=pa.string())
+        # cast also covers large_string and dictionary columns from Parquet/Feather files
+        encoded = pc.dictionary_encode(pc.fill_null(values.cast(pa.string()), ""))
+        lookup = self.mask_array([self.mask_of(value) for value in encoded.dictionary.to_pylist()])
+        return lookup[encoded.indices.to_numpy(zero_copy_only=False)]
+
+    def mask_array(self, masks) -> np.ndarray:
+        """Masks as uint64, or as Python ints (object) once the vocabulary is wide."""
+        if self.wide:
+            masks = np.asarray(masks)
+            return masks.astype(object) if masks.dtype != object else masks
+        return np.asarray(masks, dtype=np.uint64)
+
+    def decode(self, mask: int) -> str:
+        """Canonical services string of a mask."""
+        mask = int(mask)
+        return SERVICE_SEPARATOR.join(sorted(
+            service for bit, service in enumerate(self.services) if mask >> bit & 1))
+
+    def to_categorical(self, masks: np.ndarray) -> pd.Categorical:
+        """Categorical of canonical services strings, decoding each distinct mask once."""
+        uniques, codes = np.unique(self.mask_array(masks), return_inverse=True)
+        categories = np.array([self.decode(mask) for mask in uniques], dtype=object)
+        # alphabetical categories, so sorting by codes sorts like the strings did
+        order = np.argsort(categories, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        return pd.Categorical.from_codes(rank[codes.reshape(-1)], categories[order])
+
+
+def _group_bitwise_or(group_ids: np.ndarray, masks: np.ndarray) -> np.ndarray:
+    """OR together the masks (uint64 or object) of each group; group_ids must be 0..n-1."""
+    if len(group_ids) == 0:
+        return np.zeros(0, dtype=masks.dtype)
+    order = np.argsort(group_ids, kind="stable")
+    sorted_ids = group_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    return np.bitwise_or.reduceat(masks[order], starts)
+
+def canonical_services(value: Optional[str]) -> str:
+    """Order-insensitive form of a services string: distinct services, alphabetical."""
+    services = {service.strip() for service in (value or "").split(",")}
+    return SERVICE_SEPARATOR.join(sorted(service for service in services if service))
+
+
+def services_key(values) -> np.ndarray:
+    """
+    Hash each services string to a uint64 key that ignores order and repeats.
+
+    "electrical, engineering" and "engineering, electrical" get the same key.
+    Each distinct value (or category) is canonicalised and hashed once; the
+    hash is deterministic, so keys can be stored with cached agreements.
+    """
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    canonical = np.array([canonical_services(value) for value in uniques], dtype=object)
+    keys = np.append(pd.util.hash_array(canonical), np.uint64(0))
+    return keys[codes]   # missing values (code -1) map to the trailing 0
+
+
+def agreement_lookup_keys(df: pd.DataFrame) -> List[np.ndarray]:
+    """Join keys (uid, servicesKey) of a frame with uid and servicesPerformed columns."""
+    return [df["uid"].to_numpy(), services_key(df["servicesPerformed"])]
+
+
+def build_agreement_index(agreement_grouped: pd.DataFrame) -> pd.DataFrame:
+    """
+    Index grouped agreement rows by (uid, servicesKey) for a single hash-join lookup.
+
+    Rows whose services only differ in order are folded together. A frame that
+    is already indexed is returned unchanged.
+
+    Args:
+        agreement_grouped: Result of group_agreement_records
+
+    Returns:
+        The same columns with a unique AGREEMENT_INDEX_NAMES MultiIndex
+    """
+    if list(agreement_grouped.index.names) == AGREEMENT_INDEX_NAMES:
+        return agreement_grouped
+    index = pd.MultiIndex.from_arrays(agreement_lookup_keys(agreement_grouped),
+                                      names=AGREEMENT_INDEX_NAMES)
+    agreement_index = agreement_grouped.set_axis(index)
+    if not agreement_index.index.is_unique:
+        aggregations = {col: "first" for col in agreement_index.columns}
+        aggregations["totalSystemHours"] = "sum"
+        agreement_index = agreement_index.groupby(level=AGREEMENT_INDEX_NAMES, sort=False).agg(aggregations)
+    return agreement_index
+
+
+# TASK-3:: Group agreement records for comparison
+@timed_stage("agreement_group", rows_in=lambda agreement_ref: len(agreement_ref["records"]), rows_out=len)
+def group_agreement_records(agreement_ref: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Convert agreement records to a DataFrame grouped by uid and servicesPerformed.
+
+    Args:
+        agreement_ref: Result of extract_agreement_data; records may be a list of
+            dicts or a DataFrame with the same columns
+
+    Returns:
+        DataFrame with uid, servicesPerformed, totalSystemHours and allServicesPerformed
+    """
+    agreement_ref_df = pd.DataFrame(agreement_ref['records'], columns=AGREEMENT_RECORD_COLUMNS)
+
+    # Services as bitmasks, so the grouping runs on integers and ignores service order
+    vocabulary = ServiceVocabulary()
+    agreement_ref_df["servicesMask"] = vocabulary.encode(agreement_ref_df["servicesPerformed"])
+
+    # Group agreement data by uid and servicesPerformed to get max allowed hours and remove duplicates
+    agreement_grouped = agreement_ref_df.groupby(['uid', 'servicesMask']).agg(
+        totalSystemHours = ('systemHours', 'sum') # assuming systemHours in agreement is the max allowed
+    ).reset_index()
+
+    services = vocabulary.to_categorical(agreement_grouped.pop("servicesMask").to_numpy())
+    agreement_grouped.insert(1, "servicesPerformed", services)
+    agreement_grouped["allServicesPerformed"] = services
+    agreement_grouped = agreement_grouped.sort_values(['uid', 'servicesPerformed'], ignore_index=True)
+
+    return agreement_grouped
+
+# TASK-2:: Extract data from CSV attendance file
+ATTENDANCE_REQUIRED_COLUMNS = ["uid", "punchInDateTime", "punchOutDateTime", "servicesPerformed"]
+ATTENDANCE_GROUP_KEYS = ["uid", "attendanceDate"]
+# Punch timestamps come in day-first, e.g. "1/11/2025 9:00" is 1 November 2025
+ATTENDANCE_DATETIME_FORMAT = "%d/%m/%Y %H:%M"
+# Declared CSV schema; timestamps are read as text and parsed with the explicit format
+ATTENDANCE_SCHEMA = {
+    "uid": pa.int64(),
+    "punchInDateTime": pa.string(),
+    "punchOutDateTime": pa.string(),
+    "servicesPerformed": pa.string(),
+}
+# Compressed CSV exports are decompressed as a stream straight into the parser
+COMPRESSED_CSV_SUFFIXES = {".csv.gz": "gzip", ".csv.zst": "zstd", ".csv.bz2": "bz2"}
+
+
+class DecompressedSizeExceeded(ValueError):
+    """Raised when a compressed CSV expands beyond the allowed number of bytes."""
+
+
+class _SizeLimitedStream(io.RawIOBase):
+    """Readable stream that raises DecompressedSizeExceeded after max_bytes."""
+
+    def __init__(self, stream, max_bytes: int):
+        self._stream = stream
+        self._max_bytes = max_bytes
+        self._bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read() if size is None or size < 0 else self._stream.read(size)
+        self._bytes_read += len(data)
+        if self._bytes_read > self._max_bytes:
+            raise DecompressedSizeExceeded(
+                f"Decompressed CSV is larger than {self._max_bytes} bytes")
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        self._stream.close()
+        super().close()
+
+
+def csv_compression(filepath: str) -> Optional[str]:
+    """Arrow codec of a .csv.gz/.csv.zst/.csv.bz2 file name, None for anything else."""
+    name = filepath.lower()
+    for suffix, codec in COMPRESSED_CSV_SUFFIXES.items():
+        if name.endswith(suffix):
+            return codec
+    return None
+
+
+def is_csv_file(filepath: str) -> bool:
+    """True for plain and compressed CSV file names."""
+    return filepath.lower().endswith(".csv") or csv_compression(filepath) is not None
+
+
+def open_csv_stream(source, compression: str, max_decompressed_bytes: Optional[int] = None):
+    """
+    Open a compressed CSV as a decompressing stream, without a temporary file.
+
+    Args:
+        source: Path or binary file object holding the compressed bytes
+        compression: Arrow codec name, see csv_compression
+        max_decompressed_bytes: If set, reading past this many decompressed bytes
+            raises DecompressedSizeExceeded
+
+    Returns:
+        Readable binary stream of the decompressed CSV
+    """
+    stream = pa.input_stream(source, compression=compression)
+    if max_decompressed_bytes is None:
+        return stream
+    return _SizeLimitedStream(stream, max_decompressed_bytes)
+
+
+def _validate_attendance_columns(columns: List[str]) -> None:
+    """Raise ValueError if a required attendance column is missing."""
+    _validate_columns(columns, ATTENDANCE_REQUIRED_COLUMNS, "CSV")
+
+
+def _attendance_convert_options() -> pa_csv.ConvertOptions:
+    # only the required columns are parsed, each with its declared type
+    return pa_csv.ConvertOptions(
+        include_columns=ATTENDANCE_REQUIRED_COLUMNS,
+        column_types=ATTENDANCE_SCHEMA,
+        strings_can_be_null=True
+    )
+
+
+def _attendance_csv_source(csv_filepath: str, max_decompressed_bytes: Optional[int],
+                           name: Optional[str] = None):
+    compression = csv_compression(source_name(csv_filepath, name))
+    if compression is None:
+        return _arrow_source(csv_filepath)
+    return open_csv_stream(_arrow_source(csv_filepath), compression, max_decompressed_bytes)
+
+
+def _open_attendance_csv(csv_filepath: str, open_csv, max_decompressed_bytes: Optional[int] = None,
+                         name: Optional[str] = None):
+    """Call open_csv with the typed convert options, reporting missing columns like before."""
+    try:
+        return open_csv(_attendance_csv_source(csv_filepath, max_decompressed_bytes, name),
+                        convert_options=_attendance_convert_options())
+    except KeyError:
+        # include_columns names a column the header does not have
+        _rewind(csv_filepath)
+        header = pa_csv.open_csv(_attendance_csv_source(csv_filepath, None, name)).schema.names
+        _validate_attendance_columns(header)
+        raise
 
-    # Ensure datetime columns are parsed correctly
-    df["punchInDateTime"] = pd.to_datetime(df["punchInDateTime"].str.strip())
-    df["punchOutDateTime"] = pd.to_datetime(df["punchOutDateTime"].str.strip())
+
+def _punch_timestamps(column, datetime_format: str):
+    """Punch column as Arrow timestamps; text is parsed with the explicit format."""
+    # Parquet/Feather files may already store real timestamps
+    if pa.types.is_timestamp(column.type):
+        return column
+    # Parse timestamps with the explicit format inside Arrow (no Python objects per row)
+    return pc.strptime(pc.utf8_trim_whitespace(column.cast(pa.string())),
+                       format=datetime_format, unit="s")
+
+
+def _summarise_attendance(table: pa.Table, datetime_format: str,
+                          vocabulary: ServiceVocabulary) -> pd.DataFrame:
+    """Compute hoursWorked per punch and group by uid and attendanceDate."""
+    # Rows without a uid cannot be matched to anything
+    table = table.filter(pc.is_valid(table["uid"]))
+
+    punch_in = _punch_timestamps(table["punchInDateTime"], datetime_format)
+    punch_out = _punch_timestamps(table["punchOutDateTime"], datetime_format)
+    df = pd.DataFrame({
+        "uid": table["uid"].cast(pa.int64()).to_pandas(),
+        "punchInDateTime": punch_in.to_pandas(),
+        "punchOutDateTime": punch_out.to_pandas(),
+        "servicesMask": vocabulary.encode(table["servicesPerformed"])
+    })
 
     # Calculate hours worked
     df["hoursWorked"] = (df["punchOutDateTime"] - df["punchInDateTime"]).dt.total_seconds() / 3600
 
-    # Extract attendance date
-    df["attendanceDate"] = df["punchInDateTime"].dt.date
+    # Attendance date, kept as datetime64 until after grouping
+    df["attendanceDate"] = df["punchInDateTime"].dt.normalize()
+    df = df[df["attendanceDate"].notna()]
+
+    # Group by UID and attendanceDate; services of a uid-day are OR-ed together
+    groups = df.groupby(ATTENDANCE_GROUP_KEYS, sort=True)
+    summary = groups[["hoursWorked"]].sum()
+    summary["servicesMask"] = _group_bitwise_or(groups.ngroup().to_numpy(),
+                                                df["servicesMask"].to_numpy())
+    return summary
+
+
+def _combine_attendance_summaries(summary: pd.DataFrame, partial: pd.DataFrame,
+                                  vocabulary: ServiceVocabulary) -> pd.DataFrame:
+    """Merge two partial (uid, attendanceDate) aggregates."""
+    index = summary.index.union(partial.index)
+    # an earlier chunk may still hold uint64 masks after the vocabulary became wide
+    masks = (vocabulary.mask_array(summary["servicesMask"].reindex(index, fill_value=0).to_numpy())
+             | vocabulary.mask_array(partial["servicesMask"].reindex(index, fill_value=0).to_numpy()))
+    return pd.DataFrame({
+        "hoursWorked": summary["hoursWorked"].reindex(index).add(
+            partial["hoursWorked"].reindex(index), fill_value=0),
+        "servicesMask": masks
+    }, index=index)
+
+
+def _fold_attendance_chunk(summary: Optional[pd.DataFrame], batches: List[pa.RecordBatch],
+                           schema: pa.Schema, datetime_format: str,
+                           vocabulary: ServiceVocabulary) -> pd.DataFrame:
+    """Aggregate one chunk of record batches and merge it into the running summary."""
+    partial = _summarise_attendance(pa.Table.from_batches(batches, schema=schema),
+                                    datetime_format, vocabulary)
+    return partial if summary is None else _combine_attendance_summaries(summary, partial, vocabulary)
+
+
+@timed_stage("csv_extract", rows_out=len)
+def extract_attendance_data(csv_filepath: str, chunksize: Optional[int] = None,
+                            datetime_format: str = ATTENDANCE_DATETIME_FORMAT,
+                            max_decompressed_bytes: Optional[int] = None,
+                            name: Optional[str] = None) -> pd.DataFrame:
+    """
+    Extract structured data from a CSV attendance file and return as JSON.
+
+    The CSV is read with the pyarrow CSV reader using ATTENDANCE_SCHEMA, and
+    punch timestamps are parsed with an explicit format rather than inferred.
+    Parquet and Feather/Arrow files are read column-wise (memory-mapped) with
+    the same required columns; punch columns stored as timestamps are used as is.
+    .csv.gz, .csv.zst and .csv.bz2 files are decompressed as a stream while parsing.
+    Uploads can be passed in memory (bytes or a binary file object) together
+    with their file name.
+
+    Args:
+        csv_filepath: Path to the CSV (optionally compressed), Parquet or Feather/Arrow file,
+            or its bytes / a seekable binary file object
+        chunksize: If set, read the CSV in chunks of about this many rows and merge
+            the per-chunk (uid, attendanceDate) aggregates as it goes, so peak memory
+            depends on the number of uid-days rather than the number of punches.
+            The result is the same as reading the whole file at once.
+        datetime_format: strptime format of punchInDateTime/punchOutDateTime
+        max_decompressed_bytes: If set, a compressed CSV that expands beyond this
+            many bytes raises DecompressedSizeExceeded
+        name: File name of an in-memory input (defaults to the object's ``name``);
+            its extension selects the reader and the decompression
+
+    Returns:
+        DataFrame with uid, attendanceDate, totalHoursWorked and servicesPerformed
+    """
+    # Check file exists
+    if _is_path(csv_filepath) and (not os.path.exists(csv_filepath) or not os.path.isfile(csv_filepath)):
+        raise FileNotFoundError(f"CSV file not found: {csv_filepath}")
+
+    vocabulary = ServiceVocabulary()
+    filename = source_name(csv_filepath, name)
+    columnar = is_columnar_file(filename)
+
+    if chunksize:
+        # Stream record batches and fold each chunk into the running aggregate
+        if columnar:
+            schema = read_columnar_schema(csv_filepath, filename)
+            schema = pa.schema([schema.field(col) for col in ATTENDANCE_REQUIRED_COLUMNS
+                                if col in schema.names])
+            reader = iter_columnar_batches(csv_filepath, ATTENDANCE_REQUIRED_COLUMNS,
+                                           "attendance file", chunksize, filename)
+        else:
+            reader = _open_attendance_csv(csv_filepath, pa_csv.open_csv, max_decompressed_bytes, filename)
+            schema = reader.schema
+        summary = None
+        batches = []
+        rows = 0
+        for batch in reader:
+            batches.append(batch)
+            rows += batch.num_rows
+            count_stage_rows_in(batch.num_rows)
+            if rows >= chunksize:
+                summary = _fold_attendance_chunk(summary, batches, schema, datetime_format,
+                                                 vocabulary)
+                batches = []
+                rows = 0
+        if batches or summary is None:
+            summary = _fold_attendance_chunk(summary, batches, schema, datetime_format,
+                                             vocabulary)
+    else:
+        if columnar:
+            table = read_columnar_table(csv_filepath, ATTENDANCE_REQUIRED_COLUMNS, "attendance file",
+                                        filename)
+        else:
+            # Read the whole CSV (multi-threaded) into a typed Arrow table
+            table = _open_attendance_csv(csv_filepath, pa_csv.read_csv, max_decompressed_bytes, filename)
+        count_stage_rows_in(table.num_rows)
+        summary = _summarise_attendance(table, datetime_format, vocabulary)
 
-    # Group by UID and attendanceDate
-    grouped = df.groupby(["uid", "attendanceDate"]).agg({
-        "hoursWorked": "sum",
-        "servicesPerformed": lambda x: ", ".join(x.str.strip())
-    }).reset_index()
+    grouped = summary.reset_index()
+    grouped["attendanceDate"] = grouped["attendanceDate"].dt.date
+    # services strings are rebuilt once per distinct set
+    grouped["servicesPerformed"] = vocabulary.to_categorical(grouped.pop("servicesMask").to_numpy())
 
     # Rename columns
     grouped.rename(columns={
@@ -460,6 +2239,91 @@ def extract_attendance_data(csv_filepath: str) -> Dict[str, Any]:
 
     return grouped
 
+
+# Batch inputs: agreement and attendance files of a site are paired by name, e.g.
+#   site01_agreement.docx + site01_attendance.csv.gz   -> site01
+#   site01/agreement.docx + site01/attendance.csv      -> site01
+#   site01.docx + site01.csv                           -> site01
+AGREEMENT_NAME_TOKENS = ("agreement", "invoice")
+ATTENDANCE_NAME_TOKENS = ("attendance",)
+ROLE_TOKEN_PATTERN = re.compile(
+    r"(?:^|[\s._-]+)(?:" + "|".join(AGREEMENT_NAME_TOKENS + ATTENDANCE_NAME_TOKENS) + r")(?=$|[\s._-])",
+    re.IGNORECASE
+)
+
+
+def _input_stem(filename: str) -> str:
+    """File name without its extension (.csv.gz etc. count as one extension)."""
+    name = os.path.basename(filename)
+    for suffix in COMPRESSED_CSV_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return os.path.splitext(name)[0]
+
+
+def input_role(filename: str) -> Optional[str]:
+    """
+    'agreement' or 'attendance' for a batch input file, None for anything else.
+
+    DOCX files are agreements and CSVs (plain or compressed) are attendance;
+    Parquet/Feather files need an agreement/invoice or attendance token in
+    their name.
+    """
+    name = filename.lower()
+    if name.endswith(".docx"):
+        return "agreement"
+    if is_csv_file(name):
+        return "attendance"
+    if is_columnar_file(name):
+        tokens = set(re.split(r"[\s._-]+", _input_stem(name)))
+        if tokens & set(AGREEMENT_NAME_TOKENS):
+            return "agreement"
+        if tokens & set(ATTENDANCE_NAME_TOKENS):
+            return "attendance"
+    return None
+
+
+def pair_key(filename: str) -> str:
+    """Site a batch input belongs to: its directory plus its name without the role token."""
+    stem = ROLE_TOKEN_PATTERN.sub("", _input_stem(filename)).strip(" ._-")
+    directory = os.path.dirname(filename).replace(os.sep, "/").strip("/")
+    return "/".join(part for part in (directory, stem) if part) or "default"
+
+
+def pair_input_files(filenames: List[str]) -> Tuple[Dict[str, Dict[str, str]], List[str]]:
+    """
+    Pair agreement and attendance files by site.
+
+    Args:
+        filenames: Paths (or archive member names) of the batch inputs
+
+    Returns:
+        Pairs keyed by site (sorted), each with 'agreement' and 'attendance',
+        and a list of problems: files with no role, no partner, or a site that
+        has more than one file of the same role
+    """
+    sites: Dict[str, Dict[str, List[str]]] = {}
+    problems = []
+    for filename in sorted(filenames):
+        role = input_role(filename)
+        if role is None:
+            problems.append(f"{filename}: not an agreement or attendance file")
+            continue
+        sites.setdefault(pair_key(filename), {}).setdefault(role, []).append(filename)
+
+    pairs = {}
+    for site in sorted(sites):
+        files = sites[site]
+        if any(len(names) > 1 for names in files.values()):
+            problems.append(f"{site}: more than one file per role ({', '.join(sum(files.values(), []))})")
+        elif len(files) < 2:
+            problems.append(f"{site}: no matching {'attendance' if 'agreement' in files else 'agreement'} "
+                            f"file for {sum(files.values(), [])[0]}")
+        else:
+            pairs[site] = {"agreement": files["agreement"][0], "attendance": files["attendance"][0]}
+    return pairs, problems
+
+
 # region: Finally:: compare two data sets and generate summary with attendance records and flag the record to review
 
 
@@ -487,6 +2351,379 @@ errorlog = os.path.join(log_dir, "error.log")
 loglevel = "info"
 # endregion
 
+def load_agreement(invoice_path: str) -> pd.DataFrame:
+    """Extract an agreement file, grouped and indexed for the lookup join."""
+    agreement_ref = extract_agreement_data(invoice_path) # TASK-1
+    # Task-3:: Convert agreement records to DataFrame grouped by uid and servicesPerformed,
+    # indexed by (uid, servicesKey) for the lookup join
+    return build_agreement_index(group_agreement_records(agreement_ref))
+
+
+def reconcile_files(invoice_path: str, attendance_path: str, output_prefix: str,
+                    chunksize: Optional[int] = None,
+                    datetime_format: str = ATTENDANCE_DATETIME_FORMAT,
+                    artifacts: Sequence[str] = REPORT_ARTIFACTS,
+                    formats: Sequence[str] = ("xlsx",),
+                    split_workbooks: bool = False,
+                    max_sheet_rows: int = EXCEL_MAX_ROWS,
+                    agreement_grouped: Optional[pd.DataFrame] = None) -> List[str]:
+    """
+    Reconcile one invoice/attendance pair and write the requested report files.
+
+    Args:
+        invoice_path: DOCX agreement (or Parquet/Feather records)
+        attendance_path: Attendance CSV (optionally compressed), Parquet or Feather file
+        output_prefix: Output path without extension
+        agreement_grouped: Already loaded agreement (see load_agreement); invoice_path
+            is not read again when given
+        (other arguments as for extract_attendance_data and export_report)
+
+    Returns:
+        Paths of the written files
+    """
+    merger = build_merger(invoice_path, attendance_path, chunksize, datetime_format, agreement_grouped)
+    # only the requested artifacts are computed and written (e.g. -r calculation comparison -o csv)
+    return merger.export_report(output_prefix, "totalHoursWorked", "totalSystemHours",
+                                artifacts=artifacts, formats=formats,
+                                split_workbooks=split_workbooks,
+                                max_sheet_rows=max_sheet_rows)
+
+
+def reconcile_buffers(invoice_path: str, attendance_path: str, name_prefix: str,
+                      chunksize: Optional[int] = None,
+                      datetime_format: str = ATTENDANCE_DATETIME_FORMAT,
+                      artifacts: Sequence[str] = REPORT_ARTIFACTS,
+                      formats: Sequence[str] = ("xlsx",),
+                      split_workbooks: bool = False,
+                      max_sheet_rows: int = EXCEL_MAX_ROWS,
+                      agreement_grouped: Optional[pd.DataFrame] = None) -> Dict[str, io.BytesIO]:
+    """
+    Same as reconcile_files, but keep the report files in memory (e.g. to upload them straight to S3).
+
+    Returns:
+        Buffers keyed by file name (see DataFrameMergeWithVariance.export_report_buffers)
+    """
+    merger = build_merger(invoice_path, attendance_path, chunksize, datetime_format, agreement_grouped)
+    return merger.export_report_buffers(name_prefix, "totalHoursWorked", "totalSystemHours",
+                                        artifacts=artifacts, formats=formats,
+                                        split_workbooks=split_workbooks,
+                                        max_sheet_rows=max_sheet_rows)
+
+
+def build_merger(invoice_path: str, attendance_path: str,
+                 chunksize: Optional[int] = None,
+                 datetime_format: str = ATTENDANCE_DATETIME_FORMAT,
+                 agreement_grouped: Optional[pd.DataFrame] = None) -> "DataFrameMergeWithVariance":
+    """Extract both inputs and set up the merge of one invoice/attendance pair."""
+    if agreement_grouped is None:
+        agreement_grouped = load_agreement(invoice_path)
+    daily_attendance_summary_df = extract_attendance_data(attendance_path, chunksize=chunksize,
+                                                          datetime_format=datetime_format) # TASK-2
+
+    # Create merger and process (AS GENERIC CLASS DEFINED IN data_merge_with_variance.py NOTE: parameter, variables are hardcoded for now)
+    return DataFrameMergeWithVariance(daily_attendance_summary_df, "Time & Attendance Summary", # df1
+                                      agreement_grouped, "SES-Invoice",                          # df2
+                                      ['uid', 'servicesPerformed'],                              # key columns
+                                      lookup_keys=agreement_lookup_keys)                         # hash join on the agreement index
+
+
+def _init_batch_worker(arrow_threads: int) -> None:
+    # each worker gets its share of the cores, instead of every worker starting one Arrow thread per core
+    pa.set_cpu_count(arrow_threads)
+
+
+def _reconcile_batch_pair(site: str, pair: Dict[str, str], output_prefix: str,
+                          options: Dict[str, Any]) -> Dict[str, Any]:
+    """Batch worker: reconcile one pair quietly and report its status instead of raising."""
+    started = time.perf_counter()
+    entry = {"site": site, "invoice": pair["agreement"], "attendance": pair["attendance"]}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):   # keep the batch log to one line per pair
+            entry["files"] = reconcile_files(pair["agreement"], pair["attendance"], output_prefix, **options)
+        entry["status"] = "succeeded"
+    except Exception as e:
+        entry.update({"status": "failed", "error": f"{type(e).__name__}: {e}"})
+    entry["seconds"] = round(time.perf_counter() - started, 3)
+    return entry
+
+
+def find_batch_inputs(pattern: str) -> Tuple[str, List[str]]:
+    """
+    Files of a batch: everything below a directory, or the matches of a glob.
+
+    Returns:
+        The base directory and the file names relative to it
+    """
+    if os.path.isdir(pattern):
+        base = pattern
+        paths = [os.path.join(dirpath, filename)
+                 for dirpath, _, filenames in os.walk(pattern) for filename in filenames]
+    else:
+        paths = [path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)]
+        base = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths]) if paths else "."
+    return base, sorted(os.path.relpath(path, base) for path in paths)
+
+
+def print_stage_timings(records: List[StageRecord]) -> None:
+    """Print one line per pipeline stage run: seconds, rows in/out and the process's peak RSS so far."""
+    print(f"{'Stage':<16}{'Seconds':>10}{'Rows in':>12}{'Rows out':>12}{'Process peak MB':>17}")
+    for record in records:
+        rows_in = "-" if record.rows_in is None else record.rows_in
+        rows_out = "-" if record.rows_out is None else record.rows_out
+        peak_rss = "-" if record.process_peak_rss_bytes is None else f"{record.process_peak_rss_bytes / 2 ** 20:.0f}"
+        print(f"{record.stage:<16}{record.seconds:>10.3f}{rows_in:>12}{rows_out:>12}{peak_rss:>17}"
+              f"{'  (failed)' if record.failed else ''}")
+
+
+def run_batch(pattern: str, output_dir: str, workers: Optional[int] = None,
+              **options: Any) -> List[Dict[str, Any]]:
+    """
+    Reconcile every invoice/attendance pair of a directory or glob in parallel.
+
+    Files are paired by site name (see pair_input_files). Each pair is
+    reconciled in its own process and writes <site>_result.* into output_dir;
+    a pair that fails is reported and does not stop the others. A summary is
+    printed at the end and written to output_dir/batch_summary.json.
+
+    Args:
+        pattern: Input directory or glob
+        output_dir: Directory for the report files of this batch
+        workers: Parallel processes (default: number of CPUs)
+        options: reconcile_files keyword arguments
+
+    Returns:
+        One summary entry per pair, in site order
+    """
+    base, names = find_batch_inputs(pattern)
+    pairs, problems = pair_input_files(names)
+    for problem in problems:
+        print(f"✗ Skipped {problem}")
+    if not pairs:
+        raise ValueError(f"No invoice/attendance pairs found in {pattern}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, len(pairs))
+    print(f"✓ Reconciling {len(pairs)} pairs from {base} with {workers} workers")
+
+    def pair_args(site: str) -> Tuple[str, Dict[str, str], str, Dict[str, Any]]:
+        paths = {role: os.path.join(base, name) for role, name in pairs[site].items()}
+        return site, paths, os.path.join(output_dir, f"{site.replace('/', '_')}_result"), options
+
+    def report(site: str) -> None:
+        entry = entries[site]
+        mark = "✓" if entry["status"] == "succeeded" else "✗"
+        seconds = "-" if entry["seconds"] is None else f"{entry['seconds']}s"
+        print(f"{mark} [{len(entries)}/{len(pairs)}] {site} {entry['status']} ({seconds})"
+              + (f": {entry['error']}" if entry["status"] == "failed" else ""))
+
+    started = time.perf_counter()
+    entries = {}
+    crashed = []
+    arrow_threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                             initargs=(arrow_threads,)) as pool:
+        futures = {pool.submit(_reconcile_batch_pair, *pair_args(site)): site for site in pairs}
+        for future in as_completed(futures):
+            site = futures[future]
+            try:
+                entries[site] = future.result()
+            except BrokenProcessPool:
+                crashed.append(site)
+                continue
+            report(site)
+
+    if crashed:
+        # a worker died (e.g. killed for memory) and took the pool down with every pending
+        # pair; run those again one at a time so a pair that crashes only fails itself
+        print(f"✗ A worker process exited; retrying {len(crashed)} pairs one at a time")
+        for site in sorted(crashed, key=list(pairs).index):
+            with ProcessPoolExecutor(max_workers=1, initializer=_init_batch_worker,
+                                     initargs=(os.cpu_count() or 1,)) as pool:
+                try:
+                    entries[site] = pool.submit(_reconcile_batch_pair, *pair_args(site)).result()
+                except BrokenProcessPool:
+                    _, paths, _, _ = pair_args(site)
+                    entries[site] = {"site": site, "invoice": paths["agreement"],
+                                     "attendance": paths["attendance"], "status": "failed", "seconds": None,
+                                     "error": "Worker process exited while reconciling this pair"}
+            report(site)
+    wall_seconds = time.perf_counter() - started
+
+    results = [entries[site] for site in pairs]
+    succeeded = sum(entry["status"] == "succeeded" for entry in results)
+    pair_seconds = sum(entry["seconds"] or 0 for entry in results)
+    summary = {
+        "input": os.path.abspath(base),
+        "pairs": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "skipped": problems,
+        "workers": workers,
+        "wallSeconds": round(wall_seconds, 3),
+        "pairSeconds": round(pair_seconds, 3),
+        "results": results,
+    }
+    with open(os.path.join(output_dir, "batch_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n{'Site':<40} {'Status':<10} {'Seconds':>8}  Files")
+    for entry in results:
+        files = ", ".join(os.path.basename(path) for path in entry.get("files", [])) or entry.get("error", "")
+        print(f"{entry['site']:<40} {entry['status']:<10} {entry['seconds'] if entry['seconds'] is not None else '-':>8}  {files}")
+    print(f"✓ Batch finished: {succeeded}/{len(results)} pairs succeeded, {len(problems)} skipped, "
+          f"{wall_seconds:.1f}s wall time for {pair_seconds:.1f}s of work ({workers} workers)")
+    return results
+
+
+WATCH_STATE_VERSION = 1
+
+
+def file_fingerprint(path: str) -> Dict[str, int]:
+    """Size and modification time of a file; a change in either marks it as changed."""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtimeNs": stat.st_mtime_ns}
+
+
+class ReconcileWatcher:
+    """
+    Long-running watch-folder mode: reconcile only pairs whose files are new or changed.
+
+    The input directory is polled; files are paired by site name (see
+    pair_input_files). A pair is reconciled when the fingerprint of either of
+    its files differs from the one recorded in the state file, so a restart
+    picks up where the previous run stopped. Files modified in the last
+    settle_seconds are still being written and wait for the next poll.
+    Parsed agreements stay in memory between runs and are only parsed again
+    when their file changes.
+    """
+
+    def __init__(self, input_dir: str, output_dir: str, state_path: str,
+                 interval_seconds: float = 10, settle_seconds: float = 5,
+                 on_outputs: Optional[Callable[[List[str]], None]] = None,
+                 **options: Any):
+        """
+        Initialise watcher.
+
+        Args:
+            input_dir: Directory (or glob) to watch
+            output_dir: Directory receiving <site>_result.* for every reconciled pair
+            state_path: JSON file recording the processed fingerprints
+            interval_seconds: Seconds between polls
+            settle_seconds: Minimum age of a file before it is picked up
+            on_outputs: Optional callback with the files written for a pair (e.g. S3 upload)
+            options: reconcile_files keyword arguments
+        """
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.state_path = state_path
+        self.interval_seconds = interval_seconds
+        self.settle_seconds = settle_seconds
+        self.on_outputs = on_outputs or (lambda paths: None)
+        self.options = options
+        self.state = self._load_state()
+        self._agreements: Dict[str, Tuple[Dict[str, int], pd.DataFrame]] = {}
+        self._stop = threading.Event()
+        os.makedirs(output_dir, exist_ok=True)
+
+    def run_forever(self) -> None:
+        """Poll until stop() is called (or SIGINT/SIGTERM in the main thread)."""
+        print(f"✓ Watching {self.input_dir} every {self.interval_seconds}s (state: {self.state_path})")
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"✗ Watch cycle failed: {e}")
+            self._stop.wait(self.interval_seconds)
+        print("✓ Watcher stopped")
+
+    def stop(self) -> None:
+        """Finish the current pair and stop polling."""
+        self._stop.set()
+
+    def run_once(self) -> int:
+        """
+        Reconcile every new or changed pair once.
+
+        Returns:
+            Number of pairs reconciled
+        """
+        base, names = find_batch_inputs(self.input_dir)
+        pairs, _ = pair_input_files(names)
+        now = time.time()
+        processed = 0
+        for site, pair in pairs.items():
+            if self._stop.is_set():
+                break
+            paths = {role: os.path.join(base, name) for role, name in pair.items()}
+            try:
+                fingerprints = {role: file_fingerprint(path) for role, path in paths.items()}
+            except FileNotFoundError:
+                continue   # removed while scanning
+            if any(now - fp["mtimeNs"] / 1e9 < self.settle_seconds for fp in fingerprints.values()):
+                continue   # still being written
+            recorded = self.state["pairs"].get(site, {})
+            if recorded.get("fingerprints") == fingerprints and recorded.get("files") == pair:
+                continue
+            self._reconcile(site, pair, paths, fingerprints)
+            processed += 1
+
+        # forget agreements whose file is gone
+        current = {os.path.join(base, pair["agreement"]) for pair in pairs.values()}
+        for path in set(self._agreements) - current:
+            del self._agreements[path]
+        return processed
+
+    def _reconcile(self, site: str, pair: Dict[str, str], paths: Dict[str, str],
+                   fingerprints: Dict[str, Dict[str, int]]) -> None:
+        started = time.perf_counter()
+        entry: Dict[str, Any] = {"files": pair, "fingerprints": fingerprints,
+                                 "processedAt": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+        try:
+            agreement_grouped = self._agreement(paths["agreement"], fingerprints["agreement"])
+            output_prefix = os.path.join(self.output_dir, f"{site.replace('/', '_')}_result")
+            with contextlib.redirect_stdout(io.StringIO()):
+                outputs = reconcile_files(paths["agreement"], paths["attendance"], output_prefix,
+                                          agreement_grouped=agreement_grouped, **self.options)
+            entry.update({"status": "succeeded", "outputs": outputs})
+            print(f"✓ Reconciled {site} in {time.perf_counter() - started:.2f}s -> "
+                  f"{', '.join(os.path.basename(path) for path in outputs)}")
+            self.on_outputs(outputs)
+        except Exception as e:
+            # recorded with its fingerprints, so it is retried once one of its files changes
+            entry.update({"status": "failed", "error": f"{type(e).__name__}: {e}"})
+            print(f"✗ Reconciling {site} failed: {e}")
+        self.state["pairs"][site] = entry
+        self._save_state()
+
+    def _agreement(self, path: str, fingerprint: Dict[str, int]) -> pd.DataFrame:
+        cached = self._agreements.get(path)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        agreement_grouped = load_agreement(path)
+        self._agreements[path] = (fingerprint, agreement_grouped)
+        return agreement_grouped
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("version") == WATCH_STATE_VERSION:
+                return state
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print(f"✗ Ignoring unreadable state file {self.state_path}: {e}")
+        return {"version": WATCH_STATE_VERSION, "pairs": {}}
+
+    def _save_state(self) -> None:
+        # written to a temp file and renamed, so a crash never leaves half a state file
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+
 def main():
     # region:: process prompt (Parse command line arguments)
     parser = argparse.ArgumentParser(
@@ -502,11 +2739,101 @@ def main():
     )
     parser.add_argument(
         '-i', '--invoice',
-        help='Input file (DOCX format, containing uid, systemHours, servicesPerformed)'
+        help='Input file (DOCX format, or Parquet/Feather records with uid, systemHours, servicesPerformed)'
     )
     parser.add_argument(
         '-a', '--attendance',
-        help='Input file (CSV format, containing uid, punchInDateTime, punchOutDateTime, servicesPerformed)'
+        help='Input file (CSV/.csv.gz/.csv.zst/.csv.bz2, Parquet or Feather format, containing uid, punchInDateTime, punchOutDateTime, servicesPerformed)'
+    )
+    parser.add_argument(
+        '-c', '--chunksize',
+        type=int,
+        help='Stream the attendance CSV in chunks of this many rows (bounded memory for large exports)'
+    )
+    parser.add_argument(
+        '-f', '--datetime-format',
+        default=ATTENDANCE_DATETIME_FORMAT,
+        help=f'strptime format of the punch timestamps (default: day-first "{ATTENDANCE_DATETIME_FORMAT}")'.replace('%', '%%')
+    )
+    parser.add_argument(
+        '-r', '--artifacts',
+        nargs='+',
+        choices=REPORT_ARTIFACTS,
+        default=list(REPORT_ARTIFACTS),
+        help='Report artifacts to compute and write: df1 (attendance summary), df2 (invoice), '
+             'calculation (merged data), comparison (variance summary) (default: all)'
+    )
+    parser.add_argument(
+        '-o', '--formats',
+        nargs='+',
+        choices=REPORT_FORMATS,
+        default=['xlsx'],
+        help='Output formats; xlsx writes one workbook, the others one file per artifact (default: xlsx)'
+    )
+    parser.add_argument(
+        '--split-workbooks',
+        action='store_true',
+        help='When a sheet exceeds the row limit, write result.zip with several workbooks '
+             'instead of continuation sheets'
+    )
+    parser.add_argument(
+        '--max-sheet-rows',
+        type=int,
+        default=EXCEL_MAX_ROWS,
+        help=f'Rows per sheet before splitting, including 3 header rows (default: {EXCEL_MAX_ROWS})'
+    )
+    parser.add_argument(
+        '-b', '--batch',
+        help='Batch mode: input directory or glob (relative to input/) holding many invoice/attendance '
+             'pairs, matched by site name (site01_agreement.docx + site01_attendance.csv, '
+             'or site01/agreement.docx + site01/attendance.csv)'
+    )
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=os.cpu_count(),
+        help='Batch mode: pairs reconciled in parallel (default: number of CPUs)'
+    )
+    parser.add_argument(
+        '--s3-only',
+        action='store_true',
+        help='Upload the reports to S3 straight from memory instead of writing them to output/ '
+             '(single pair mode); a report whose upload fails is spooled to output/publish/ and retried'
+    )
+    parser.add_argument(
+        '--publish-timeout',
+        type=float,
+        default=60,
+        help='Seconds to wait for S3 uploads before exiting; uploads still pending stay queued in '
+             'output/publish/ and are retried by the next run (default: 60)'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Daemon mode: keep watching input/ (or the --batch directory) and reconcile only '
+             'new or changed pairs into output/watch/'
+    )
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=10,
+        help='Watch mode: seconds between polls (default: 10)'
+    )
+    parser.add_argument(
+        '--settle',
+        type=float,
+        default=5,
+        help='Watch mode: seconds a file must be unchanged before it is picked up (default: 5)'
+    )
+    parser.add_argument(
+        '--state',
+        help='Watch mode: state file recording processed files (default: output/watch/watch_state.json)'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help=f'Profile this run (cProfile + tracemalloc top allocations) into output/profiles/; '
+             f'the newest {PROFILE_KEEP} captures are kept'
     )
     parser.add_argument(
         '-s', '--summary',
@@ -515,94 +2842,114 @@ def main():
     
     args = parser.parse_args()
     # endregion
-    try:
-        # region:: extract data (DOCX, CSV) from input files
-        # defining empty lists to hold extracted data
-        agreement_ref=[]
-        daily_attendance=[]
-        attendance_summary=[]
-        
-        # Extract DOCX invoice file
-        file_type = os.path.splitext(args.invoice)[1].lower()
-        if file_type != '.docx':
-            raise ValueError("Only DOCX files are supported.")
-        else:
-            file_path = os.path.join(ROOT_DIR, "input", args.invoice)
-            agreement_ref = extract_agreement_data(file_path) # TASK-1
+    if not args.profile:
+        return run_cli(args)
+    with ProfileCapture(os.path.join(ROOT_DIR, "output", "profiles"), keep=PROFILE_KEEP).capture("cli"):
+        return run_cli(args)
 
-        # Extract CSV attendance file
-        file_type = os.path.splitext(args.attendance)[1].lower()
-        if file_type != '.csv':
-            raise ValueError("Only CSV files are supported.")
-        else:
-            file_path = os.path.join(ROOT_DIR, "input", args.attendance)
-            daily_attendance_summary_df = extract_attendance_data(file_path) # TASK-2
-
-        # Task-3:: Convert agreement records to DataFrame for comparison
-        agreement_ref_df = pd.DataFrame(agreement_ref['records'])
-
-        # Group agreement data by uid and servicesPerformed to get max allowed hours and remove duplicates
-        agreement_grouped = agreement_ref_df.groupby(['uid', 'servicesPerformed']).agg(
-            totalSystemHours = ('systemHours', 'sum'), # assuming systemHours in agreement is the max allowed
-            allServicesPerformed = ('servicesPerformed', lambda x: ', '.join(x.unique()))
-        ).reset_index()
-        # agreement_grouped.rename(columns={
-        #     "hoursWorked": "totalHoursWorked"
-        # }, inplace=True)
-        # endregion
-        
+
+def run_cli(args: argparse.Namespace):
+    """Run the mode selected on the command line (see main)."""
+    try:
         # # Optionally save to JSON file with time suffix to avoid overwriting
         timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
         file_prefix = os.path.join(ROOT_DIR, "output")
         if not os.path.exists(file_prefix):
             os.makedirs(file_prefix)
-        # # Save the generated DataFrame to an Excel file
-        # agreement_grouped.to_excel(f"{file_prefix}\\tmp_agreement_grouped.xlsx", index=False)
-        
-        # test:: 
-        # daily_attendance_summary_df.to_excel(f"{file_prefix}\\tmp_daily_attendance_summary.xlsx", index=False)
-        
-        # region:: Generating Output: Merge daily attendance summary with agreement grouped data on uid and servicesPerformed 
-        # Create merger and process (AS GENERIC CLASS DEFINED IN data_merge_with_variance.py NOTE: parameter, variables are hardcoded for now)
-        merger = DataFrameMergeWithVariance(daily_attendance_summary_df, "Time & Attendance Summary", # df1
-                                           agreement_grouped, "SES-Invoice",                          # df2
-                                           ['uid', 'servicesPerformed'])                              # key columns
-        merger.merge_dataframes()
-        file = os.path.join(file_prefix, "tmp_merged.csv")
-        # test::
-        # merger.merged_df.to_csv(file)
-        merger.calculate_variance("totalHoursWorked", "totalSystemHours")
-        # test::
-        merger.merged_df.to_csv(file)
-        
-        merger.get_variance_summary()
-        # test::
-        file = os.path.join(file_prefix, "tmp_comparison.csv")
-        merger.variance_df.to_csv(file)
-        file = os.path.join(file_prefix, "result.xlsx")
-        merger.export_to_xlsx(file, "totalHoursWorked", "totalSystemHours")
-        # endregion
+        report_options = dict(chunksize=args.chunksize, datetime_format=args.datetime_format,
+                              artifacts=args.artifacts, formats=args.formats,
+                              split_workbooks=args.split_workbooks, max_sheet_rows=args.max_sheet_rows)
         
-        print("✓ Data extraction and processing completed successfully.")
+        if args.watch:
+            # region:: watch mode, runs until interrupted
+            watch_dir = os.path.join(file_prefix, "watch")
+            try:
+                publish_queue = PublishQueue(os.path.join(file_prefix, "publish"), S3Uploader(S3_URI).upload_file)
+                publish_queue.start()
+            except Exception as e:
+                print(f"✗ Failed to open the publish queue, results are kept locally only: {e}")
+                publish_queue = None
+            
+            def upload_outputs(paths):
+                for path in paths if publish_queue is not None else []:
+                    publish_queue.enqueue(path, f"watch/{os.path.basename(path)}")
+            
+            watcher = ReconcileWatcher(os.path.join(ROOT_DIR, "input", args.batch or ""), watch_dir,
+                                       args.state or os.path.join(watch_dir, "watch_state.json"),
+                                       interval_seconds=args.interval, settle_seconds=args.settle,
+                                       on_outputs=upload_outputs, **report_options)
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda signum, frame: watcher.stop())
+            watcher.run_forever()
+            if publish_queue is not None:
+                publish_queue.stop()
+            return True
+            # endregion
         
-        # Initialize uploader
-        try:
-            uploader = S3Uploader(S3_URI)
-        except Exception as e:
-            print(f"\n✗ Failed to initialize S3 client: {e}")
-            return False
+        if args.batch:
+            # region:: batch mode, every pair of the directory/glob in parallel, outputs under output/batch_<timestamp>/
+            batch_dir = os.path.join(file_prefix, f"batch_{timestamp}")
+            results = run_batch(os.path.join(ROOT_DIR, "input", args.batch), batch_dir,
+                                workers=args.workers, **report_options)
+            files = [path for entry in results for path in entry.get("files", [])]
+            files.append(os.path.join(batch_dir, "batch_summary.json"))
+            # endregion
+        else:
+            # region:: extract data (DOCX, CSV) from input files
+            # Extract DOCX invoice file
+            file_type = os.path.splitext(args.invoice)[1].lower()
+            if file_type != '.docx' and file_type not in COLUMNAR_EXTENSIONS:
+                raise ValueError("Only DOCX, Parquet and Feather/Arrow files are supported.")
+            invoice_path = os.path.join(ROOT_DIR, "input", args.invoice)
+
+            # Extract CSV attendance file
+            file_type = os.path.splitext(args.attendance)[1].lower()
+            if not is_csv_file(args.attendance) and file_type not in COLUMNAR_EXTENSIONS:
+                raise ValueError("Only CSV (optionally .gz/.zst/.bz2), Parquet and Feather/Arrow files are supported.")
+            attendance_path = os.path.join(ROOT_DIR, "input", args.attendance)
+            # endregion
+            
+            # region:: Generating Output: Merge daily attendance summary with agreement grouped data on uid and servicesPerformed 
+            stage_records = []
+            add_stage_observer(stage_records.append)
+            if args.s3_only:
+                buffers = reconcile_buffers(invoice_path, attendance_path, "result", **report_options)
+                files = list(buffers)
+            else:
+                files = reconcile_files(invoice_path, attendance_path, os.path.join(file_prefix, "result"),
+                                        **report_options)
+            remove_stage_observer(stage_records.append)
+            print_stage_timings(stage_records)
+            # endregion
         
-        # Upload file
-        upload_file_path = file
-        success = uploader.upload_file(
-            file_path=upload_file_path,
-            s3_key="result.xlsx"
-        )
+        print("✓ Data extraction and processing completed successfully.")
         
-        if not success:
-            return False
-    
-        print(f"✓ Uploaded to s3 bucket -> https://bhp-poc-bucket.s3.ap-southeast-2.amazonaws.com/result.xlsx successfully.")
+        # The S3 client is created on the first upload, so a run without S3 access still journals
+        # its files; uploads still pending at exit are retried by the next run
+        uploader = S3Uploader(S3_URI)
+        publish_queue = PublishQueue(os.path.join(file_prefix, "publish"), uploader.upload_file)
+        for upload_file_path in files:
+            if args.s3_only:
+                # straight from memory; only a report that could not be sent is spooled to disk
+                try:
+                    uploader.upload_buffer(buffers[upload_file_path], upload_file_path)
+                except Exception as e:
+                    print(f"✗ Failed to upload {upload_file_path}, spooled for retry: {e}")
+                    publish_queue.enqueue_bytes(buffers[upload_file_path].getvalue(), upload_file_path)
+            else:
+                # batch outputs keep their batch_<timestamp>/ folder
+                s3_key = os.path.relpath(upload_file_path, file_prefix).replace(os.sep, "/")
+                publish_queue.enqueue(upload_file_path, s3_key)
+        
+        try:
+            remaining = publish_queue.drain(args.publish_timeout)
+        finally:
+            publish_queue.stop()
+            uploader.close()
+        if remaining:
+            print(f"✗ {remaining} uploads still pending in {publish_queue.spool_dir}, they are retried on the next run")
+        else:
+            print(f"✓ Uploaded {len(files)} files to s3 bucket -> https://bhp-poc-bucket.s3.ap-southeast-2.amazonaws.com/ successfully.")
         # output_file = f"{ROOT_DIR}\\output\\output_{timestamp}.json"
         # with open(output_file, "w") as f:
         #     json.dump(daily_attendance_summary, f, indent=4)
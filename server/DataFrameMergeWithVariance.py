@@ -1,11 +1,64 @@
 
+import io
+import os
+import time
+import zipfile
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
 import numpy as np
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.chart import BarChart, Reference
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
 from openpyxl.utils import get_column_letter
 import pandas as pd
 
+from metrics import stage_timer
+
+
+# XLSX report styling
+TITLE_FILL = PatternFill(start_color="D45A16", end_color="D45A16", fill_type="solid")
+TITLE_FONT = Font(color="FFFFFF", bold=True, size=12)
+BAND_FILL = PatternFill(start_color="F2AA84", end_color="F2AA84", fill_type="solid")
+BAND_FONT = Font(bold=True, size=11)
+CENTER_ALIGN = Alignment(horizontal="center", vertical="center")
+# column headers keep the look DataFrame.to_excel gave them
+COLUMN_HEADER_FONT = Font(bold=True)
+COLUMN_HEADER_ALIGN = Alignment(horizontal="center", vertical="top")
+THIN_BORDER = Border(
+    left=Side(style='thin'),
+    right=Side(style='thin'),
+    top=Side(style='thin'),
+    bottom=Side(style='thin')
+)
+# Named styles registered once per workbook and shared by all header cells
+TITLE_STYLE = "Report Title"
+BAND_STYLE = "Report Band"
+COLUMN_HEADER_STYLE = "Report Column Header"
+COLUMN_WIDTH = 20
+DATE_FORMAT = "YYYY-MM-DD"
+DATETIME_FORMAT = "YYYY-MM-DD HH:MM:SS"
+# Comparison sheet: variance_hours (6th column) is dropped in favour of its absolute value
+COMPARISON_DROPPED_COLUMN = 5
+COMPARISON_HEADERS = ["UID", "Services Performed", "Service Date", "Invoice Hours", "System Hours",
+                      "Variance (Hours)", "Variance (Percentage)", "Mismatch Hours", "Policy Conflict"]
+COMPARISON_BAND_FILLS = (
+    [BAND_FILL] * 4
+    + [PatternFill(start_color="538DD5", end_color="538DD5", fill_type="solid")]
+    + [PatternFill(start_color="CCC0DA", end_color="CCC0DA", fill_type="solid")] * 4
+)
+COMPARISON_INDEX_SHEET = "Comparison Index"
+# Report artifacts (df1, df2, the merged calculation and the variance comparison)
+# and the formats they can be written in
+REPORT_ARTIFACTS = ("df1", "df2", "calculation", "comparison")
+REPORT_FORMATS = ("xlsx", "csv", "parquet", "json")
+# Sheets longer than Excel allows continue on further sheets or workbooks
+EXCEL_MAX_ROWS = 1_048_576
+EXCEL_MAX_SHEET_NAME = 31
+REPORT_HEADER_ROWS = 3          # title, band and column header rows above the data
+EXPORT_BLOCK_ROWS = 65_536      # rows converted to cell values at a time
+
 
 class DataFrameMergeWithVariance:
     """Merge DataFrames with variance calculation and XLSX export."""
@@ -13,7 +66,8 @@ class DataFrameMergeWithVariance:
     def __init__(self, df1: pd.DataFrame, df1_name: str,
                  df2: pd.DataFrame, df2_name: str,
                  key_columns: list,
-                 variance_threshold: float = 12.0):
+                 variance_threshold: float = 12.0,
+                 lookup_keys: Optional[Callable[[pd.DataFrame], list]] = None):
         """
         Initialise merger.
         
@@ -23,6 +77,11 @@ class DataFrameMergeWithVariance:
             df2: Second DataFrame (e.g., actual hours from attendance)
             df2_name: Display name for df2 (e.g. Attendance Summary Data)
             key_columns: List of column names to merge on
+            lookup_keys: Optional function returning df1's join keys (one array per
+                index level) when df2 is a prebuilt lookup index, e.g. from
+                build_agreement_index. Matching is then a single hash join on that
+                index instead of an outer merge, and df2 rows with no df1 match
+                are not kept.
         """
         self.df1 = df1.copy()
         self.df2 = df2.copy()
@@ -32,6 +91,7 @@ class DataFrameMergeWithVariance:
         self.merged_df = None
         self.variance_df = None
         self.variance_threshold = variance_threshold
+        self.lookup_keys = lookup_keys
     
     def merge_dataframes(self) -> pd.DataFrame:
         """ Merge two DataFrames on key columns."""
@@ -49,14 +109,44 @@ class DataFrameMergeWithVariance:
         #                     suffixes=(f'_{self.df1_name}', f'_{self.df2_name}'))
         if self.key_columns is None or len(self.key_columns)==0:
             raise ValueError(f"No key columns specified for merging. cannot map records.: {self.df2_name} & {self.df1_name}")
-        else:
-            self.merged_df = pd.merge(self.df1, self.df2, 
-                            on=self.key_columns, 
-                            how='outer',
-                            suffixes=(f'_{self.df1_name}', f'_{self.df2_name}'))
+        with stage_timer("merge", rows_in=len(self.df1) + len(self.df2)) as stage:
+            if self.lookup_keys is not None:
+                self.merged_df = self._lookup_join()
+            else:
+                self._align_categorical_keys()
+                self.merged_df = pd.merge(self.df1, self.df2, 
+                                on=self.key_columns, 
+                                how='outer',
+                                suffixes=(f'_{self.df1_name}', f'_{self.df2_name}'))
+            stage.rows_out = len(self.merged_df)
         print(f"✓ Merged {len(self.df2)} + {len(self.df1)} records → {len(self.merged_df)} records")
         return self.merged_df
     
+    def _lookup_join(self) -> pd.DataFrame:
+        """Left hash join of df1 onto df2's prebuilt index, ordered like the key-sorted outer merge."""
+        keys = pd.MultiIndex.from_arrays(self.lookup_keys(self.df1))
+        positions = self.df2.index.get_indexer(keys)   # -1 where df1 has no match
+        
+        right = self.df2.drop(columns=[c for c in self.key_columns if c in self.df2.columns])
+        right = right.reset_index(drop=True).reindex(positions).reset_index(drop=True)
+        left = self.df1.reset_index(drop=True)
+        
+        overlap = left.columns.intersection(right.columns)
+        left = left.rename(columns={c: f'{c}_{self.df1_name}' for c in overlap})
+        right = right.rename(columns={c: f'{c}_{self.df2_name}' for c in overlap})
+        
+        merged = pd.concat([left, right], axis=1)
+        return merged.sort_values(self.key_columns, kind='stable', ignore_index=True)
+    
+    def _align_categorical_keys(self) -> None:
+        """Give categorical key columns the same categories on both sides so the merge joins integer codes."""
+        for col in self.key_columns:
+            left, right = self.df1[col], self.df2[col]
+            if isinstance(left.dtype, pd.CategoricalDtype) and isinstance(right.dtype, pd.CategoricalDtype):
+                categories = left.cat.categories.union(right.cat.categories)
+                self.df1[col] = left.cat.set_categories(categories)
+                self.df2[col] = right.cat.set_categories(categories)
+    
     def calculate_variance(self, 
                           df1_hours_col: str,
                           df2_hours_col: str,
@@ -74,32 +164,34 @@ class DataFrameMergeWithVariance:
         if self.merged_df is None:
             self.merge_dataframes()
         
-        # Convert to numeric Prepare data for calculation
-        self.merged_df[df1_hours_col] = pd.to_numeric(
-            self.merged_df[df1_hours_col], errors='coerce').fillna(0)
-        self.merged_df[df2_hours_col] = pd.to_numeric(
-            self.merged_df[df2_hours_col], errors='coerce').fillna(0)
+        with stage_timer("variance", rows_in=len(self.merged_df)) as stage:
+            # Convert to numeric Prepare data for calculation
+            self.merged_df[df1_hours_col] = pd.to_numeric(
+                self.merged_df[df1_hours_col], errors='coerce').fillna(0)
+            self.merged_df[df2_hours_col] = pd.to_numeric(
+                self.merged_df[df2_hours_col], errors='coerce').fillna(0)
         
-        # Calculate variance
-        self.merged_df[variance_col] = (
-            self.merged_df[df2_hours_col] - self.merged_df[df1_hours_col])
+            # Calculate variance
+            self.merged_df[variance_col] = (
+                self.merged_df[df2_hours_col] - self.merged_df[df1_hours_col])
         
-        # Calculate absolute variance
-        self.merged_df[f'abs_{variance_col}'] = np.abs(self.merged_df[variance_col])
+            # Calculate absolute variance
+            self.merged_df[f'abs_{variance_col}'] = np.abs(self.merged_df[variance_col])
         
-        # Calculate percentage (handle division by zero)
-        actual = self.merged_df[df1_hours_col].to_numpy(dtype=float)
-        allowed = self.merged_df[df2_hours_col].to_numpy(dtype=float)
-        variance = self.merged_df[variance_col].to_numpy(dtype=float)
+            # Calculate percentage (handle division by zero)
+            actual = self.merged_df[df1_hours_col].to_numpy(dtype=float)
+            allowed = self.merged_df[df2_hours_col].to_numpy(dtype=float)
+            variance = self.merged_df[variance_col].to_numpy(dtype=float)
         
-        with np.errstate(divide='ignore', invalid='ignore'):
-            pct = np.where(
-                allowed == 0,
-                np.where(variance == 0, 0.0, np.nan),
-                (variance / actual) * 100.0
-            )
+            with np.errstate(divide='ignore', invalid='ignore'):
+                pct = np.where(
+                    allowed == 0,
+                    np.where(variance == 0, 0.0, np.nan),
+                    (variance / actual) * 100.0
+                )
         
-        self.merged_df[pct_col] = np.abs(np.round(pct, 2))
+            self.merged_df[pct_col] = np.abs(np.round(pct, 2))
+            stage.rows_out = len(self.merged_df)
         
         print(f"✓ Calculated variance and percentages")
         return self.merged_df
@@ -115,154 +207,482 @@ class DataFrameMergeWithVariance:
         ]
         available_cols = [c for c in summary_cols if c in self.merged_df.columns]
         
-        self.variance_df = self.merged_df[available_cols].copy()
-        # self.variance_df = self.variance_df.rename(columns={
-        #     'hoursWorked': 'systemHours'  # assuming hoursWorked from df1 is allowed
-        # })
-        self.variance_df = self.variance_df[self.variance_df['attendanceDate'].notna()]
-        self.variance_df["hours_mismatch"] = np.abs(self.variance_df["variance_pct"]) > 10.0
-        self.variance_df["policy_error"] = self.variance_df["totalHoursWorked"] > self.variance_threshold
+        with stage_timer("summary", rows_in=len(self.merged_df)) as stage:
+            self.variance_df = self.merged_df[available_cols].copy()
+            # self.variance_df = self.variance_df.rename(columns={
+            #     'hoursWorked': 'systemHours'  # assuming hoursWorked from df1 is allowed
+            # })
+            self.variance_df = self.variance_df[self.variance_df['attendanceDate'].notna()]
+            self.variance_df["hours_mismatch"] = np.abs(self.variance_df["variance_pct"]) > 10.0
+            self.variance_df["policy_error"] = self.variance_df["totalHoursWorked"] > self.variance_threshold
+            stage.rows_out = len(self.variance_df)
         return self.variance_df
     
     def export_to_csv(self, output_file: str) -> None:
         if self.merged_df is None:
             self.merge_dataframes()
     
+    def export_report(self, output_prefix: str,
+                      df1_hours_col: str = None,
+                      df2_hours_col: str = None,
+                      artifacts: Sequence[str] = REPORT_ARTIFACTS,
+                      formats: Sequence[str] = ("xlsx",),
+                      split_workbooks: bool = False,
+                      max_sheet_rows: int = EXCEL_MAX_ROWS) -> List[str]:
+        """
+        Compute and write only the requested report artifacts.
+        
+        The xlsx format writes one workbook (<output_prefix>.xlsx) with a sheet per
+        artifact; csv, parquet and json write one file per artifact, named
+        <output_prefix>_<artifact>.<format>. Frames no requested artifact needs
+        are not computed.
+        
+        Args:
+            output_prefix: Output path without extension
+            df1_hours_col: Hours column from df1
+            df2_hours_col: Hours column from df2
+            artifacts: Any of REPORT_ARTIFACTS
+            formats: Any of REPORT_FORMATS
+            split_workbooks: When a sheet would exceed max_sheet_rows, write
+                <output_prefix>.zip with several workbooks instead of adding
+                continuation sheets to one workbook
+            max_sheet_rows: Rows per sheet, including the three header rows
+        
+        Returns:
+            Paths of the written files
+        """
+        return self._export_report(output_prefix, lambda path: path, df1_hours_col, df2_hours_col,
+                                   artifacts, formats, split_workbooks, max_sheet_rows)
+    
+    def export_report_buffers(self, name_prefix: str,
+                              df1_hours_col: str = None,
+                              df2_hours_col: str = None,
+                              artifacts: Sequence[str] = REPORT_ARTIFACTS,
+                              formats: Sequence[str] = ("xlsx",),
+                              split_workbooks: bool = False,
+                              max_sheet_rows: int = EXCEL_MAX_ROWS) -> Dict[str, io.BytesIO]:
+        """
+        Same as export_report, but write each file into memory instead of to disk.
+        
+        Args:
+            name_prefix: File name without extension, e.g. "result"
+            (other arguments as for export_report)
+        
+        Returns:
+            Buffers keyed by file name, rewound to the start
+        """
+        buffers: Dict[str, io.BytesIO] = {}
+        
+        def open_buffer(name: str) -> io.BytesIO:
+            buffers[name] = io.BytesIO()
+            buffers[name].name = name   # used for log lines and zip entry names
+            return buffers[name]
+        
+        self._export_report(name_prefix, open_buffer, df1_hours_col, df2_hours_col,
+                            artifacts, formats, split_workbooks, max_sheet_rows)
+        for buffer in buffers.values():
+            buffer.seek(0)
+        return buffers
+    
+    def _export_report(self, output_prefix: str, open_output: Callable[[str], Any],
+                       df1_hours_col: str, df2_hours_col: str, artifacts: Sequence[str],
+                       formats: Sequence[str], split_workbooks: bool, max_sheet_rows: int) -> List[str]:
+        """Write the report files, each to open_output(<file name>) (a path or a binary stream)."""
+        artifacts = self._check_choices(artifacts, REPORT_ARTIFACTS, "artifact")
+        formats = self._check_choices(formats, REPORT_FORMATS, "format")
+        self._prepare_artifacts(artifacts, df1_hours_col, df2_hours_col)
+        
+        paths = []
+        for fmt in formats:
+            if fmt == "xlsx":
+                if split_workbooks and self._needs_split(artifacts, max_sheet_rows):
+                    paths.append(f"{output_prefix}.zip")
+                    self.export_to_xlsx_zip(open_output(paths[-1]), df1_hours_col, df2_hours_col,
+                                            artifacts, max_sheet_rows)
+                else:
+                    paths.append(f"{output_prefix}.xlsx")
+                    self.export_to_xlsx(open_output(paths[-1]), df1_hours_col, df2_hours_col,
+                                        artifacts, max_sheet_rows)
+                continue
+            for artifact in artifacts:
+                frame = self._artifact_frame(artifact)
+                if frame is None:
+                    continue
+                paths.append(f"{output_prefix}_{artifact}.{fmt}")
+                with stage_timer(f"{fmt}_write", rows_in=len(frame)):
+                    self._write_frame(frame, open_output(paths[-1]), fmt)
+                print(f"✓ {fmt.upper()} file created: {paths[-1]} ({len(frame)} records)")
+        return paths
+    
     def export_to_xlsx(self, output_file: str,
                       df1_hours_col: str = None,
-                      df2_hours_col: str = None) -> None:
+                      df2_hours_col: str = None,
+                      artifacts: Sequence[str] = REPORT_ARTIFACTS,
+                      max_sheet_rows: int = EXCEL_MAX_ROWS) -> None:
         """
-        Export all three DataFrames to XLSX with merged headers.
+        Export the requested DataFrames to XLSX with merged headers.
+        
+        Frames longer than a sheet allows continue on numbered sheets, e.g.
+        "Calculation (2)". A split Comparison gets a "Comparison Index" sheet
+        listing the uid range of each part.
         
         Args:
-            output_file: Output XLSX file path
+            output_file: Output XLSX file path, or a writable binary stream
             df1_hours_col: Hours column from df1
             df2_hours_col: Hours column from df2
+            artifacts: Sheets to write, any of REPORT_ARTIFACTS (default: all)
+            max_sheet_rows: Rows per sheet, including the three header rows
         """
-        if self.merged_df is None:
-            self.merge_dataframes()
+        artifacts = self._check_choices(artifacts, REPORT_ARTIFACTS, "artifact")
+        self._prepare_artifacts(artifacts, df1_hours_col, df2_hours_col)
         
-        if self.variance_df is None and df1_hours_col and df2_hours_col:
-            self.calculate_variance(df1_hours_col, df2_hours_col)
-            self.get_variance_summary()
-        
-        # Create Excel file with multiple sheets
-        with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-            # Sheet 1: Original df1
-            self.df1.to_excel(writer, sheet_name=self.df1_name, 
-                            startrow=2, index=False)
-            
-            # Sheet 2: Original df2
-            self.df2.to_excel(writer, sheet_name=self.df2_name, 
-                            startrow=2, index=False)
-            
-            # Sheet 3: Merged data
-            self.merged_df.to_excel(writer, sheet_name='Calculation', 
-                                   startrow=2, index=False)
-            
-            # Sheet 4: Variance summary
-            if self.variance_df is not None:
-                self.variance_df.to_excel(writer, sheet_name='Comparison', 
-                                         startrow=2, index=False)
-
-        # Format all sheets
-        wb = openpyxl.load_workbook(output_file)
-        
-        self._format_sheet(wb[self.df1_name], self.df1_name, len(self.df1.columns))
-        wb[self.df1_name].sheet_properties.tabColor = 'F2AA84' # Dark Brown
-        self._format_sheet(wb[self.df2_name], self.df2_name, len(self.df2.columns))
-        wb[self.df2_name].sheet_properties.tabColor = '538DD5' # Dark Blue
-        self._format_sheet(wb['Calculation'], 'Calculated Data', len(self.merged_df.columns))
-        wb['Calculation'].sheet_properties.tabColor = 'CCC0DA' # Dark Blue
-        
-        
-        if self.variance_df is not None:
-            self._format_sheet(wb['Comparison'], 'Variance Analysis', 
-                             len(self.variance_df.columns))
-        # format Comparison sheet
-        comp_worksheet = wb['Comparison']
-        fill = PatternFill(start_color="538DD5", end_color="538DD5", 
-                              fill_type="solid")
-        cell = comp_worksheet.cell(row=2, column=5)
-        cell.fill = fill
-        # delete variance_hours column
-        variance_col_idx = 6
-        comp_worksheet.delete_cols(variance_col_idx)
-        purple_fill = PatternFill(start_color="CCC0DA", end_color="CCC0DA", 
-                              fill_type="solid")
-        for col in range(6, 10):
-            cell = comp_worksheet.cell(row=2, column=col)
-            cell.fill = purple_fill
-        comp_worksheet.merge_cells('A1:I1')
-        comp_worksheet.delete_cols(10)
-        
-        # renaming columns
-        comp_worksheet.cell(row=3, column=1).value = "UID"
-        comp_worksheet.cell(row=3, column=2).value = "Services Performed"
-        comp_worksheet.cell(row=3, column=3).value = "Service Date"
-        comp_worksheet.cell(row=3, column=4).value = "Invoice Hours"
-        comp_worksheet.cell(row=3, column=5).value = "System Hours"
-        comp_worksheet.cell(row=3, column=6).value = "Variance (Hours)"
-        comp_worksheet.cell(row=3, column=7).value = "Variance (Percentage)"
-        comp_worksheet.cell(row=3, column=8).value = "Mismatch Hours"
-        comp_worksheet.cell(row=3, column=9).value = "Policy Conflict"
-        comp_worksheet.column_dimensions['B'].width = 50
-        # Activate dashboard sheet
-        wb.active = wb.sheetnames.index("Comparison")
-        wb.save(output_file)
+        # Each sheet is written once, row by row, with its formatting applied as it goes
+        specs = self._sheet_specs(artifacts)
+        with stage_timer("xlsx_write", rows_in=sum(len(spec[3]) for spec in specs)):
+            wb = self._report_workbook()
+            for artifact, sheet_name, header_name, df, options in specs:
+                parts = self._row_parts(len(df), max_sheet_rows)
+                names = [self._part_sheet_name(sheet_name, part) for part in range(len(parts))]
+                if artifact == 'comparison' and len(parts) > 1:
+                    self._write_index_sheet(wb, df, parts, sheets=names)
+                for part, (start, stop) in enumerate(parts):
+                    self._write_sheet(wb, names[part], self._part_title(header_name, part, len(parts)),
+                                      df, start=start, stop=stop, **options)
+        
+        if not wb.sheetnames:
+            raise ValueError("No sheets to write: the requested artifacts have not been computed")
+        self._activate_dashboard(wb)
+        with stage_timer("xlsx_save"):
+            wb.save(output_file)
        
-        print(f"✓ XLSX file created: {output_file}")
-        print(f"  - Sheet1 : {self.df1_name} ({len(self.df1)} records)")
-        print(f"  - Sheet2 : {self.df2_name} ({len(self.df2)} records)")
-        print(f"  - Merged : Combined data ({len(self.merged_df)} records)")
-        if self.variance_df is not None:
+        print(f"✓ XLSX file created: {self._output_name(output_file)}")
+        self._print_sheet_summary(artifacts)
+    
+    def export_to_xlsx_zip(self, output_file: str,
+                           df1_hours_col: str = None,
+                           df2_hours_col: str = None,
+                           artifacts: Sequence[str] = REPORT_ARTIFACTS,
+                           max_sheet_rows: int = EXCEL_MAX_ROWS) -> List[str]:
+        """
+        Export the requested DataFrames as several workbooks in one zip file.
+        
+        Workbook N holds part N of every artifact that is long enough, so each
+        sheet keeps its usual name. Workbooks are streamed straight into zip64
+        entries, one at a time. When the Comparison is split, the first workbook
+        gets a "Comparison Index" sheet listing the workbook and uid range of
+        each part.
+        
+        Args:
+            output_file: Output zip file path, or a writable, seekable binary stream
+            df1_hours_col: Hours column from df1
+            df2_hours_col: Hours column from df2
+            artifacts: Sheets to write, any of REPORT_ARTIFACTS (default: all)
+            max_sheet_rows: Rows per sheet, including the three header rows
+        
+        Returns:
+            Names of the workbooks inside the zip file
+        """
+        artifacts = self._check_choices(artifacts, REPORT_ARTIFACTS, "artifact")
+        self._prepare_artifacts(artifacts, df1_hours_col, df2_hours_col)
+        
+        specs = self._sheet_specs(artifacts)
+        if not specs:
+            raise ValueError("No sheets to write: the requested artifacts have not been computed")
+        spec_parts = [self._row_parts(len(spec[3]), max_sheet_rows) for spec in specs]
+        stem = os.path.splitext(os.path.basename(self._output_name(output_file)))[0]
+        workbook_names = [f"{stem}_part{number}.xlsx"
+                          for number in range(1, max(len(parts) for parts in spec_parts) + 1)]
+        
+        # workbooks are written and saved one at a time, so both stages are timed together here
+        with stage_timer("xlsx_write", rows_in=sum(len(spec[3]) for spec in specs)), \
+                zipfile.ZipFile(output_file, 'w', allowZip64=True) as archive:
+            for number, workbook_name in enumerate(workbook_names):
+                wb = self._report_workbook()
+                for (artifact, sheet_name, header_name, df, options), parts in zip(specs, spec_parts):
+                    if artifact == 'comparison' and number == 0 and len(parts) > 1:
+                        self._write_index_sheet(wb, df, parts, sheets=[sheet_name] * len(parts),
+                                                workbooks=workbook_names[:len(parts)])
+                    if number < len(parts):
+                        start, stop = parts[number]
+                        self._write_sheet(wb, sheet_name, self._part_title(header_name, number, len(parts)),
+                                          df, start=start, stop=stop, **options)
+                self._activate_dashboard(wb)
+                # xlsx files are already deflated, so entries are stored as they are written
+                entry = zipfile.ZipInfo(workbook_name, time.localtime()[:6])
+                with archive.open(entry, 'w', force_zip64=True) as stream:
+                    wb.save(stream)
+        
+        print(f"✓ XLSX zip created: {self._output_name(output_file)} ({len(workbook_names)} workbooks)")
+        self._print_sheet_summary(artifacts)
+        return workbook_names
+    
+    def _print_sheet_summary(self, artifacts: Sequence[str]) -> None:
+        if 'df1' in artifacts:
+            print(f"  - Sheet1 : {self.df1_name} ({len(self.df1)} records)")
+        if 'df2' in artifacts:
+            print(f"  - Sheet2 : {self.df2_name} ({len(self.df2)} records)")
+        if 'calculation' in artifacts:
+            print(f"  - Merged : Combined data ({len(self.merged_df)} records)")
+        if 'comparison' in artifacts and self.variance_df is not None:
             print(f"  - Comparison : Summary ({len(self.variance_df)} records)")
     
-    def _format_sheet(self, worksheet, header_name: str, num_cols: int) -> None:
-        """Format worksheet with merged headers and styling."""
-        # Merge cells for main header
-        if header_name == 'Variance Analysis':
-            worksheet.merge_cells(f'A1:I1')
-        else:
-            worksheet.merge_cells(f'A1:{get_column_letter(num_cols)}1')
-        header_cell = worksheet['A1']
-        header_cell.value = header_name
-        
-        # Header styling
-        header_fill = PatternFill(start_color="D45A16", end_color="D45A16", 
-                                 fill_type="solid")
-        header_font = Font(color="FFFFFF", bold=True, size=12)
-        center_align = Alignment(horizontal="center", vertical="center")
-        
-        header_cell.fill = header_fill
-        header_cell.font = header_font
-        header_cell.alignment = center_align
+    def _prepare_artifacts(self, artifacts: Sequence[str],
+                           df1_hours_col: Optional[str], df2_hours_col: Optional[str]) -> None:
+        """Compute only the frames the requested artifacts need."""
+        if 'calculation' not in artifacts and 'comparison' not in artifacts:
+            return
+        if self.merged_df is None:
+            self.merge_dataframes()
+        if self.variance_df is None and df1_hours_col and df2_hours_col:
+            if 'variance_pct' not in self.merged_df.columns:
+                self.calculate_variance(df1_hours_col, df2_hours_col)
+            if 'comparison' in artifacts:
+                self.get_variance_summary()
+    
+    def _artifact_frame(self, artifact: str) -> Optional[pd.DataFrame]:
+        return {
+            'df1': self.df1,
+            'df2': self.df2,
+            'calculation': self.merged_df,
+            'comparison': self.variance_df,
+        }[artifact]
+    
+    def _sheet_specs(self, artifacts: Sequence[str]) -> List[Tuple[str, str, str, pd.DataFrame, Dict[str, Any]]]:
+        """(artifact, sheet name, title, frame, _write_sheet options) of each sheet to write."""
+        specs = []
+        if 'df1' in artifacts:
+            specs.append(('df1', self.df1_name, self.df1_name, self.df1,
+                          {'tab_color': 'F2AA84'})) # Dark Brown
+        if 'df2' in artifacts:
+            specs.append(('df2', self.df2_name, self.df2_name, self.df2,
+                          {'tab_color': '538DD5'})) # Dark Blue
+        if 'calculation' in artifacts:
+            specs.append(('calculation', 'Calculation', 'Calculated Data', self.merged_df,
+                          {'tab_color': 'CCC0DA'})) # Dark Blue
+        if 'comparison' in artifacts and self.variance_df is not None:
+            # Comparison sheet: variance_hours is left out and the columns get display names
+            columns = [col for idx, col in enumerate(self.variance_df.columns)
+                       if idx != COMPARISON_DROPPED_COLUMN]
+            headers = COMPARISON_HEADERS + [str(col) for col in columns[len(COMPARISON_HEADERS):]]
+            widths = {get_column_letter(col): COLUMN_WIDTH
+                      for col in range(1, len(self.variance_df.columns) + 1)}
+            widths['B'] = 50
+            specs.append(('comparison', 'Comparison', 'Variance Analysis', self.variance_df,
+                          {'columns': columns, 'headers': headers,
+                           'band_fills': COMPARISON_BAND_FILLS, 'widths': widths}))
+        return specs
+    
+    def _needs_split(self, artifacts: Sequence[str], max_sheet_rows: int) -> bool:
+        return any(len(self._row_parts(len(spec[3]), max_sheet_rows)) > 1
+                   for spec in self._sheet_specs(artifacts))
+    
+    @staticmethod
+    def _row_parts(num_rows: int, max_sheet_rows: int) -> List[Tuple[int, int]]:
+        """(start, stop) data row ranges that fit one sheet each, at least one."""
+        rows_per_sheet = max_sheet_rows - REPORT_HEADER_ROWS
+        if rows_per_sheet < 1:
+            raise ValueError(f"max_sheet_rows must be larger than {REPORT_HEADER_ROWS}")
+        return [(start, min(start + rows_per_sheet, num_rows))
+                for start in range(0, num_rows, rows_per_sheet)] or [(0, 0)]
+    
+    @staticmethod
+    def _part_sheet_name(sheet_name: str, part: int) -> str:
+        """Sheet name of a continuation part, kept within Excel's 31 characters."""
+        if part == 0:
+            return sheet_name
+        suffix = f" ({part + 1})"
+        return sheet_name[:EXCEL_MAX_SHEET_NAME - len(suffix)] + suffix
+    
+    @staticmethod
+    def _part_title(header_name: str, part: int, num_parts: int) -> str:
+        return header_name if num_parts == 1 else f"{header_name} (part {part + 1} of {num_parts})"
+    
+    def _write_index_sheet(self, workbook, df: pd.DataFrame, parts: List[Tuple[int, int]],
+                           sheets: List[str], workbooks: Optional[List[str]] = None) -> None:
+        """Write the Comparison Index sheet: where each uid range of a split frame lives."""
+        uids = df[self.key_columns[0]]
+        index = pd.DataFrame({
+            'Sheet': sheets,
+            'First Row': [start + 1 for start, _ in parts],
+            'Last Row': [stop for _, stop in parts],
+            'First UID': [uids.iloc[start] for start, _ in parts],
+            'Last UID': [uids.iloc[stop - 1] for _, stop in parts],
+        })
+        if workbooks is not None:
+            index.insert(0, 'Workbook', workbooks)
+        self._write_sheet(workbook, COMPARISON_INDEX_SHEET, 'Comparison Index', index)
+    
+    @staticmethod
+    def _activate_dashboard(workbook) -> None:
+        # Activate dashboard sheet (the index of a split Comparison comes first)
+        for name in (COMPARISON_INDEX_SHEET, 'Comparison'):
+            if name in workbook.sheetnames:
+                workbook.active = workbook.sheetnames.index(name)
+                return
+    
+    @staticmethod
+    def _check_choices(values: Sequence[str], choices: Sequence[str], kind: str) -> List[str]:
+        """Validate requested artifacts/formats, keeping the canonical order."""
+        unknown = [value for value in values if value not in choices]
+        if unknown:
+            raise ValueError(f"Unknown report {kind}: {', '.join(unknown)} "
+                             f"(choose from {', '.join(choices)})")
+        return [choice for choice in choices if choice in values]
+    
+    @staticmethod
+    def _output_name(output_file: Any) -> str:
+        """Path of an output, or the name of an in-memory one."""
+        if isinstance(output_file, str):
+            return output_file
+        return getattr(output_file, "name", None) or "report"
+    
+    @staticmethod
+    def _write_frame(frame: pd.DataFrame, path: Any, fmt: str) -> None:
+        """Write one artifact frame as csv, parquet or json (without the row index) to a path or binary stream."""
+        if fmt == 'csv':
+            frame.to_csv(path, index=False)
+        elif fmt == 'parquet':
+            frame.to_parquet(path, index=False)
+        elif fmt == 'json':
+            frame.to_json(path, orient='records', date_format='iso')
+    
+    def _report_workbook(self):
+        """Empty write-only workbook with the report's named styles."""
+        wb = openpyxl.Workbook(write_only=True)
+        for style in self._report_styles():
+            wb.add_named_style(style)
+        return wb
+    
+    def _write_sheet(self, workbook, sheet_name: str, header_name: str, df: pd.DataFrame,
+                     tab_color: Optional[str] = None, columns: Optional[list] = None,
+                     headers: Optional[List[str]] = None,
+                     band_fills: Optional[List[PatternFill]] = None,
+                     widths: Optional[Dict[str, float]] = None,
+                     start: int = 0, stop: Optional[int] = None) -> None:
+        """
+        Write one formatted sheet to a write-only workbook in a single pass.
+        
+        Row 1 holds the merged title, row 2 a coloured band, row 3 the column
+        headers and the data starts at row 4. Header rows use the named styles
+        from _report_styles; data cells carry only values (and a number format
+        on date columns) and get their grid from one conditional format over the
+        whole data range, so styling cost does not grow with the number of rows.
+        Rows are converted EXPORT_BLOCK_ROWS at a time to bound memory.
+        
+        Args:
+            workbook: Workbook created with write_only=True
+            sheet_name: Name of the sheet (tab)
+            header_name: Title written into the merged first row
+            df: Data to write
+            tab_color: Tab colour as RGB hex
+            columns: Columns of df to write (default: all)
+            headers: Header text for each written column (default: column names)
+            band_fills: Row 2 fill for each written column (default: BAND_FILL)
+            widths: Column widths by letter (default: COLUMN_WIDTH for each written column)
+            start: First row of df to write
+            stop: Row of df to stop before (default: all rows)
+        """
+        columns = list(df.columns) if columns is None else columns
+        headers = [str(col) for col in columns] if headers is None else headers
+        stop = len(df) if stop is None else stop
+        num_cols = len(columns)
+        if band_fills is None:
+            band_fills = [BAND_FILL] * num_cols
+        if widths is None:
+            widths = {get_column_letter(col): COLUMN_WIDTH for col in range(1, num_cols + 1)}
+        
+        # Sheet properties and dimensions go out before the first row
+        worksheet = workbook.create_sheet(title=sheet_name)
+        if tab_color:
+            worksheet.sheet_properties.tabColor = tab_color
+        for letter, width in widths.items():
+            worksheet.column_dimensions[letter].width = width
         worksheet.row_dimensions[1].height = 25
+        worksheet.merged_cells.add(f'A1:{get_column_letter(num_cols)}1')
+        
+        # Merged title, coloured band and column headers
+        worksheet.append([self._styled_cell(worksheet, header_name, style=TITLE_STYLE)])
+        worksheet.append([self._styled_cell(worksheet, None, style=BAND_STYLE,
+                                            fill=None if fill is BAND_FILL else fill)
+                          for fill in band_fills[:num_cols]])
+        worksheet.append([self._styled_cell(worksheet, header, style=COLUMN_HEADER_STYLE)
+                          for header in headers])
+        
+        # Grid borders of the data rows as a single range-level rule
+        if stop > start and num_cols:
+            worksheet.conditional_formatting.add(
+                f'A{REPORT_HEADER_ROWS + 1}:{get_column_letter(num_cols)}{stop - start + REPORT_HEADER_ROWS}',
+                FormulaRule(formula=['TRUE'], border=THIN_BORDER))
         
-        # Column header styling (row 2)
-        sub_fill = PatternFill(start_color="F2AA84", end_color="F2AA84", 
-                              fill_type="solid")
-        sub_font = Font(bold=True, size=11)
-        
-        for col in range(1, num_cols + 1):
-            cell = worksheet.cell(row=2, column=col)
-            cell.fill = sub_fill
-            cell.font = sub_font
-            cell.alignment = center_align
-        
-        # Auto-adjust column widths
-        for col in range(1, num_cols + 1):
-            worksheet.column_dimensions[get_column_letter(col)].width = 20
-        
-        # Add borders
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        
-        for row in worksheet.iter_rows(min_row=2, max_row=worksheet.max_row,
-                                       min_col=1, max_col=num_cols):
-            for cell in row:
-                cell.border = thin_border
+        # one formatted cell per date column, reused for every data row:
+        # append() writes the row out before returning
+        date_cells = []
+        for idx, col in enumerate(columns):
+            number_format = self._excel_number_format(df[col])
+            if number_format is not None:
+                date_cells.append((idx, self._styled_cell(worksheet, None,
+                                                          number_format=number_format)))
+        
+        for block_start in range(start, stop, EXPORT_BLOCK_ROWS):
+            block = df.iloc[block_start:min(block_start + EXPORT_BLOCK_ROWS, stop)]
+            values = [self._excel_values(block[col]) for col in columns]
+            if not date_cells:
+                for row in zip(*values):
+                    worksheet.append(row)
+                continue
+            for row in zip(*values):
+                row = list(row)
+                for idx, cell in date_cells:
+                    if row[idx] is not None:
+                        cell.value = row[idx]
+                        row[idx] = cell
+                worksheet.append(row)
+    
+    @staticmethod
+    def _report_styles() -> List[NamedStyle]:
+        """Named styles of the report headers (new objects, as they bind to one workbook)."""
+        return [
+            NamedStyle(name=TITLE_STYLE, font=TITLE_FONT, fill=TITLE_FILL, alignment=CENTER_ALIGN),
+            NamedStyle(name=BAND_STYLE, font=BAND_FONT, fill=BAND_FILL, alignment=CENTER_ALIGN,
+                       border=THIN_BORDER),
+            NamedStyle(name=COLUMN_HEADER_STYLE, font=COLUMN_HEADER_FONT,
+                       alignment=COLUMN_HEADER_ALIGN, border=THIN_BORDER),
+        ]
+    
+    @staticmethod
+    def _styled_cell(worksheet, value, style: Optional[str] = None,
+                     fill: Optional[PatternFill] = None,
+                     number_format: Optional[str] = None) -> WriteOnlyCell:
+        """Create a write-only cell with a named style and optional overrides."""
+        cell = WriteOnlyCell(worksheet, value)
+        if style is not None:
+            cell.style = style
+        if fill is not None:
+            cell.fill = fill
+        if number_format is not None:
+            cell.number_format = number_format
+        return cell
+    
+    @staticmethod
+    def _excel_number_format(series: pd.Series) -> Optional[str]:
+        """Number format DataFrame.to_excel gives a column's dates, None for other columns."""
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            return DATETIME_FORMAT
+        if series.dtype == object:
+            kind = pd.api.types.infer_dtype(series, skipna=True)
+            if kind == 'datetime':
+                return DATETIME_FORMAT
+            if kind == 'date':
+                return DATE_FORMAT
+        return None
+    
+    @staticmethod
+    def _excel_values(series: pd.Series) -> list:
+        """Cell values of a column, converted like DataFrame.to_excel does."""
+        # Missing values become blank cells
+        values = series.astype(object).where(series.notna(), None).tolist()
+        if pd.api.types.is_float_dtype(series.dtype) and np.isinf(series.to_numpy()).any():
+            # infinities are written as text, like to_excel's inf_rep
+            values = [('inf' if value > 0 else '-inf') if value is not None and np.isinf(value) else value
+                      for value in values]
+        return values
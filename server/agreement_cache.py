@@ -0,0 +1,265 @@
+"""
+Content-addressed cache of grouped agreement data.
+
+The same agreement.docx is uploaded over and over, so the grouped agreement
+frame is cached by the SHA-256 of the file's bytes and GROUPED_AGREEMENT_VERSION:
+
+- an in-memory LRU layer per worker, bounded by entry count and bytes
+- a Parquet layer on disk, bounded by total bytes and shared by all
+  gunicorn workers (files are written to a temp name and renamed into place)
+
+The disk layer lives on a persistent volume, so its file names carry the
+version of the grouped frame: frames written before a change to extraction or
+grouping are never read again, and the disk budget evicts them first since
+they are never used.
+
+An optional JSON metadata file can be stored next to each frame; the agreement
+registry in app.py uses it to describe registered agreements.
+"""
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+from process import GROUPED_AGREEMENT_VERSION
+
+
+CACHE_FILE_SUFFIX = ".parquet"
+METADATA_FILE_SUFFIX = ".json"
+
+
+def file_digest(file_path) -> str:
+    """
+    Return the SHA-256 hex digest of a file, read in chunks.
+
+    file_path may also be a seekable binary file object (e.g. an upload kept in
+    memory); it is read from its current position and seeked back afterwards.
+    """
+    sha256 = hashlib.sha256()
+    if isinstance(file_path, (str, os.PathLike)):
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    position = file_path.tell()
+    for chunk in iter(lambda: file_path.read(1024 * 1024), b""):
+        sha256.update(chunk)
+    file_path.seek(position)
+    return sha256.hexdigest()
+
+
+class AgreementCache:
+    """Two-level (memory LRU + on-disk Parquet) cache of agreement_grouped frames."""
+
+    def __init__(self, cache_dir: str,
+                 max_disk_bytes: int = 256 * 1024 * 1024,
+                 max_memory_entries: int = 32,
+                 max_memory_bytes: int = 64 * 1024 * 1024,
+                 version: int = GROUPED_AGREEMENT_VERSION):
+        """
+        Initialise cache.
+
+        Args:
+            cache_dir: Directory holding the shared Parquet files
+            max_disk_bytes: Upper bound for all Parquet files in cache_dir
+            max_memory_entries: Maximum number of frames kept in memory
+            max_memory_bytes: Upper bound for frames kept in memory
+            version: Version of the cached frames; files of other versions are ignored
+        """
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_entries = max_memory_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.version = version
+        self._file_suffix = f".v{version}"
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+        self._memory_sizes: Dict[str, int] = {}
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, digest: str) -> Optional[pd.DataFrame]:
+        """Return the cached frame for a digest, or None on a miss."""
+        with self._lock:
+            frame = self._memory.get(digest)
+            if frame is not None:
+                self._memory.move_to_end(digest)
+                self.memory_hits += 1
+                return frame.copy()
+
+        path = self._disk_path(digest)
+        try:
+            frame = pd.read_parquet(path)
+            os.utime(path)   # mark as recently used for disk eviction
+        except (OSError, ValueError):   # missing or half-written file
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+        self._remember(digest, frame)
+        return frame.copy()
+
+    def put(self, digest: str, frame: pd.DataFrame,
+            metadata: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Store a frame in both layers.
+
+        Args:
+            digest: Content hash of the agreement file
+            frame: Grouped agreement frame
+            metadata: Optional JSON-serialisable details stored next to the frame
+        """
+        self._remember(digest, frame.copy())   # the caller keeps using its frame
+
+        path = self._disk_path(digest)
+        if metadata is not None:
+            self._write_atomic(self._metadata_path(digest),
+                               lambda tmp: self._dump_json(metadata, tmp))
+        # the index is kept, so prebuilt agreement lookup indexes survive the round trip
+        self._write_atomic(path, lambda tmp: frame.to_parquet(tmp))
+        self._evict_disk()
+
+    def metadata(self, digest: str) -> Optional[Dict[str, Any]]:
+        """Return the metadata stored with a digest, or None if it is not on disk."""
+        if not os.path.exists(self._disk_path(digest)):
+            return None
+        try:
+            with open(self._metadata_path(digest), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Return the metadata of every frame on disk, most recently used first."""
+        entries = sorted(self._disk_entries(), key=lambda e: e[2], reverse=True)
+        result = []
+        current = f"{self._file_suffix}{CACHE_FILE_SUFFIX}"
+        for path, size, _ in entries:
+            if not path.endswith(current):
+                continue   # another version, waiting to be evicted
+            digest = os.path.basename(path)[:-len(current)]
+            metadata = self.metadata(digest)
+            if metadata is not None:
+                result.append({"digest": digest, "diskBytes": size, **metadata})
+        return result
+
+    def remove(self, digest: str) -> bool:
+        """Drop a digest from both layers. Returns False if it was not stored."""
+        with self._lock:
+            removed = self._memory.pop(digest, None) is not None
+            if removed:
+                self._memory_bytes -= self._memory_sizes.pop(digest)
+        for path in (self._disk_path(digest), self._metadata_path(digest)):
+            try:
+                os.remove(path)
+                removed = True
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def get_or_load(self, file_path,
+                    loader: Callable[[Any], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Return the grouped agreement for a file, running loader only on a miss.
+
+        Args:
+            file_path: Path to the agreement file, or a seekable binary file object
+            loader: Function turning file_path into the grouped frame
+        """
+        digest = file_digest(file_path)
+        frame = self.get(digest)
+        if frame is not None:
+            print(f"✓ Agreement cache hit: {digest[:12]}")
+            return frame
+
+        print(f"✓ Agreement cache miss: {digest[:12]}")
+        frame = loader(file_path)
+        self.put(digest, frame)
+        return frame
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and layer sizes for this worker."""
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "memoryHits": self.memory_hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "memoryEntries": len(self._memory),
+                "memoryBytes": self._memory_bytes,
+                "diskBytes": sum(size for _, size, _ in self._disk_entries()),
+            }
+
+    def _disk_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}{self._file_suffix}{CACHE_FILE_SUFFIX}")
+
+    def _metadata_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}{self._file_suffix}{METADATA_FILE_SUFFIX}")
+
+    @staticmethod
+    def _dump_json(data: Dict[str, Any], path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    @staticmethod
+    def _write_atomic(path: str, writer: Callable[[str], None]) -> None:
+        # write to a unique temp name, then rename so other workers never see half a file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            writer(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _remember(self, digest: str, frame: pd.DataFrame) -> None:
+        size = int(frame.memory_usage(deep=True).sum())
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            if digest in self._memory:
+                self._memory_bytes -= self._memory_sizes[digest]
+            self._memory[digest] = frame
+            self._memory.move_to_end(digest)
+            self._memory_sizes[digest] = size
+            self._memory_bytes += size
+            while (len(self._memory) > self.max_memory_entries
+                   or self._memory_bytes > self.max_memory_bytes):
+                evicted, _ = self._memory.popitem(last=False)
+                self._memory_bytes -= self._memory_sizes.pop(evicted)
+
+    def _disk_entries(self):
+        # frames of every version count against the disk budget
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(CACHE_FILE_SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict_disk(self) -> None:
+        entries = sorted(self._disk_entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_disk_bytes:
+                break
+            for evicted in (path, path[:-len(CACHE_FILE_SUFFIX)] + METADATA_FILE_SUFFIX):
+                try:
+                    os.remove(evicted)
+                except FileNotFoundError:
+                    pass   # another worker evicted it first
+            total -= size
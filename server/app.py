@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, current_app, g, request, jsonify, make_response, send_file
 from werkzeug.utils import secure_filename
 import os
 import pandas as pd
@@ -6,31 +6,183 @@ from docx import Document
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
 from datetime import datetime
+import hmac
 import io
+import json
+import re
+import shutil
+import tempfile
+import zipfile
 
 import DataFrameMergeWithVariance as dmv
-from process import extract_agreement_data, extract_attendance_data
+from agreement_cache import AgreementCache, file_digest
+from batch import BATCH_MANIFEST_NAME, PAIR_SUCCEEDED, BatchRunner
+from job_store import JOB_DATABASE_NAME, JobRunner, JobStore
+from metrics import StageMetrics, add_stage_observer, render_prometheus
+from profiling import ProfileCapture
+from publish_queue import PublishQueue, s3_publisher
+from process import (COLUMNAR_EXTENSIONS, DecompressedSizeExceeded, agreement_lookup_keys,
+                     build_agreement_index, csv_compression, extract_agreement_data,
+                     extract_attendance_data, group_agreement_records, is_columnar_file,
+                     is_csv_file, open_csv_stream, pair_input_files, pair_key)
+from workspace import WorkspaceSweeper, create_workspace
+
+class UploadRequest(Request):
+    """Request that keeps uploaded files in memory unless the request is large"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # werkzeug spools anything over 500KB to disk; only do that above our own threshold
+        if total_content_length is not None and \
+                total_content_length <= current_app.config['IN_MEMORY_UPLOAD_MAX_BYTES']:
+            return io.BytesIO()
+        return tempfile.TemporaryFile('w+b', dir=request_workspace())
+
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'output'
-ALLOWED_EXTENSIONS = {'docx', 'csv'}
-MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+ALLOWED_EXTENSIONS = {'docx', 'csv', 'csv.gz', 'csv.zst', 'csv.bz2', 'parquet', 'feather', 'arrow'}
+MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size (compressed size for .csv.gz/.zst/.bz2)
+MAX_DECOMPRESSED_CSV_LENGTH = 512 * 1024 * 1024  # guard against compressed CSVs that expand too far
+IN_MEMORY_UPLOAD_MAX_BYTES = 8 * 1024 * 1024  # larger requests are spooled to a temporary file
+CACHE_FOLDER = 'cache'
+AGREEMENT_CACHE_MAX_DISK_BYTES = 256 * 1024 * 1024  # shared by all workers
+AGREEMENT_CACHE_MAX_MEMORY_ENTRIES = 32             # per worker
+AGREEMENT_CACHE_MAX_MEMORY_BYTES = 64 * 1024 * 1024 # per worker
+AGREEMENT_REGISTRY_MAX_DISK_BYTES = 1024 * 1024 * 1024  # shared by all workers
+AGREEMENT_REGISTRY_MAX_MEMORY_ENTRIES = 64              # per worker
+AGREEMENT_REGISTRY_MAX_MEMORY_BYTES = 256 * 1024 * 1024 # per worker
+AGREEMENT_ID_PATTERN = re.compile(r"[0-9a-f]{64}")
+ATTENDANCE_CHUNKSIZE = 250_000  # rows per chunk when aggregating attendance CSVs
+REPORT_MIMETYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'json': 'application/json',
+    'zip': 'application/zip',
+}
+JOBS_FOLDER = 'jobs'
+JOB_WORKERS = 2           # jobs running at once, per gunicorn worker
+JOB_MAX_PENDING = 8       # jobs accepted (running + queued), per gunicorn worker
+JOB_RETRY_AFTER_SECONDS = 30
+JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+PIPELINE_STAGES = ['agreement', 'attendance', 'merge', 'export']
+BATCH_WORKERS = os.cpu_count() or 1         # pool processes on the host; one batch runs at a time
+BATCH_JOB_MAX_PENDING = 2                   # batches accepted (running + queued), per gunicorn worker
+BATCH_LOCK_NAME = 'batch.lock'              # in JOBS_FOLDER, held by the worker running a batch
+BATCH_STAGES = ['pool', 'reconcile', 'bundle']  # pool: waiting for another worker's batch to finish
+MAX_BATCH_PAIRS = 1000
+MAX_BATCH_CONTENT_LENGTH = 512 * 1024 * 1024       # /api/batch request size
+MAX_BATCH_UNCOMPRESSED_LENGTH = 2 * 1024 * 1024 * 1024  # paired files inside a batch archive
+WORKSPACE_TTL_SECONDS = 60 * 60             # request workspaces left behind in uploads/
+# shared by all workers; holds the spooled bodies of several batch requests at once
+WORKSPACE_MAX_BYTES = 4 * MAX_BATCH_CONTENT_LENGTH
+JOB_TTL_SECONDS = 24 * 60 * 60              # finished jobs and their artifacts
+# shared by all workers; holds the inputs, reports and bundle of a full batch next to other jobs
+JOBS_MAX_BYTES = 4 * MAX_BATCH_UNCOMPRESSED_LENGTH
+SWEEP_INTERVAL_SECONDS = 5 * 60
+SWEEP_MIN_AGE_SECONDS = 5 * 60              # longer than the gunicorn timeout, so in-flight requests are kept
+PUBLISH_FOLDER = 'publish'
+PUBLISH_S3_BUCKET = os.environ.get('PUBLISH_S3_BUCKET')  # job and batch artifacts are published only when set
+PUBLISH_S3_ENDPOINT_URL = os.environ.get('PUBLISH_S3_ENDPOINT_URL')  # e.g. a local S3 stand-in
+PUBLISH_WORKERS = 4       # uploads running at once, per gunicorn worker
+PUBLISH_MAX_ATTEMPTS = 10
+METRICS_FOLDER = 'metrics'
+METRICS_FLUSH_SECONDS = 10   # stage metrics of a worker reach the shared database this often
+PROFILES_FOLDER = 'profiles'
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')  # profiling can only be requested when set
+PROFILE_KEEP = 20                                # captures retained, shared by all workers
+PROFILE_ID_PATTERN = re.compile(r"[0-9A-Za-z_]+")
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
+app.config['CACHE_FOLDER'] = CACHE_FOLDER
+app.config['JOBS_FOLDER'] = JOBS_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+app.config['MAX_DECOMPRESSED_CSV_LENGTH'] = MAX_DECOMPRESSED_CSV_LENGTH
+app.config['IN_MEMORY_UPLOAD_MAX_BYTES'] = IN_MEMORY_UPLOAD_MAX_BYTES
+app.config['MAX_BATCH_PAIRS'] = MAX_BATCH_PAIRS
+app.config['MAX_BATCH_CONTENT_LENGTH'] = MAX_BATCH_CONTENT_LENGTH
+app.config['MAX_BATCH_UNCOMPRESSED_LENGTH'] = MAX_BATCH_UNCOMPRESSED_LENGTH
 
 # Create necessary folders
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
+# Parsed agreements keyed by a hash of the uploaded DOCX bytes
+agreement_cache = AgreementCache(CACHE_FOLDER,
+                                 max_disk_bytes=AGREEMENT_CACHE_MAX_DISK_BYTES,
+                                 max_memory_entries=AGREEMENT_CACHE_MAX_MEMORY_ENTRIES,
+                                 max_memory_bytes=AGREEMENT_CACHE_MAX_MEMORY_BYTES)
+
+# Agreements registered through /api/agreements, kept hot under their own budget
+agreement_registry = AgreementCache(os.path.join(CACHE_FOLDER, 'registry'),
+                                    max_disk_bytes=AGREEMENT_REGISTRY_MAX_DISK_BYTES,
+                                    max_memory_entries=AGREEMENT_REGISTRY_MAX_MEMORY_ENTRIES,
+                                    max_memory_bytes=AGREEMENT_REGISTRY_MAX_MEMORY_BYTES)
+
+# Background reconciliations submitted through /api/jobs; batches get their own
+# runner, so a batch waiting for the host's pool never holds up single jobs
+job_store = JobStore(JOBS_FOLDER)
+job_runner = JobRunner(job_store, max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING)
+batch_job_runner = JobRunner(job_store, max_workers=1, max_pending=BATCH_JOB_MAX_PENDING)
+
+# Every worker sweeps expired request workspaces and job directories in the background
+workspace_sweeper = WorkspaceSweeper(UPLOAD_FOLDER, ttl_seconds=WORKSPACE_TTL_SECONDS,
+                                     max_bytes=WORKSPACE_MAX_BYTES,
+                                     min_age_seconds=SWEEP_MIN_AGE_SECONDS)
+job_sweeper = WorkspaceSweeper(JOBS_FOLDER, ttl_seconds=JOB_TTL_SECONDS, max_bytes=JOBS_MAX_BYTES,
+                               min_age_seconds=SWEEP_MIN_AGE_SECONDS,
+                               keep=[JOB_DATABASE_NAME, f"{JOB_DATABASE_NAME}-wal", f"{JOB_DATABASE_NAME}-shm",
+                                     BATCH_LOCK_NAME],
+                               is_active=job_store.is_active, on_remove=job_store.delete)
+workspace_sweeper.start(SWEEP_INTERVAL_SECONDS)
+job_sweeper.start(SWEEP_INTERVAL_SECONDS)
+
+# Pipeline stage timings of every worker (and batch pool process), aggregated in memory,
+# flushed to one shared database and served by /metrics
+stage_metrics = StageMetrics(METRICS_FOLDER)
+add_stage_observer(stage_metrics.observe)
+stage_metrics.start(METRICS_FLUSH_SECONDS)
+
+# Opt-in cProfile/tracemalloc captures of single runs (X-Profile-Token header)
+profile_capture = ProfileCapture(PROFILES_FOLDER, keep=PROFILE_KEEP)
+
+# Process pool for /api/batch jobs; pool processes share the agreement cache's disk layer,
+# and the lock file keeps every worker's runner to one pool on the host
+batch_runner = BatchRunner(max_workers=BATCH_WORKERS, cache_dir=CACHE_FOLDER, metrics_dir=METRICS_FOLDER,
+                           lock_path=os.path.join(JOBS_FOLDER, BATCH_LOCK_NAME))
+
+# Finished artifacts are copied into a journaled spool and uploaded in the background;
+# every worker drains the shared journal, including entries left by a crashed one
+publish_queue = None
+if PUBLISH_S3_BUCKET:
+    publish_queue = PublishQueue(PUBLISH_FOLDER, s3_publisher(PUBLISH_S3_BUCKET, PUBLISH_S3_ENDPOINT_URL),
+                                 max_workers=PUBLISH_WORKERS, max_attempts=PUBLISH_MAX_ATTEMPTS)
+    publish_queue.start()
+
+
+def request_workspace():
+    """Scratch directory of the current request, created on first use and removed when the request ends"""
+    if 'workspace' not in g:
+        g.workspace = create_workspace(app.config['UPLOAD_FOLDER'])
+    return g.workspace
+
+
+@app.teardown_request
+def remove_request_workspace(exc):
+    """Remove the request's scratch directory, whether the request failed or not"""
+    workspace = g.pop('workspace', None)
+    if workspace is not None:
+        shutil.rmtree(workspace, ignore_errors=True)
+
 
 def allowed_file(filename):
     """Check if the file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return any(filename.lower().endswith(f'.{ext}') for ext in ALLOWED_EXTENSIONS)
 
 
 def extract_text_from_docx(docx_path):
@@ -150,110 +302,730 @@ def index():
     })
 
 
+class UploadError(Exception):
+    """Invalid upload request, returned to the client as JSON with its status code"""
+    
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def read_upload_request():
+    """
+    Validate the form fields shared by /api/upload and /api/jobs
+    
+    Returns:
+        Dict with csv_file, docx_file (None for a registered agreement),
+        agreement_id, agreement_grouped, artifacts, format and split
+    
+    Raises:
+        UploadError: if a field is missing or invalid
+    """
+    agreement_id = request.form.get('agreement_id', '').strip()
+    options = read_report_request()
+    
+    # Check if files are present in request
+    if 'csv_file' not in request.files or (not agreement_id and 'docx_file' not in request.files):
+        raise UploadError('Both docx_file (or agreement_id) and csv_file are required')
+    
+    csv_file = request.files['csv_file']
+    docx_file = None if agreement_id else request.files['docx_file']
+    
+    validate_input_files(docx_file, csv_file)
+    
+    # Registered agreements are already parsed and grouped
+    agreement_grouped = None
+    if agreement_id:
+        agreement_grouped = lookup_registered_agreement(agreement_id)
+        if agreement_grouped is None:
+            raise UploadError(f'Unknown or evicted agreement_id: {agreement_id}. Register the agreement again.', 404)
+    
+    return {
+        'csv_file': csv_file,
+        'docx_file': docx_file,
+        'agreement_id': agreement_id,
+        'agreement_grouped': agreement_grouped,
+        **options,
+    }
+
+
+def read_report_request():
+    """
+    Validate the optional artifacts, format and split form fields
+    
+    Returns:
+        Dict with artifacts, format and split
+    
+    Raises:
+        UploadError: if a value is unknown
+    """
+    artifacts = [name.strip() for value in request.form.getlist('artifacts')
+                 for name in value.split(',') if name.strip()] or list(dmv.REPORT_ARTIFACTS)
+    output_format = request.form.get('format', 'xlsx').strip().lower()
+    split = request.form.get('split', 'sheets').strip().lower()
+    unknown = [name for name in artifacts if name not in dmv.REPORT_ARTIFACTS]
+    if unknown or output_format not in dmv.REPORT_FORMATS or split not in ('sheets', 'workbooks'):
+        raise UploadError(f'Unknown artifacts, format or split. artifacts: {", ".join(dmv.REPORT_ARTIFACTS)}; '
+                          f'format: {", ".join(dmv.REPORT_FORMATS)}; split: sheets, workbooks')
+    return {
+        'artifacts': artifacts,
+        'format': output_format,
+        'split': split,
+    }
+
+
+def validate_input_files(docx_file, csv_file):
+    """
+    Check the names of an uploaded agreement (None for a registered one) and attendance file
+    
+    Raises:
+        UploadError: if a file is missing or has the wrong type
+    """
+    # Validate files
+    if (docx_file is not None and docx_file.filename == '') or csv_file.filename == '':
+        raise UploadError('No file selected')
+    
+    if (docx_file is not None and not allowed_file(docx_file.filename)) or not allowed_file(csv_file.filename):
+        raise UploadError('Invalid file type. Only DOCX, CSV, Parquet and Feather files are allowed')
+    
+    # Validate file extensions match expected types
+    if docx_file is not None and not docx_file.filename.lower().endswith(('.docx',) + COLUMNAR_EXTENSIONS):
+        raise UploadError('docx_file must be a DOCX, Parquet or Feather file')
+    
+    if not (is_csv_file(csv_file.filename) or is_columnar_file(csv_file.filename)):
+        raise UploadError('csv_file must be a CSV, Parquet or Feather file')
+
+
+def save_upload(file, folder):
+    """Save an uploaded file under a timestamped name and return its path"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(folder, secure_filename(f"{timestamp}_{file.filename}"))
+    file.save(path)
+    return path
+
+
+def build_reconciliation(csv_source, artifacts, docx_source=None, agreement_grouped=None,
+                         csv_name=None, docx_name=None, on_stage=None):
+    """
+    Run the extraction and merge stages of the reconciliation pipeline
+    
+    Args:
+        csv_source: Attendance file, as a path or a binary file object
+        artifacts: Artifacts that will be exported (the merge is skipped when none needs it)
+        docx_source: Agreement file as a path or binary file object (when agreement_grouped is None)
+        agreement_grouped: Grouped agreement of a registered agreement
+        csv_name: File name of an in-memory csv_source
+        docx_name: File name of an in-memory docx_source
+        on_stage: Optional callback, called with each PIPELINE_STAGES name as it starts
+    
+    Returns:
+        DataFrameMergeWithVariance ready for export
+    """
+    on_stage = on_stage or (lambda stage: None)
+    
+    on_stage('agreement')
+    if agreement_grouped is None:
+        # TASK-1 + Task-3:: indexed agreement, parsed only when its bytes are not cached yet
+        agreement_grouped = agreement_cache.get_or_load(
+            docx_source, lambda source: build_agreement_index(group_agreement_records(
+                extract_agreement_data(source, name=docx_name))))
+    agreement_grouped = build_agreement_index(agreement_grouped) # no-op when already indexed
+    
+    on_stage('attendance')
+    daily_attendance_summary_df = extract_attendance_data(
+        csv_source, chunksize=ATTENDANCE_CHUNKSIZE,
+        max_decompressed_bytes=app.config['MAX_DECOMPRESSED_CSV_LENGTH'], name=csv_name) # TASK-2
+    
+    # Create merger and process (AS GENERIC CLASS DEFINED IN data_merge_with_variance.py NOTE: parameter, variables are hardcoded for now)
+    merger = dmv.DataFrameMergeWithVariance(daily_attendance_summary_df, "Time & Attendance Summary", # df1
+                                       agreement_grouped, "SES-Invoice",                          # df2
+                                       ['uid', 'servicesPerformed'],                              # key columns
+                                       lookup_keys=agreement_lookup_keys)                         # hash join on the agreement index
+    
+    on_stage('merge')
+    if {'calculation', 'comparison'} & set(artifacts):
+        merger.merge_dataframes()
+    return merger
+
+
+def report_options(upload):
+    """export_report keyword arguments for a validated upload request"""
+    return {
+        'artifacts': upload['artifacts'],
+        'formats': [upload['format']],
+        'split_workbooks': upload['split'] == 'workbooks',
+    }
+
+
+def write_report_zip(reports, target):
+    """Zip report files into target (a path or a binary stream); reports maps file names to paths or buffers"""
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, report in reports.items():
+            if isinstance(report, str):
+                archive.write(report, arcname=name)
+            else:
+                with archive.open(name, 'w') as entry:
+                    shutil.copyfileobj(report, entry)
+
+
 @app.route('/api/upload', methods=['POST'])
 def upload_files():
     """
     Upload DOCX and CSV files, process them, and return XLSX file
     
     Expected form data:
-    - docx_file: DOCX file
-    - csv_file: CSV file
+    - docx_file: DOCX file, or Parquet/Feather agreement records (uid, systemHours, servicesPerformed)
+    - agreement_id: id returned by POST /api/agreements (instead of docx_file)
+    - csv_file: CSV (.csv, .csv.gz, .csv.zst, .csv.bz2), Parquet or Feather attendance file
+    - artifacts: optional, comma separated subset of df1, df2, calculation, comparison
+      (default: all); only these are computed and returned
+    - format: optional, one of xlsx (default), csv, parquet, json; csv/parquet/json
+      return one file per artifact, zipped when there are several
+    - split: optional, 'sheets' (default) continues sheets past Excel's row limit on
+      numbered sheets, 'workbooks' returns a zip of workbooks instead
+    
+    Uploads are read straight from the request and the report is built in
+    memory; only requests above IN_MEMORY_UPLOAD_MAX_BYTES are spooled to a
+    temporary file. Large reconciliations should use POST /api/jobs instead.
+    
+    With an X-Profile-Token header matching PROFILE_TOKEN the request is
+    profiled; the X-Profile-Id response header names the capture
+    (see GET /api/profiles).
     """
     try:
-        # Check if files are present in request
-        if 'docx_file' not in request.files or 'csv_file' not in request.files:
-            return jsonify({
-                'error': 'Both docx_file and csv_file are required'
-            }), 400
+        profile = profiling_requested()
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    if not profile:
+        return reconcile_upload()
+    
+    with profile_capture.capture('upload') as profile_id:
+        response = make_response(reconcile_upload())
+    if profile_id is not None:
+        response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def reconcile_upload():
+    """Body of /api/upload: reconcile the uploaded pair and return the report"""
+    try:
+        upload = read_upload_request()
+        csv_file, docx_file = upload['csv_file'], upload['docx_file']
         
-        docx_file = request.files['docx_file']
-        csv_file = request.files['csv_file']
+        merger = build_reconciliation(csv_file.stream, upload['artifacts'],
+                                      docx_source=docx_file.stream if docx_file is not None else None,
+                                      agreement_grouped=upload['agreement_grouped'],
+                                      csv_name=csv_file.filename,
+                                      docx_name=docx_file.filename if docx_file is not None else None)
         
-        # Validate files
-        if docx_file.filename == '' or csv_file.filename == '':
-            return jsonify({
-                'error': 'No file selected'
-            }), 400
+        # Generate only the requested artifacts (XLSX sheets or one file per artifact), in memory
+        reports = merger.export_report_buffers("result", "totalHoursWorked", "totalSystemHours",
+                                               **report_options(upload))
         
-        if not allowed_file(docx_file.filename) or not allowed_file(csv_file.filename):
-            return jsonify({
-                'error': 'Invalid file type. Only DOCX and CSV files are allowed'
-            }), 400
+        if len(reports) == 1:
+            # Return XLSX file (or the single requested artifact)
+            name, buffer = next(iter(reports.items()))
+            return send_file(
+                buffer,
+                mimetype=REPORT_MIMETYPES[name.rsplit('.', 1)[1]],
+                as_attachment=True,
+                download_name=name
+            )
+        
+        # Several csv/parquet/json artifacts are returned as one zip
+        zip_stream = io.BytesIO()
+        write_report_zip(reports, zip_stream)
+        zip_stream.seek(0)
+        return send_file(
+            zip_stream,
+            mimetype='application/zip',
+            as_attachment=True,
+            download_name=f"result_{upload['format']}.zip"
+        )
+    
+    except UploadError as e:
+        return jsonify({
+            'error': str(e)
+        }), e.status
+    
+    except DecompressedSizeExceeded as e:
+        return jsonify({
+            'error': str(e)
+        }), 413
+    
+    except Exception as e:
+        return jsonify({
+            'error': f'Error processing files: {str(e)}'
+        }), 500
+
+
+def profiling_requested():
+    """
+    True when the request asks to be profiled with the configured token
+    
+    Raises:
+        UploadError: A profiling token was sent but profiling is disabled or the token is wrong
+    """
+    token = request.headers.get('X-Profile-Token')
+    if token is None:
+        return False
+    if not PROFILE_TOKEN or not hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+        raise UploadError('Profiling is not enabled or the profiling token is wrong', 403)
+    return True
+
+
+def publish_artifact(path, key):
+    """Queue an artifact for upload when publishing is configured; returns the object key or None"""
+    if publish_queue is None:
+        return None
+    publish_queue.enqueue(path, key)
+    return key
+
+
+def run_job(job_id, upload, csv_path, docx_path, on_stage):
+    """Run a queued reconciliation inside its job directory and return the artifact path"""
+    job_dir = job_store.job_dir(job_id)
+    try:
+        merger = build_reconciliation(csv_path, upload['artifacts'], docx_source=docx_path,
+                                      agreement_grouped=upload['agreement_grouped'], on_stage=on_stage)
+        on_stage('export')
+        output_paths = merger.export_report(os.path.join(job_dir, "result"), "totalHoursWorked",
+                                            "totalSystemHours", **report_options(upload))
+    finally:
+        for path in (csv_path, docx_path):
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+    
+    if len(output_paths) == 1:
+        artifact = output_paths[0]
+    else:
+        artifact = os.path.join(job_dir, f"result_{upload['format']}.zip")
+        write_report_zip({os.path.basename(path): path for path in output_paths}, artifact)
+        for path in output_paths:
+            os.remove(path)
+    
+    publish_artifact(artifact, f"jobs/{job_id}/{os.path.basename(artifact)}")
+    return artifact
+
+
+def run_profiled(profile_id, task, on_stage):
+    """Run a job task inside a profile capture named profile_id"""
+    with profile_capture.capture('job', profile_id=profile_id):
+        return task(on_stage)
+
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue a reconciliation and return its job id without waiting for it
+    
+    Accepts the same form data as /api/upload. Poll GET /api/jobs/<job_id>
+    for status and per-stage progress, then download the report from
+    GET /api/jobs/<job_id>/artifact.
+    """
+    try:
+        profile = profiling_requested()
+        upload = read_upload_request()
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    
+    params = {
+        'csvFile': upload['csv_file'].filename,
+        'docxFile': upload['docx_file'].filename if upload['docx_file'] is not None else None,
+        'agreementId': upload['agreement_id'] or None,
+        'artifacts': upload['artifacts'],
+        'format': upload['format'],
+        'split': upload['split'],
+        'profile': profile,
+    }
+    job_id = job_store.create(PIPELINE_STAGES, params)
+    job_dir = job_store.job_dir(job_id)
+    csv_path = save_upload(upload['csv_file'], job_dir)
+    docx_path = save_upload(upload['docx_file'], job_dir) if upload['docx_file'] is not None else None
+    
+    task = lambda on_stage: run_job(job_id, upload, csv_path, docx_path, on_stage)
+    if profile:
+        task = lambda on_stage, run=task: run_profiled(f"job_{job_id}", run, on_stage)
+    if not job_runner.submit(job_id, task):
+        shutil.rmtree(job_dir, ignore_errors=True)
+        job_store.delete(job_id)
+        response = jsonify({'error': 'Too many queued jobs, retry later'})
+        response.headers['Retry-After'] = str(JOB_RETRY_AFTER_SECONDS)
+        return response, 503
+    
+    response = {
+        'jobId': job_id,
+        'status': 'queued',
+        'statusUrl': f'/api/jobs/{job_id}',
+        'artifactUrl': f'/api/jobs/{job_id}/artifact'
+    }
+    if profile:
+        response['profileId'] = f"job_{job_id}"
+    return jsonify(response), 202
+
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """List recent jobs, newest first"""
+    return jsonify({'jobs': job_store.list()})
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status and per-stage progress of a job"""
+    job = job_store.get(job_id) if JOB_ID_PATTERN.fullmatch(job_id) else None
+    if job is None:
+        return jsonify({'error': f'Unknown job_id: {job_id}'}), 404
+    return jsonify(job)
+
+
+@app.route('/api/jobs/<job_id>/artifact', methods=['GET'])
+def get_job_artifact(job_id):
+    """Download the report of a finished job"""
+    job = job_store.get(job_id) if JOB_ID_PATTERN.fullmatch(job_id) else None
+    if job is None:
+        return jsonify({'error': f'Unknown job_id: {job_id}'}), 404
+    if job['status'] != 'succeeded':
+        return jsonify({'error': f'Job is {job["status"]}', 'status': job['status']}), 409
+    
+    artifact_path = job_store.artifact_path(job_id)
+    return send_file(
+        os.path.abspath(artifact_path),
+        mimetype=REPORT_MIMETYPES[artifact_path.rsplit('.', 1)[1]],
+        as_attachment=True,
+        download_name=os.path.basename(artifact_path)
+    )
+
+
+def extract_batch_archive(archive_file, target_dir):
+    """
+    Unpack the paired agreement/attendance files of a batch zip into target_dir
+    
+    Returns:
+        Pairs keyed by site with the extracted paths, and the pairing problems
+    
+    Raises:
+        UploadError: if the archive is invalid or expands too far
+    """
+    try:
+        archive = zipfile.ZipFile(archive_file.stream)
+    except zipfile.BadZipFile:
+        raise UploadError('archive must be a zip file')
+    
+    with archive:
+        members = {}
+        for info in archive.infolist():
+            # member names are rebuilt from sanitised parts, so nothing lands outside target_dir
+            parts = [secure_filename(part) for part in info.filename.split('/')]
+            parts = [part for part in parts if part]
+            if info.is_dir() or not parts or info.filename.startswith('__MACOSX/') or parts[-1].startswith('.'):
+                continue
+            members['/'.join(parts)] = info
         
-        # Validate file extensions match expected types
-        if not docx_file.filename.lower().endswith('.docx'):
+        pairs, problems = pair_input_files(list(members))
+        paired = [members[name] for pair in pairs.values() for name in pair.values()]
+        if sum(info.file_size for info in paired) > app.config['MAX_BATCH_UNCOMPRESSED_LENGTH']:
+            raise UploadError(f'Batch archive expands beyond {app.config["MAX_BATCH_UNCOMPRESSED_LENGTH"]} bytes', 413)
+        
+        paths = {}
+        for name, info in members.items():
+            if info not in paired:
+                continue
+            paths[name] = os.path.join(target_dir, *name.split('/'))
+            os.makedirs(os.path.dirname(paths[name]), exist_ok=True)
+            with archive.open(info) as source, open(paths[name], 'wb') as target:
+                shutil.copyfileobj(source, target)
+    
+    return {site: {role: paths[name] for role, name in pair.items()} for site, pair in pairs.items()}, problems
+
+
+def save_batch_pairs(docx_files, csv_files, target_dir):
+    """
+    Save repeated docx_file/csv_file fields into target_dir, pairing them by position
+    
+    Returns:
+        Pairs keyed by site (from the attendance file name) with the saved paths
+    
+    Raises:
+        UploadError: if the fields do not pair up or a file has the wrong type
+    """
+    if not csv_files or len(docx_files) != len(csv_files):
+        raise UploadError('Send an archive, or the same number of docx_file and csv_file fields')
+    
+    pairs = {}
+    for number, (docx_file, csv_file) in enumerate(zip(docx_files, csv_files), start=1):
+        validate_input_files(docx_file, csv_file)
+        site = secure_filename(pair_key(csv_file.filename)) or f'pair{number}'
+        if site in pairs:
+            site = f'{site}_{number}'
+        site_dir = os.path.join(target_dir, site)
+        os.makedirs(site_dir)
+        pairs[site] = {}
+        for role, file in (('agreement', docx_file), ('attendance', csv_file)):
+            pairs[site][role] = os.path.join(site_dir, secure_filename(file.filename) or role)
+            file.save(pairs[site][role])
+    return pairs
+
+
+def run_batch_job(job_id, pairs, problems, options, on_stage):
+    """Reconcile the pairs of a queued batch and bundle the reports with a manifest; returns the bundle path"""
+    job_dir = job_store.job_dir(job_id)
+    results_dir = os.path.join(job_dir, 'results')
+    try:
+        on_stage('pool')
+        started = datetime.now()
+        entries = batch_runner.run(pairs, results_dir, {
+            **report_options(options),
+            'attendance_chunksize': ATTENDANCE_CHUNKSIZE,
+            'max_decompressed_bytes': app.config['MAX_DECOMPRESSED_CSV_LENGTH'],
+        }, on_start=lambda: on_stage('reconcile'))
+        succeeded = sum(entry['status'] == PAIR_SUCCEEDED for entry in entries)
+        print(f"✓ Batch of {len(entries)} pairs: {succeeded} succeeded, {len(entries) - succeeded} failed")
+        
+        on_stage('bundle')
+        manifest = {
+            'createdAt': started.isoformat(timespec='seconds'),
+            'seconds': round((datetime.now() - started).total_seconds(), 3),
+            'pairs': len(entries),
+            'succeeded': succeeded,
+            'failed': len(entries) - succeeded,
+            'skipped': problems,
+            'results': entries,
+        }
+        bundle_path = os.path.join(job_dir, f"batch_{started.strftime('%Y%m%d_%H%M%S')}.zip")
+        with zipfile.ZipFile(bundle_path, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            bundle.writestr(BATCH_MANIFEST_NAME, json.dumps(manifest, indent=2))
+            for entry in entries:
+                for name in entry.get('files', []):
+                    bundle.write(os.path.join(results_dir, entry['site'], name),
+                                 arcname=f"{entry['site']}/{name}")
+    finally:
+        # only the bundle is kept with the job
+        for path in (os.path.join(job_dir, 'inputs'), results_dir):
+            shutil.rmtree(path, ignore_errors=True)
+    
+    publish_artifact(bundle_path, f"batch/{job_id}/{os.path.basename(bundle_path)}")
+    return bundle_path
+
+
+@app.route('/api/batch', methods=['POST'])
+def batch_upload():
+    """
+    Queue the reconciliation of many agreement/attendance pairs and return its job id
+    
+    Expected form data, either:
+    - archive: zip file with the pairs, matched by site name, e.g.
+      site01_agreement.docx + site01_attendance.csv, or
+      site01/agreement.docx + site01/attendance.csv.gz
+    or:
+    - docx_file, csv_file: repeated fields; the n-th docx_file goes with the n-th csv_file
+    plus the optional artifacts, format and split fields of /api/upload.
+    
+    The pairs are saved into a job directory and reconciled in the background
+    on the host's batch process pool, so a batch of hundreds of pairs is not
+    bound by the request timeout. Poll GET /api/jobs/<job_id>, then download
+    GET /api/jobs/<job_id>/artifact: a zip holding <site>/<report files> for
+    every pair and manifest.json with each pair's status; a pair that fails
+    is reported there and does not stop the others.
+    """
+    # batches are allowed to be larger than single uploads
+    request.max_content_length = app.config['MAX_BATCH_CONTENT_LENGTH']
+    job_id = None
+    try:
+        options = read_report_request()
+        archive = request.files.get('archive')
+        docx_files = request.files.getlist('docx_file')
+        csv_files = request.files.getlist('csv_file')
+        
+        job_id = job_store.create(BATCH_STAGES, {
+            'archive': archive.filename if archive is not None and archive.filename else None,
+            'artifacts': options['artifacts'],
+            'format': options['format'],
+            'split': options['split'],
+        })
+        inputs_dir = os.path.join(job_store.job_dir(job_id), 'inputs')
+        if archive is not None and archive.filename:
+            pairs, problems = extract_batch_archive(archive, inputs_dir)
+        else:
+            pairs, problems = save_batch_pairs(docx_files, csv_files, inputs_dir), []
+        if not pairs:
+            raise UploadError('No agreement/attendance pairs found. ' + '; '.join(problems))
+        if len(pairs) > app.config['MAX_BATCH_PAIRS']:
+            raise UploadError(f'At most {app.config["MAX_BATCH_PAIRS"]} pairs per batch', 413)
+    
+    except UploadError as e:
+        discard_job(job_id)
+        return jsonify({
+            'error': str(e)
+        }), e.status
+    
+    except Exception as e:
+        discard_job(job_id)
+        return jsonify({
+            'error': f'Error processing batch: {str(e)}'
+        }), 500
+    
+    task = lambda on_stage: run_batch_job(job_id, pairs, problems, options, on_stage)
+    if not batch_job_runner.submit(job_id, task):
+        discard_job(job_id)
+        response = jsonify({'error': 'Too many queued batches, retry later'})
+        response.headers['Retry-After'] = str(JOB_RETRY_AFTER_SECONDS)
+        return response, 503
+    
+    return jsonify({
+        'jobId': job_id,
+        'status': 'queued',
+        'pairs': len(pairs),
+        'skipped': problems,
+        'statusUrl': f'/api/jobs/{job_id}',
+        'artifactUrl': f'/api/jobs/{job_id}/artifact'
+    }), 202
+
+
+def discard_job(job_id):
+    """Remove a job that was never queued, with its directory"""
+    if job_id is None:
+        return
+    shutil.rmtree(job_store.job_dir(job_id), ignore_errors=True)
+    job_store.delete(job_id)
+
+
+def lookup_registered_agreement(agreement_id):
+    """Return the grouped frame of a registered agreement, or None if unknown/evicted"""
+    if not AGREEMENT_ID_PATTERN.fullmatch(agreement_id):
+        return None
+    return agreement_registry.get(agreement_id)
+
+
+@app.route('/api/agreements', methods=['POST'])
+def register_agreement():
+    """
+    Register a DOCX agreement once and return its id
+    
+    Expected form data:
+    - docx_file: DOCX file, or Parquet/Feather agreement records
+    
+    The id is the SHA-256 of the file, so registering the same file twice
+    returns the same id.
+    """
+    try:
+        if 'docx_file' not in request.files or request.files['docx_file'].filename == '':
             return jsonify({
-                'error': 'docx_file must be a DOCX file'
+                'error': 'docx_file is required'
             }), 400
         
-        if not csv_file.filename.lower().endswith('.csv'):
+        docx_file = request.files['docx_file']
+        if not docx_file.filename.lower().endswith(('.docx',) + COLUMNAR_EXTENSIONS):
             return jsonify({
-                'error': 'csv_file must be a CSV file'
+                'error': 'docx_file must be a DOCX, Parquet or Feather file'
             }), 400
         
-        # Save uploaded files
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        docx_filename = secure_filename(f"{timestamp}_{docx_file.filename}")
-        csv_filename = secure_filename(f"{timestamp}_{csv_file.filename}")
-        
-        docx_path = os.path.join(app.config['UPLOAD_FOLDER'], docx_filename)
-        csv_path = os.path.join(app.config['UPLOAD_FOLDER'], csv_filename)
-        
-        # need to save the uploaded files to disk for processing
-        docx_file.save(docx_path)
-        csv_file.save(csv_path)
-        
-        # Process files
-        #docx_content = extract_text_from_docx(docx_path)
-        #csv_df = read_csv_data(csv_path)
-        agreement_ref = extract_agreement_data(docx_path) # TASK-1
-        daily_attendance_summary_df = extract_attendance_data(csv_path) # TASK-2
-        
-        # Task-3:: Convert agreement records to DataFrame for comparison
-        agreement_ref_df = pd.DataFrame(agreement_ref['records'])
-
-        # Group agreement data by uid and servicesPerformed to get max allowed hours and remove duplicates
-        agreement_grouped = agreement_ref_df.groupby(['uid', 'servicesPerformed']).agg(
-            totalSystemHours = ('systemHours', 'sum'), # assuming systemHours in agreement is the max allowed
-            allServicesPerformed = ('servicesPerformed', lambda x: ', '.join(x.unique()))
-        ).reset_index()
-        
-        # Create merger and process (AS GENERIC CLASS DEFINED IN data_merge_with_variance.py NOTE: parameter, variables are hardcoded for now)
-        merger = dmv.DataFrameMergeWithVariance(daily_attendance_summary_df, "Time & Attendance Summary", # df1
-                                           agreement_grouped, "SES-Invoice",                          # df2
-                                           ['uid', 'servicesPerformed'])                              # key columns
-        merger.merge_dataframes()
-        # merger.merged_df.to_csv(file)
-        merger.calculate_variance("totalHoursWorked", "totalSystemHours")
-        merger.get_variance_summary()
+        # read straight from the upload stream, nothing is saved
+        agreement_id = file_digest(docx_file.stream)
+        metadata = agreement_registry.metadata(agreement_id)
+        if metadata is not None and agreement_registry.get(agreement_id) is not None:
+            return jsonify({'agreementId': agreement_id, **metadata}), 200
         
-        # Generate XLSX
-        #output_filename = f"output_{timestamp}.xlsx"
-        output_filename = f"result.xlsx"
-        output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+        agreement_ref = extract_agreement_data(docx_file.stream, name=docx_file.filename) # TASK-1
+        agreement_grouped = build_agreement_index(group_agreement_records(agreement_ref)) # Task-3
         
-        merger.export_to_xlsx(output_path, "totalHoursWorked", "totalSystemHours")
-        
-        #generate_xlsx(docx_content, csv_df, output_path)
-        
-        # Clean up uploaded files (optional)
-        os.remove(docx_path)
-        os.remove(csv_path)
-        
-        # Return XLSX file
-        return send_file(
-            output_path,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=output_filename
-        )
+        metadata = {
+            'documentName': docx_file.filename,
+            'totalRecord': agreement_ref['totalRecord'],
+            'skippedRecord': len(agreement_ref['skippedRecords']),
+            'groupedRecord': len(agreement_grouped),
+            'registeredAt': datetime.now().isoformat(timespec='seconds')
+        }
+        agreement_registry.put(agreement_id, agreement_grouped, metadata)
+        return jsonify({'agreementId': agreement_id, **metadata}), 201
     
     except Exception as e:
         return jsonify({
-            'error': f'Error processing files: {str(e)}'
+            'error': f'Error registering agreement: {str(e)}'
         }), 500
 
 
+@app.route('/api/agreements', methods=['GET'])
+def list_agreements():
+    """List registered agreements, most recently used first"""
+    agreements = [{'agreementId': entry.pop('digest'), **entry} for entry in agreement_registry.entries()]
+    return jsonify({
+        'agreements': agreements,
+        'stats': agreement_registry.stats()
+    })
+
+
+@app.route('/api/agreements/<agreement_id>', methods=['GET'])
+def get_agreement(agreement_id):
+    """Details of a registered agreement"""
+    metadata = agreement_registry.metadata(agreement_id) if AGREEMENT_ID_PATTERN.fullmatch(agreement_id) else None
+    if metadata is None:
+        return jsonify({'error': f'Unknown or evicted agreement_id: {agreement_id}'}), 404
+    return jsonify({'agreementId': agreement_id, **metadata})
+
+
+@app.route('/api/agreements/<agreement_id>', methods=['DELETE'])
+def delete_agreement(agreement_id):
+    """Unregister an agreement"""
+    if not AGREEMENT_ID_PATTERN.fullmatch(agreement_id) or not agreement_registry.remove(agreement_id):
+        return jsonify({'error': f'Unknown or evicted agreement_id: {agreement_id}'}), 404
+    return jsonify({'agreementId': agreement_id, 'status': 'deleted'})
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Agreement cache hit/miss counters for the worker serving the request"""
+    return jsonify(agreement_cache.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage latency histograms, row counters and process peak RSS, totalled across all workers (Prometheus text format)"""
+    return app.response_class(render_prometheus(stage_metrics.snapshot()),
+                              mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """Retained profile captures, newest first (requires the X-Profile-Token header)"""
+    try:
+        if not profiling_requested():
+            raise UploadError('X-Profile-Token header required', 401)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    return jsonify({'profiles': profile_capture.list()})
+
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Download a profile capture as a zip (requires the X-Profile-Token header)"""
+    try:
+        if not profiling_requested():
+            raise UploadError('X-Profile-Token header required', 401)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    
+    path = profile_capture.path(profile_id) if PROFILE_ID_PATTERN.fullmatch(profile_id) else None
+    if path is None:
+        return jsonify({'error': f'Unknown profile_id: {profile_id}'}), 404
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        for name in sorted(os.listdir(path)):
+            bundle.write(os.path.join(path, name), arcname=f"{profile_id}/{name}")
+    archive.seek(0)
+    return send_file(archive, mimetype='application/zip', as_attachment=True,
+                     download_name=f"profile_{profile_id}.zip")
+
+
+@app.route('/api/publish', methods=['GET'])
+def publish_status():
+    """Artifacts waiting to be published, and the publish counters of the worker serving the request"""
+    if publish_queue is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, 'bucket': PUBLISH_S3_BUCKET, **publish_queue.stats(),
+                    'entries': publish_queue.pending()})
+
+
 @app.route('/api/upload-stream', methods=['POST'])
 def upload_files_stream():
     """
@@ -262,7 +1034,7 @@ def upload_files_stream():
     
     Expected form data:
     - docx_file: DOCX file
-    - csv_file: CSV file
+    - csv_file: CSV file (.csv.gz, .csv.zst and .csv.bz2 are decompressed as a stream)
     """
     try:
         # Check if files are present in request
@@ -295,7 +1067,12 @@ def upload_files_stream():
                 docx_content.append(' | '.join(row_data))
         
         # Process CSV from memory
-        csv_stream = io.BytesIO(csv_file.read())
+        compression = csv_compression(csv_file.filename)
+        if compression is not None:
+            csv_stream = open_csv_stream(csv_file.stream, compression,
+                                         app.config['MAX_DECOMPRESSED_CSV_LENGTH'])
+        else:
+            csv_stream = io.BytesIO(csv_file.read())
         csv_df = pd.read_csv(csv_stream)
         
         # Generate XLSX in memory
@@ -375,6 +1152,11 @@ def upload_files_stream():
             download_name=output_filename
         )
     
+    except DecompressedSizeExceeded as e:
+        return jsonify({
+            'error': str(e)
+        }), 413
+    
     except Exception as e:
         return jsonify({
             'error': f'Error processing files: {str(e)}'
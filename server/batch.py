@@ -0,0 +1,227 @@
+"""
+Batch reconciliation of many agreement/attendance pairs on a process pool.
+
+/api/batch queues every site of a month-end batch as one background job and
+hands its pairs to a pool of worker processes instead of one HTTP round-trip
+per site. Each pool process has its own AgreementCache on the shared cache
+directory, so an agreement parsed by any worker is not parsed again.
+
+Every gunicorn worker has its own BatchRunner, but a runner only starts its
+pool while it holds a host-wide lock file, and stops it when the batch is
+done. So one batch runs per host at a time, on one pool sized to the CPUs,
+instead of one pool per gunicorn worker competing for the same cores.
+
+Every pair reports its own status: an exception in one pair, or even a pool
+process dying, never aborts the others.
+
+This module must not import app.py: pool processes are spawned (the gunicorn
+worker has threads, so forking is not safe) and import only what they need.
+"""
+import fcntl
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import DataFrameMergeWithVariance as dmv
+from agreement_cache import AgreementCache
+from metrics import StageMetrics, add_stage_observer
+from process import (agreement_lookup_keys, build_agreement_index, extract_agreement_data,
+                     extract_attendance_data, group_agreement_records)
+
+
+BATCH_MANIFEST_NAME = "manifest.json"
+PAIR_SUCCEEDED = "succeeded"
+PAIR_FAILED = "failed"
+
+_agreement_cache: Optional[AgreementCache] = None   # one per pool process
+_stage_metrics: Optional[StageMetrics] = None
+
+
+def _init_pool_process(cache_dir: Optional[str], metrics_dir: Optional[str]) -> None:
+    global _agreement_cache, _stage_metrics
+    if cache_dir:
+        _agreement_cache = AgreementCache(cache_dir)
+    if metrics_dir:
+        _stage_metrics = StageMetrics(metrics_dir)
+        add_stage_observer(_stage_metrics.observe)
+
+
+def _load_agreement(path: str):
+    return build_agreement_index(group_agreement_records(extract_agreement_data(path)))
+
+
+def reconcile_pair(site: str, agreement_path: str, attendance_path: str, output_dir: str,
+                   options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reconcile one agreement/attendance pair and write its report files.
+
+    Args:
+        site: Pair name, used in the manifest
+        agreement_path: Agreement DOCX (or Parquet/Feather records)
+        attendance_path: Attendance CSV (optionally compressed), Parquet or Feather
+        output_dir: Directory for the report files of this pair
+        options: export_report keyword arguments, plus attendance_chunksize and
+            max_decompressed_bytes for extract_attendance_data
+
+    Returns:
+        Manifest entry: site, status, files written (relative to output_dir),
+        record counts, seconds, and error for a failed pair
+    """
+    started = time.perf_counter()
+    entry: Dict[str, Any] = {
+        "site": site,
+        "agreement": os.path.basename(agreement_path),
+        "attendance": os.path.basename(attendance_path),
+    }
+    try:
+        options = dict(options)
+        chunksize = options.pop("attendance_chunksize", None)
+        max_decompressed_bytes = options.pop("max_decompressed_bytes", None)
+
+        if _agreement_cache is not None:
+            agreement_grouped = _agreement_cache.get_or_load(agreement_path, _load_agreement)
+        else:
+            agreement_grouped = _load_agreement(agreement_path)
+        attendance = extract_attendance_data(attendance_path, chunksize=chunksize,
+                                             max_decompressed_bytes=max_decompressed_bytes)
+
+        merger = dmv.DataFrameMergeWithVariance(attendance, "Time & Attendance Summary",
+                                                build_agreement_index(agreement_grouped), "SES-Invoice",
+                                                ['uid', 'servicesPerformed'],
+                                                lookup_keys=agreement_lookup_keys)
+        os.makedirs(output_dir, exist_ok=True)
+        paths = merger.export_report(os.path.join(output_dir, "result"), "totalHoursWorked",
+                                     "totalSystemHours", **options)
+        entry.update({
+            "status": PAIR_SUCCEEDED,
+            "files": [os.path.basename(path) for path in paths],
+            "attendanceRecords": len(merger.df1),
+            "agreementRecords": len(merger.df2),
+            "mergedRecords": None if merger.merged_df is None else len(merger.merged_df),
+        })
+    except Exception as e:
+        entry.update({"status": PAIR_FAILED, "error": f"{type(e).__name__}: {e}"})
+    entry["seconds"] = round(time.perf_counter() - started, 3)
+    if _stage_metrics is not None:
+        # once per pair: pool processes are stopped after their batch without running atexit
+        try:
+            _stage_metrics.flush()
+        except Exception as e:
+            print(f"✗ Flushing stage metrics failed: {e}")
+    return entry
+
+
+class BatchRunner:
+    """Process pool reconciling batches of pairs, started for each batch under a host-wide lock."""
+
+    def __init__(self, max_workers: Optional[int] = None, cache_dir: Optional[str] = None,
+                 metrics_dir: Optional[str] = None, lock_path: Optional[str] = None):
+        """
+        Initialise runner.
+
+        Args:
+            max_workers: Pool processes (default: number of CPUs)
+            cache_dir: Agreement cache directory shared with the app, or None for no cache
+            metrics_dir: Stage metrics directory shared with the app, or None to not record
+            lock_path: Lock file shared by every runner on the host, so only one of them
+                runs a batch at a time; None to not coordinate with other processes
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cache_dir = cache_dir
+        self.metrics_dir = metrics_dir
+        self.lock_path = lock_path
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def run(self, pairs: Dict[str, Dict[str, str]], output_root: str,
+            options: Dict[str, Any], on_start: Optional[Callable[[], None]] = None) -> List[Dict[str, Any]]:
+        """
+        Reconcile every pair, each into output_root/<site>.
+
+        Waits until no other runner on the host is running a batch; the pool
+        processes are stopped again when this batch is done.
+
+        Args:
+            pairs: Pairs keyed by site, each with 'agreement' and 'attendance' paths
+            output_root: Directory receiving one sub-directory per site
+            options: Passed to reconcile_pair
+            on_start: Optional callback once the host lock is held and pairs start
+
+        Returns:
+            Manifest entries in site order
+        """
+        with self._host_lock():
+            if on_start is not None:
+                on_start()
+            try:
+                return self._run(pairs, output_root, options)
+            finally:
+                self._reset(wait=True)
+
+    def _run(self, pairs: Dict[str, Dict[str, str]], output_root: str,
+             options: Dict[str, Any]) -> List[Dict[str, Any]]:
+        futures = {site: self._executor().submit(reconcile_pair, site, pair["agreement"],
+                                                 pair["attendance"], os.path.join(output_root, site),
+                                                 options)
+                   for site, pair in pairs.items()}
+        entries = {}
+        crashed = []
+        for site, future in futures.items():
+            try:
+                entries[site] = future.result()
+            except BrokenProcessPool:
+                crashed.append(site)
+
+        if crashed:
+            # a pool process died (e.g. killed for memory) and took the pool down; run the
+            # affected pairs again one at a time so a pair that crashes only fails itself
+            self._reset()
+            for site in crashed:
+                pair = pairs[site]
+                with self._new_pool(1) as pool:
+                    try:
+                        entries[site] = pool.submit(reconcile_pair, site, pair["agreement"],
+                                                    pair["attendance"], os.path.join(output_root, site),
+                                                    options).result()
+                    except BrokenProcessPool:
+                        entries[site] = {"site": site, "status": PAIR_FAILED,
+                                         "agreement": os.path.basename(pair["agreement"]),
+                                         "attendance": os.path.basename(pair["attendance"]),
+                                         "error": "Worker process exited while reconciling this pair"}
+        return [entries[site] for site in pairs]
+
+    def shutdown(self) -> None:
+        """Stop the pool processes."""
+        self._reset()
+
+    @contextmanager
+    def _host_lock(self) -> Iterator[None]:
+        if self.lock_path is None:
+            yield
+            return
+        # flock is released by the kernel if this process dies, so a killed worker never
+        # leaves the host locked
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = self._new_pool(self.max_workers)
+        return self._pool
+
+    def _new_pool(self, max_workers: int) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=max_workers,
+                                   mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_pool_process, initargs=(self.cache_dir, self.metrics_dir))
+
+    def _reset(self, wait: bool = False) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
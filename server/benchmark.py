@@ -0,0 +1,274 @@
+"""
+Benchmark of the reconciliation pipeline, compared against a stored baseline.
+
+Runs extract -> merge -> variance -> export on generated inputs (see
+benchmark_data.py) of one or more sizes and records the wall time of every
+pipeline stage, from the same stage_timer instrumentation that feeds /metrics.
+Each size runs in a fresh process, so imports, caches and peak RSS of one size
+do not leak into the next, and is repeated; the median of the repeats is kept.
+
+Results are written as JSON and compared with the baseline: a stage that is
+slower than its baseline by more than the tolerance (and by more than a small
+absolute margin, so millisecond stages do not flap) is a regression, and the
+exit status is 1. Timings only compare on similar machines, so the baseline
+should be recorded where the benchmark runs before deploy:
+
+    python benchmark.py                                # 1e3, 1e4 and 1e5 punches
+    python benchmark.py --sizes 1e6 1e7 --formats parquet --repeat 1
+    python benchmark.py --update-baseline              # accept the current timings
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from benchmark_data import GENERATOR_VERSION, generate_inputs
+
+
+BENCHMARK_VERSION = 1
+DEFAULT_SIZES = ["1e3", "1e4", "1e5"]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "reconciliation-benchmark")
+TOTAL_STAGE = "total"
+
+
+def parse_size(text: str) -> int:
+    """Number of punches from '1000', '1e6' or '10_000'."""
+    size = int(float(text.replace("_", "")))
+    if size < 1:
+        raise argparse.ArgumentTypeError(f"size must be at least 1: {text}")
+    return size
+
+
+def environment() -> Dict[str, Any]:
+    """Versions and machine details stored with the results."""
+    import numpy
+    import pandas
+    import pyarrow
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+        "pyarrow": pyarrow.__version__,
+    }
+
+
+def _run_once(paths: Dict[str, str], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Reconcile the pair once, returning the manifest entry and the summed stage records."""
+    from batch import PAIR_SUCCEEDED, reconcile_pair
+    from metrics import add_stage_observer, remove_stage_observer
+
+    records = []
+    observer = records.append
+    add_stage_observer(observer)
+    try:
+        with tempfile.TemporaryDirectory(prefix="benchmark-") as output_dir:
+            started = time.perf_counter()
+            entry = reconcile_pair("benchmark", paths["agreement"], paths["attendance"], output_dir, options)
+            seconds = time.perf_counter() - started
+    finally:
+        remove_stage_observer(observer)
+    if entry["status"] != PAIR_SUCCEEDED:
+        raise RuntimeError(f"Pipeline failed: {entry.get('error')}")
+
+    # a stage may run more than once per reconciliation (e.g. one write per format)
+    stages: Dict[str, Dict[str, Any]] = {TOTAL_STAGE: {"seconds": seconds, "rowsIn": None, "rowsOut": None}}
+    for record in records:
+        stage = stages.setdefault(record.stage, {"seconds": 0.0, "rowsIn": None, "rowsOut": None})
+        stage["seconds"] += record.seconds
+        for key, rows in (("rowsIn", record.rows_in), ("rowsOut", record.rows_out)):
+            if rows is not None:
+                stage[key] = (stage[key] or 0) + rows
+    return {"entry": entry, "stages": stages}
+
+
+def benchmark_size(paths: Dict[str, str], repeat: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run the pipeline repeat times on one pair of inputs (call in a fresh process).
+
+    Returns:
+        Record counts, per-stage median/min/max seconds and rows, and peak RSS
+    """
+    from metrics import peak_rss_bytes
+
+    runs = [_run_once(paths, options) for _ in range(repeat)]
+    stages = {}
+    for stage in runs[0]["stages"]:
+        seconds = [run["stages"][stage]["seconds"] for run in runs if stage in run["stages"]]
+        stages[stage] = {
+            "seconds": round(statistics.median(seconds), 6),
+            "minSeconds": round(min(seconds), 6),
+            "maxSeconds": round(max(seconds), 6),
+            "rowsIn": runs[0]["stages"][stage]["rowsIn"],
+            "rowsOut": runs[0]["stages"][stage]["rowsOut"],
+        }
+    entry = runs[0]["entry"]
+    return {
+        "attendanceRecords": entry["attendanceRecords"],
+        "agreementRecords": entry["agreementRecords"],
+        "mergedRecords": entry["mergedRecords"],
+        "attendanceBytes": os.path.getsize(paths["attendance"]),
+        "agreementBytes": os.path.getsize(paths["agreement"]),
+        "stages": stages,
+        "peakRssBytes": peak_rss_bytes(),
+    }
+
+
+def run_benchmarks(sizes: List[int], seed: int, repeat: int, data_dir: str,
+                   options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Generate (or reuse) the inputs of every size and benchmark each in its own process.
+
+    Returns:
+        Results document: run settings, environment and per-size results keyed by punches
+    """
+    results: Dict[str, Any] = {
+        "version": BENCHMARK_VERSION,
+        "generatorVersion": GENERATOR_VERSION,
+        "createdAt": datetime.now().isoformat(timespec="seconds"),
+        "seed": seed,
+        "repeat": repeat,
+        "options": options,
+        "environment": environment(),
+        "sizes": {},
+    }
+    for size in sizes:
+        started = time.perf_counter()
+        paths = generate_inputs(data_dir, size, seed)
+        print(f"✓ Inputs for {size} punches ready in {time.perf_counter() - started:.1f}s")
+        # spawn, like the batch pool: a clean interpreter per size
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            result = pool.submit(benchmark_size, paths, repeat, options).result()
+        results["sizes"][str(size)] = {"punches": size, **result}
+        print(f"✓ {size} punches: {result['stages'][TOTAL_STAGE]['seconds']:.3f}s "
+              f"(median of {repeat}), peak RSS {(result['peakRssBytes'] or 0) / 2 ** 20:.0f} MB")
+    return results
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+            min_seconds: float) -> List[Dict[str, Any]]:
+    """
+    Compare stage timings with the baseline, size by size.
+
+    Args:
+        results: Document from run_benchmarks
+        baseline: Earlier results document
+        tolerance: Allowed slowdown as a fraction of the baseline, e.g. 0.25
+        min_seconds: Slowdowns smaller than this many seconds are never regressions
+
+    Returns:
+        One row per stage present in both: size, stage, baseline, current, change, regression
+    """
+    rows = []
+    for size, result in results["sizes"].items():
+        base_stages = baseline.get("sizes", {}).get(size, {}).get("stages", {})
+        for stage, values in result["stages"].items():
+            if stage not in base_stages:
+                continue
+            base, current = base_stages[stage]["seconds"], values["seconds"]
+            rows.append({
+                "size": int(size),
+                "stage": stage,
+                "baseline": base,
+                "current": current,
+                "change": (current - base) / base if base else None,
+                "regression": current > base * (1 + tolerance) and current - base > min_seconds,
+            })
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]], tolerance: float) -> None:
+    """Print the comparison as a table, regressions marked."""
+    print(f"\n{'punches':>10}  {'stage':<16}{'baseline':>10}{'current':>10}{'change':>9}")
+    for row in rows:
+        change = "" if row["change"] is None else f"{row['change']:+.0%}"
+        marker = f"  ✗ slower than baseline +{tolerance:.0%}" if row["regression"] else ""
+        print(f"{row['size']:>10}  {row['stage']:<16}{row['baseline']:>9.3f}s{row['current']:>9.3f}s"
+              f"{change:>9}{marker}")
+
+
+def _load_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(path: str, document: Dict[str, Any]) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the reconciliation pipeline against a baseline")
+    parser.add_argument("--sizes", nargs="+", type=parse_size, default=[parse_size(s) for s in DEFAULT_SIZES],
+                        help="Punches per attendance file, e.g. 1e3 1e5 1e7 (default: 1e3 1e4 1e5)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated inputs")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size; the median is kept")
+    parser.add_argument("--formats", nargs="+", default=["xlsx"],
+                        help="Report formats to export (xlsx at 1e7 punches takes very long)")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Read the attendance CSV in chunks of this many rows")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Cache of generated inputs")
+    parser.add_argument("--output", default="benchmark_results.json", help="Results file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown per stage as a fraction of the baseline")
+    parser.add_argument("--min-seconds", type=float, default=0.05,
+                        help="Slowdowns below this many seconds are ignored")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Store these results as the baseline of their sizes instead of comparing")
+    args = parser.parse_args(argv)
+
+    options = {"formats": args.formats}
+    if args.chunksize:
+        options["attendance_chunksize"] = args.chunksize
+    results = run_benchmarks(sorted(set(args.sizes)), args.seed, args.repeat, args.data_dir, options)
+    _write_json(args.output, results)
+    print(f"✓ Results written to {args.output}")
+
+    baseline = _load_json(args.baseline)
+    if args.update_baseline:
+        if baseline is not None:
+            results["sizes"] = {**baseline.get("sizes", {}), **results["sizes"]}
+        _write_json(args.baseline, results)
+        print(f"✓ Baseline {args.baseline} updated")
+        return 0
+    if baseline is None:
+        print(f"✗ No baseline at {args.baseline}, nothing to compare (store one with --update-baseline)")
+        return 0
+
+    for key in ("seed", "options", "generatorVersion"):
+        if baseline.get(key) != results[key]:
+            print(f"✗ Baseline was recorded with {key}={baseline.get(key)!r}, this run used {results[key]!r}")
+    if baseline.get("environment", {}).get("cpus") != results["environment"]["cpus"]:
+        print(f"✗ Baseline was recorded on {baseline.get('environment', {}).get('cpus')} CPUs, "
+              f"this machine has {results['environment']['cpus']}; timings may not compare")
+
+    rows = compare(results, baseline, args.tolerance, args.min_seconds)
+    print_comparison(rows, args.tolerance)
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"\n✗ {len(regressions)} stage(s) slower than the baseline")
+        return 1
+    print(f"\n✓ No stage slower than the baseline by more than {args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
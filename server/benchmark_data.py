@@ -0,0 +1,284 @@
+"""
+Seeded generators of agreement DOCX files and attendance CSVs for benchmarks.
+
+The same seed and size always produce the same files, so timings of two runs
+(or of a run and a stored baseline) are taken on identical inputs. The data is
+shaped like the exports the service receives:
+
+- a month of punches (November 2025) for a workforce sized to the requested
+  number of punches; every employee works most, but not all, days
+- multi-punch days: one to four punches a day separated by breaks, and night
+  shifts split at midnight into a 23:59 punch-out and a 00:00 punch-in
+- a skewed service mix; every employee mostly performs a primary service,
+  sometimes a secondary one, and rarely something off contract
+- agreements listing each employee's contracted service sets, with a few
+  duplicated records (services in another order), employees missing from the
+  agreement and agreement employees without punches, so the merge and variance
+  see unmatched rows on both sides
+
+Punches are generated in blocks of employees, so memory stays bounded up to
+10^7 punches.
+"""
+import math
+import os
+import zipfile
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+from process import ATTENDANCE_DATETIME_FORMAT, SERVICE_SEPARATOR
+
+
+GENERATOR_VERSION = 1   # bump when the generated data changes, so cached inputs are rebuilt
+
+# Service mix of the workforce: share of employees with each primary service
+SERVICE_MIX = {
+    "electrical": 0.30,
+    "plumbing": 0.22,
+    "engineering": 0.18,
+    "hvac": 0.12,
+    "cleaning": 0.10,
+    "security": 0.05,
+    "landscaping": 0.03,
+}
+# Punches per working day and their shares
+PUNCHES_PER_DAY = {1: 0.40, 2: 0.38, 3: 0.16, 4: 0.06}
+MONTH_START = np.datetime64("2025-11-01T00:00", "m")
+MONTH_DAYS = 30
+WORKED_DAYS = (18, 26)          # days worked per employee, inclusive range
+NIGHT_SHIFT_SHARE = 0.06        # working days that are a night shift crossing midnight
+PRIMARY_SERVICE_SHARE = 0.75    # punches in the employee's primary service
+OFF_CONTRACT_SHARE = 0.04       # punches in a service the agreement does not list
+UNLISTED_EMPLOYEE_SHARE = 0.03  # employees with punches but no agreement
+EXTRA_AGREEMENT_SHARE = 0.02    # agreement employees without punches
+DUPLICATE_AGREEMENT_SHARE = 0.02
+FIRST_UID = 88800000
+ATTENDANCE_CSV_SCHEMA = pa.schema([("uid", pa.int64()), ("punchInDateTime", pa.string()),
+                                   ("punchOutDateTime", pa.string()), ("servicesPerformed", pa.string())])
+EMPLOYEE_BLOCK = 20000          # employees generated per block
+
+_SERVICES = list(SERVICE_MIX)
+_SERVICE_WEIGHTS = np.array(list(SERVICE_MIX.values())) / sum(SERVICE_MIX.values())
+_PUNCH_COUNTS = np.array(list(PUNCHES_PER_DAY))
+_PUNCH_COUNT_WEIGHTS = np.array(list(PUNCHES_PER_DAY.values())) / sum(PUNCHES_PER_DAY.values())
+_MEAN_PUNCHES_PER_EMPLOYEE = (float(_PUNCH_COUNTS @ _PUNCH_COUNT_WEIGHTS) * (1 - NIGHT_SHIFT_SHARE)
+                              + 2 * NIGHT_SHIFT_SHARE) * sum(WORKED_DAYS) / 2
+
+
+def employee_count(punches: int) -> int:
+    """Number of employees whose month of work comes to a little over this many punches."""
+    return max(1, int(math.ceil(punches * 1.01 / _MEAN_PUNCHES_PER_EMPLOYEE)))
+
+
+def _employees(rng: np.random.Generator, count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """uids, primary and secondary service codes of count employees."""
+    uids = FIRST_UID + np.arange(count, dtype=np.int64)
+    primary = rng.choice(len(_SERVICES), size=count, p=_SERVICE_WEIGHTS)
+    # secondary: any service but the primary one
+    secondary = rng.integers(0, len(_SERVICES) - 1, size=count)
+    secondary = secondary + (secondary >= primary)
+    return uids, primary, secondary
+
+
+def _punch_block(rng: np.random.Generator, uids: np.ndarray, primary: np.ndarray,
+                 secondary: np.ndarray) -> pa.Table:
+    """Punches of one block of employees for the whole month."""
+    count = len(uids)
+    # working days: the first k days of a random order of the month, per employee
+    worked = rng.integers(WORKED_DAYS[0], WORKED_DAYS[1] + 1, size=count)
+    order = np.argsort(rng.random((count, MONTH_DAYS)), axis=1)
+    taken = np.arange(MONTH_DAYS) < worked[:, None]
+    employee = np.repeat(np.arange(count), worked)
+    day = np.sort(np.where(taken, order, MONTH_DAYS), axis=1)[taken]
+
+    night = rng.random(len(day)) < NIGHT_SHIFT_SHARE
+    punches = np.where(night, 2, rng.choice(_PUNCH_COUNTS, size=len(day), p=_PUNCH_COUNT_WEIGHTS))
+
+    # one row per punch; position is the punch number within its day
+    shift = np.repeat(np.arange(len(day)), punches)
+    first = np.cumsum(punches) - punches
+    position = np.arange(len(shift)) - first[shift]
+
+    # day shifts: start 06:00-10:00, punches of 1.5-5h separated by 0.5-1.5h breaks
+    length = rng.integers(90, 301, size=len(shift))
+    gap = rng.integers(30, 91, size=len(shift))
+    offset = np.cumsum(length + gap) - (length + gap)
+    start = rng.integers(6 * 60, 10 * 60 + 1, size=len(day))[shift] + offset - offset[first[shift]]
+    end = np.minimum(start + length, 24 * 60 - 1)
+    start = np.minimum(start, end)
+
+    # night shifts: 19:00-22:00 for 6-9h, split at midnight
+    night_row = night[shift]
+    night_start = rng.integers(19 * 60, 22 * 60 + 1, size=len(day))[shift]
+    night_end = night_start + rng.integers(6 * 60, 9 * 60 + 1, size=len(day))[shift]
+    start = np.where(night_row, np.where(position == 0, night_start, 24 * 60), start)
+    end = np.where(night_row, np.where(position == 0, 24 * 60 - 1, night_end), end)
+
+    day_start = MONTH_START + day[shift].astype("timedelta64[D]")
+    punch_in = day_start + start.astype("timedelta64[m]")
+    punch_out = day_start + end.astype("timedelta64[m]")
+
+    # services: primary, else secondary, rarely off contract; a night shift keeps one service
+    draw = rng.random(len(day))[shift]
+    other = rng.integers(0, len(_SERVICES), size=len(shift))
+    service = np.where(draw < PRIMARY_SERVICE_SHARE, primary[employee[shift]],
+                       np.where(draw < 1 - OFF_CONTRACT_SHARE, secondary[employee[shift]], other))
+    service = np.where(night_row & (position == 1), np.roll(service, 1), service)
+
+    return pa.table({
+        "uid": pa.array(uids[employee[shift]]),
+        "punchInDateTime": pc.strftime(pa.array(punch_in.astype("datetime64[s]")),
+                                       format=ATTENDANCE_DATETIME_FORMAT),
+        "punchOutDateTime": pc.strftime(pa.array(punch_out.astype("datetime64[s]")),
+                                        format=ATTENDANCE_DATETIME_FORMAT),
+        "servicesPerformed": pa.DictionaryArray.from_arrays(
+            pa.array(service.astype(np.int32)), pa.array(_SERVICES)).cast(pa.string()),
+    }, schema=ATTENDANCE_CSV_SCHEMA)
+
+
+def write_attendance_csv(path: str, punches: int, seed: int = 0) -> int:
+    """
+    Write an attendance CSV of exactly punches rows.
+
+    Args:
+        path: Output CSV path
+        punches: Number of punch rows
+        seed: Random seed; the same seed and size give the same file
+
+    Returns:
+        Number of employees in the file
+    """
+    rng = np.random.default_rng([seed, GENERATOR_VERSION, 1])
+    count = employee_count(punches)
+    uids, primary, secondary = _employees(rng, count)
+    # unquoted, header included, like the exports of the attendance system
+    options = pa_csv.WriteOptions(include_header=False, quoting_style="none")
+    written = 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f, pa_csv.CSVWriter(f, ATTENDANCE_CSV_SCHEMA, write_options=options) as writer:
+        f.write((",".join(ATTENDANCE_CSV_SCHEMA.names) + "\n").encode("utf-8"))
+        block_start = 0
+        while written < punches:
+            if block_start >= count:
+                block_start = 0   # an unlikely short draw; the workforce works another month
+            block = slice(block_start, block_start + EMPLOYEE_BLOCK)
+            table = _punch_block(rng, uids[block], primary[block], secondary[block])
+            table = table.slice(0, punches - written)
+            writer.write_table(table)
+            written += table.num_rows
+            block_start += EMPLOYEE_BLOCK
+    os.replace(tmp_path, path)
+    return count
+
+
+def agreement_records(punches: int, seed: int = 0) -> List[Tuple[int, int, str]]:
+    """
+    Agreement records (uid, system hours, services) matching write_attendance_csv(punches, seed).
+
+    Every listed employee has a record for the primary service and one for the
+    primary and secondary service together; some also one for the secondary
+    service alone.
+    """
+    rng = np.random.default_rng([seed, GENERATOR_VERSION, 1])
+    count = employee_count(punches)
+    uids, primary, secondary = _employees(rng, count)   # same employees as the attendance file
+    rng = np.random.default_rng([seed, GENERATOR_VERSION, 2])
+
+    listed = rng.random(count) >= UNLISTED_EMPLOYEE_SHARE
+    extra = int(round(count * EXTRA_AGREEMENT_SHARE))
+    extra_uids, extra_primary, extra_secondary = _employees(rng, extra)
+    uids = np.concatenate([uids[listed], extra_uids + count])
+    primary = np.concatenate([primary[listed], extra_primary])
+    secondary = np.concatenate([secondary[listed], extra_secondary])
+
+    records = []
+    hours = rng.integers(4, 13, size=(len(uids), 3)) * 10
+    secondary_alone = rng.random(len(uids)) < 0.3
+    duplicate = rng.random(len(uids)) < DUPLICATE_AGREEMENT_SHARE
+    for i, uid in enumerate(uids.tolist()):
+        first, second = _SERVICES[primary[i]], _SERVICES[secondary[i]]
+        records.append((uid, int(hours[i, 0]), first))
+        records.append((uid, int(hours[i, 1]), SERVICE_SEPARATOR.join([first, second])))
+        if secondary_alone[i]:
+            records.append((uid, int(hours[i, 2]), second))
+        if duplicate[i]:
+            records.append((uid, 10, SERVICE_SEPARATOR.join([second, first])))
+    return records
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+_DOCUMENT_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+)
+_DOCUMENT_END = '<w:sectPr/></w:body></w:document>'
+
+
+def _paragraph(*runs: str) -> str:
+    # label and value in separate runs, as Word saves edited agreements
+    return "<w:p>" + "".join(f'<w:r><w:t xml:space="preserve">{run}</w:t></w:r>' for run in runs) + "</w:p>"
+
+
+def write_agreement_docx(path: str, records: List[Tuple[int, int, str]]) -> None:
+    """
+    Write agreement records as a DOCX file, four paragraphs per record.
+
+    Args:
+        path: Output DOCX path
+        records: (uid, system hours, services) tuples, e.g. from agreement_records
+    """
+    tmp_path = f"{path}.tmp"
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _PACKAGE_RELS)
+        with archive.open("word/document.xml", "w", force_zip64=True) as document:
+            document.write(_DOCUMENT_START.encode("utf-8"))
+            for start in range(0, len(records), 10000):
+                document.write("".join(
+                    _paragraph("UID: ", str(uid)) + _paragraph("system hours", ": ", str(hours))
+                    + _paragraph("services performed: ", services) + "<w:p/>"
+                    for uid, hours, services in records[start:start + 10000]).encode("utf-8"))
+            document.write(_DOCUMENT_END.encode("utf-8"))
+    os.replace(tmp_path, path)
+
+
+def generate_inputs(data_dir: str, punches: int, seed: int = 0) -> Dict[str, Optional[str]]:
+    """
+    Return the agreement and attendance files for a size and seed, generating them if needed.
+
+    Files are cached in data_dir under names holding the size, seed and
+    GENERATOR_VERSION, so each is generated once.
+
+    Returns:
+        'agreement' and 'attendance' paths
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    stem = f"{punches}_seed{seed}_v{GENERATOR_VERSION}"
+    paths = {
+        "agreement": os.path.join(data_dir, f"agreement_{stem}.docx"),
+        "attendance": os.path.join(data_dir, f"attendance_{stem}.csv"),
+    }
+    if not os.path.exists(paths["attendance"]):
+        write_attendance_csv(paths["attendance"], punches, seed)
+    if not os.path.exists(paths["agreement"]):
+        write_agreement_docx(paths["agreement"], agreement_records(punches, seed))
+    return paths
@@ -0,0 +1,45 @@
+"""
+pytest configuration for the server unit tests.
+
+Run from this directory (python -m pytest -q), so the server modules import
+the way app.py imports them. test_api.py is a manual smoke script against a
+running server, not a unit test, and is not collected.
+
+The command-line process.py at the repository root shares the module name of
+server/process.py, so tests of it load it under another name (cli_process).
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+
+collect_ignore = ["test_api.py"]
+
+SAMPLE_INPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "input")
+CLI_PROCESS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "process.py")
+
+
+@pytest.fixture
+def sample_agreement() -> str:
+    """Path of the sample agreement DOCX shipped in input/."""
+    return os.path.join(SAMPLE_INPUT_DIR, "agreement.docx")
+
+
+@pytest.fixture
+def sample_attendance() -> str:
+    """Path of the sample attendance CSV shipped in input/."""
+    return os.path.join(SAMPLE_INPUT_DIR, "attendance.csv")
+
+
+@pytest.fixture(scope="session")
+def cli_process():
+    """The command-line process.py at the repository root, imported as cli_process."""
+    module = sys.modules.get("cli_process")
+    if module is None:
+        spec = importlib.util.spec_from_file_location("cli_process", CLI_PROCESS_PATH)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["cli_process"] = module
+        spec.loader.exec_module(module)
+    return module
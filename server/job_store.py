@@ -0,0 +1,320 @@
+"""
+Background reconciliation jobs.
+
+A long reconciliation would otherwise hold a sync gunicorn worker for the whole
+run (and hit its timeout), so /api/jobs hands the pipeline to a small thread
+pool and returns a job id straight away:
+
+- JobStore keeps every job in one SQLite file shared by all gunicorn workers,
+  so any worker can answer a status request; per-stage progress is stored as
+  a JSON list next to the job
+- JobRunner is a bounded pool per worker process; when its queue is full new
+  jobs are refused instead of piling up
+
+Jobs run in the process that accepted them. If that process exits before the
+job finishes (worker recycled or killed), the job is reported as failed the
+next time it is read. Pids are reused quickly inside a container, so a job
+records an owner token unique to the accepting process, and that process
+refreshes a heartbeat on its active jobs; a job whose owner has exited, or
+whose heartbeat has stopped, is failed.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+JOB_DATABASE_NAME = "jobs.sqlite"
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+JOB_HEARTBEAT_SECONDS = 10
+JOB_HEARTBEAT_TIMEOUT_SECONDS = 120   # well above the interval, so a busy worker is not failed
+
+STAGE_PENDING = "pending"
+STAGE_RUNNING = "running"
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    owner TEXT,
+    heartbeat_at REAL,
+    params TEXT NOT NULL,
+    stages TEXT NOT NULL,
+    error TEXT,
+    artifact TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+)
+"""
+# columns added after the first release, added to existing databases on start
+_ADDED_COLUMNS = {"owner": "TEXT", "heartbeat_at": "REAL"}
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="milliseconds")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True   # exists, owned by someone else
+    return True
+
+
+class JobStore:
+    """SQLite-backed job records with per-stage progress."""
+
+    def __init__(self, jobs_dir: str, heartbeat_seconds: float = JOB_HEARTBEAT_SECONDS,
+                 heartbeat_timeout_seconds: float = JOB_HEARTBEAT_TIMEOUT_SECONDS):
+        """
+        Initialise store.
+
+        Args:
+            jobs_dir: Directory holding the job database and one directory per job
+            heartbeat_seconds: How often a process refreshes the heartbeat of its active jobs
+            heartbeat_timeout_seconds: Active jobs without a heartbeat for this long are failed
+        """
+        self.jobs_dir = jobs_dir
+        self.db_path = os.path.join(jobs_dir, JOB_DATABASE_NAME)
+        self.heartbeat_seconds = heartbeat_seconds
+        self.heartbeat_timeout_seconds = heartbeat_timeout_seconds
+        self._owner: Optional[Tuple[int, str]] = None   # (pid, token) of the process that set it
+        self._owner_lock = threading.Lock()
+        os.makedirs(jobs_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")   # readers in other workers never block the writer
+            conn.execute(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, column_type in _ADDED_COLUMNS.items():
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {column_type}")
+
+    def create(self, stages: Sequence[str], params: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Record a new queued job owned by this process.
+
+        Args:
+            stages: Stage names, in the order the job runs them
+            params: JSON-serialisable request details echoed back in the status
+
+        Returns:
+            The new job id
+        """
+        job_id = uuid.uuid4().hex
+        stage_list = [{"name": name, "status": STAGE_PENDING, "startedAt": None, "finishedAt": None}
+                      for name in stages]
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, pid, owner, heartbeat_at, params, stages, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, os.getpid(), self.owner(), time.time(), json.dumps(params or {}),
+                 json.dumps(stage_list), _now()))
+        return job_id
+
+    def owner(self) -> str:
+        """
+        Return the owner token of this process, starting its heartbeat on first use.
+
+        The token is unique per process, so a later process that gets the same
+        pid does not pass for the owner of its predecessor's jobs.
+        """
+        with self._owner_lock:
+            pid = os.getpid()
+            if self._owner is None or self._owner[0] != pid:   # first use, or in a forked child
+                self._owner = (pid, f"{pid}-{uuid.uuid4().hex}")
+                threading.Thread(target=self._heartbeat, args=(self._owner[1],),
+                                 name="job-heartbeat", daemon=True).start()
+            return self._owner[1]
+
+    def job_dir(self, job_id: str) -> str:
+        """Return (and create) the working directory of a job."""
+        path = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job's status, or None if the id is unknown."""
+        row = self._row(job_id)
+        if row is None:
+            return None
+        if row["status"] in JOB_ACTIVE_STATES and not self._owner_alive(row):
+            self._finish(job_id, JOB_FAILED, STAGE_FAILED, active_only=True,
+                         error="Worker process exited before the job finished")
+            row = self._row(job_id)
+        return self._to_dict(row)
+
+    def is_active(self, job_id: str) -> bool:
+        """True while a job is queued or running."""
+        job = self.get(job_id)
+        return job is not None and job["status"] in JOB_ACTIVE_STATES
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Return the most recent jobs, newest first."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def start_stage(self, job_id: str, stage: str) -> None:
+        """Mark the running stage done and the given stage running."""
+        now = _now()
+        row = self._row(job_id)
+        stages = json.loads(row["stages"])
+        for entry in stages:
+            if entry["status"] == STAGE_RUNNING:
+                entry["status"], entry["finishedAt"] = STAGE_DONE, now
+            if entry["name"] == stage:
+                entry["status"], entry["startedAt"] = STAGE_RUNNING, now
+        self._update(job_id, status=JOB_RUNNING, stages=json.dumps(stages),
+                     started_at=row["started_at"] or now)
+
+    def succeed(self, job_id: str, artifact: str) -> None:
+        """Mark a job finished with the path of its artifact."""
+        self._finish(job_id, JOB_SUCCEEDED, STAGE_DONE, artifact=artifact)
+
+    def fail(self, job_id: str, error: str) -> None:
+        """Mark a job (and its running stage) failed."""
+        self._finish(job_id, JOB_FAILED, STAGE_FAILED, error=error)
+
+    def delete(self, job_id: str) -> None:
+        """Drop a job record."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def artifact_path(self, job_id: str) -> Optional[str]:
+        """Return the artifact path of a succeeded job, or None."""
+        row = self._row(job_id)
+        if row is None or row["status"] != JOB_SUCCEEDED:
+            return None
+        return row["artifact"]
+
+    def _finish(self, job_id: str, status: str, stage_status: str, active_only: bool = False,
+                **fields: Any) -> None:
+        now = _now()
+        row = self._row(job_id)
+        stages = json.loads(row["stages"])
+        for entry in stages:
+            if entry["status"] == STAGE_RUNNING:
+                entry["status"], entry["finishedAt"] = stage_status, now
+        self._update(job_id, active_only=active_only, status=status, stages=json.dumps(stages),
+                     finished_at=now, **fields)
+
+    def _owner_alive(self, row: sqlite3.Row) -> bool:
+        with self._owner_lock:
+            current = self._owner[1] if self._owner is not None and self._owner[0] == os.getpid() else None
+        if row["owner"] is not None and row["owner"] == current:
+            return True
+        if row["pid"] == os.getpid() or not _pid_alive(row["pid"]):
+            return False   # owner exited; this process, or another one, got its pid
+        heartbeat = row["heartbeat_at"]
+        return heartbeat is not None and time.time() - heartbeat < self.heartbeat_timeout_seconds
+
+    def _heartbeat(self, owner: str) -> None:
+        # runs for the life of the owning process; one cheap UPDATE per interval
+        while True:
+            time.sleep(self.heartbeat_seconds)
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN (?, ?)",
+                        (time.time(), owner, *JOB_ACTIVE_STATES))
+            except sqlite3.Error as e:
+                print(f"✗ Job heartbeat failed: {e}")
+
+    def _connect(self) -> sqlite3.Connection:
+        # one short-lived connection per call, so threads and workers never share one
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _row(self, job_id: str) -> Optional[sqlite3.Row]:
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def _update(self, job_id: str, active_only: bool = False, **fields: Any) -> None:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        # active_only: leave the job alone if it finished since it was read
+        condition = " AND status IN (?, ?)" if active_only else ""
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?{condition}",
+                         (*fields.values(), job_id, *(JOB_ACTIVE_STATES if active_only else ())))
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        stages = json.loads(row["stages"])
+        done = sum(entry["status"] == STAGE_DONE for entry in stages)
+        running = [entry["name"] for entry in stages if entry["status"] == STAGE_RUNNING]
+        return {
+            "jobId": row["id"],
+            "status": row["status"],
+            "stage": running[0] if running else None,
+            "progress": round(done / len(stages), 3) if stages else 1.0,
+            "stages": stages,
+            "params": json.loads(row["params"]),
+            "error": row["error"],
+            "artifact": os.path.basename(row["artifact"]) if row["artifact"] else None,
+            "createdAt": row["created_at"],
+            "startedAt": row["started_at"],
+            "finishedAt": row["finished_at"],
+        }
+
+
+class JobRunner:
+    """Bounded thread pool running jobs recorded in a JobStore."""
+
+    def __init__(self, store: JobStore, max_workers: int = 2, max_pending: int = 8):
+        """
+        Initialise runner.
+
+        Args:
+            store: Store the jobs are recorded in
+            max_workers: Jobs running at the same time in this process
+            max_pending: Jobs accepted (running or queued) at the same time in this process
+        """
+        self.store = store
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, job_id: str, task: Callable[[Callable[[str], None]], str]) -> bool:
+        """
+        Queue a job.
+
+        Args:
+            job_id: Id returned by JobStore.create
+            task: Runs the job; called with a stage callback, returns the artifact path
+
+        Returns:
+            False if the queue is full and the job was not accepted
+        """
+        if not self._slots.acquire(blocking=False):
+            return False
+        self._executor.submit(self._run, job_id, task)
+        return True
+
+    def _run(self, job_id: str, task: Callable[[Callable[[str], None]], str]) -> None:
+        try:
+            artifact = task(lambda stage: self.store.start_stage(job_id, stage))
+            self.store.succeed(job_id, artifact)
+            print(f"✓ Job {job_id} succeeded: {os.path.basename(artifact)}")
+        except Exception as e:
+            self.store.fail(job_id, str(e))
+            print(f"✗ Job {job_id} failed: {e}")
+        finally:
+            self._slots.release()
@@ -0,0 +1,291 @@
+"""
+Per-stage timing of the reconciliation pipeline, aggregated across worker processes.
+
+Pipeline stages are wrapped in stage_timer (or decorated with timed_stage),
+which measures wall time and rows in and out, and hands a StageRecord to the
+registered observers. The record also carries the process's peak RSS so far
+(ru_maxrss): a high-water mark of the whole process, which includes earlier
+stages and requests, not the memory of the stage itself. Without observers a
+stage costs two perf_counter calls.
+
+StageMetrics is the observer the Flask app registers: it adds every record to
+histograms and counters in process memory, and flushes them in one
+transaction to a SQLite file shared by all gunicorn workers (and batch pool
+processes) every few seconds, so no request waits on the database. /metrics
+flushes its own worker first and reports totals across workers (the others
+lag by at most one flush interval); the totals survive worker restarts.
+render_prometheus formats them in the Prometheus text exposition format.
+"""
+import atexit
+import contextlib
+import contextvars
+import functools
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+
+METRICS_DATABASE_NAME = "metrics.sqlite"
+STAGE_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+METRIC_PREFIX = "reconciliation"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stage_metrics (
+    stage TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (stage, name)
+)
+"""
+
+_observers: List[Callable[["StageRecord"], None]] = []
+_current_stage: contextvars.ContextVar = contextvars.ContextVar("current_stage", default=None)
+
+
+class StageRecord:
+    """Measurements of one run of a pipeline stage."""
+
+    def __init__(self, stage: str, rows_in: Optional[int] = None):
+        self.stage = stage
+        self.rows_in = rows_in
+        self.rows_out: Optional[int] = None
+        self.seconds = 0.0
+        self.process_peak_rss_bytes: Optional[int] = None   # of the process so far, not of this stage
+        self.failed = False
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process so far, or None where it is not available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024   # kilobytes on Linux
+
+
+def add_stage_observer(observer: Callable[[StageRecord], None]) -> None:
+    """Call observer with the StageRecord of every stage that finishes in this process."""
+    if observer not in _observers:
+        _observers.append(observer)
+
+
+def remove_stage_observer(observer: Callable[[StageRecord], None]) -> None:
+    """Stop calling an observer added with add_stage_observer."""
+    if observer in _observers:
+        _observers.remove(observer)
+
+
+@contextlib.contextmanager
+def stage_timer(stage: str, rows_in: Optional[int] = None) -> Iterator[StageRecord]:
+    """
+    Time a pipeline stage; set rows_out on the yielded record before the block ends.
+
+    Args:
+        stage: Stage name, e.g. "merge"
+        rows_in: Rows the stage consumes, if known up front (see count_stage_rows_in)
+    """
+    record = StageRecord(stage, rows_in)
+    token = _current_stage.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        record.failed = True
+        raise
+    finally:
+        record.seconds = time.perf_counter() - started
+        _current_stage.reset(token)
+        if _observers:
+            record.process_peak_rss_bytes = peak_rss_bytes()
+            for observer in list(_observers):
+                try:
+                    observer(record)
+                except Exception as e:   # instrumentation never fails the pipeline
+                    print(f"✗ Recording stage {stage} failed: {e}")
+
+
+def timed_stage(stage: str, rows_in: Optional[Callable[..., Optional[int]]] = None,
+                rows_out: Optional[Callable[[Any], Optional[int]]] = None):
+    """
+    Decorator running a function inside stage_timer.
+
+    Args:
+        stage: Stage name
+        rows_in: Optional function of the call arguments returning the rows consumed
+        rows_out: Optional function of the return value returning the rows produced
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage, rows_in(*args, **kwargs) if rows_in else None) as record:
+                result = func(*args, **kwargs)
+                if rows_out is not None:
+                    record.rows_out = rows_out(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def count_stage_rows_in(rows: int) -> None:
+    """Add rows to the rows_in of the innermost running stage (for inputs read incrementally)."""
+    record = _current_stage.get()
+    if record is not None:
+        record.rows_in = (record.rows_in or 0) + rows
+
+
+class StageMetrics:
+    """Stage histograms and counters, aggregated in memory and flushed to a SQLite file shared by processes."""
+
+    def __init__(self, metrics_dir: str, buckets: Sequence[float] = STAGE_SECONDS_BUCKETS):
+        """
+        Initialise store.
+
+        Args:
+            metrics_dir: Directory holding the metrics database
+            buckets: Upper bounds (seconds) of the stage latency histogram buckets
+        """
+        self.db_path = os.path.join(metrics_dir, METRICS_DATABASE_NAME)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._increments: Dict[Tuple[str, str], float] = {}
+        self._maxima: Dict[Tuple[str, str], float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(metrics_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")   # readers in other workers never block the writer
+            conn.execute(_SCHEMA)
+
+    def observe(self, record: StageRecord) -> None:
+        """Add one stage run in memory (use as a stage observer); see flush."""
+        bucket = next((str(bound) for bound in self.buckets if record.seconds <= bound), "+Inf")
+        increments = [("count", 1), ("seconds", record.seconds), (f"bucket:{bucket}", 1)]
+        if record.failed:
+            increments.append(("errors", 1))
+        if record.rows_in is not None:
+            increments.append(("rows_in", record.rows_in))
+        if record.rows_out is not None:
+            increments.append(("rows_out", record.rows_out))
+        with self._lock:
+            for name, value in increments:
+                key = (record.stage, name)
+                self._increments[key] = self._increments.get(key, 0) + value
+            if record.process_peak_rss_bytes is not None:
+                key = (record.stage, "process_peak_rss_bytes")
+                self._maxima[key] = max(self._maxima.get(key, 0), record.process_peak_rss_bytes)
+
+    def flush(self) -> None:
+        """Write the records observed since the last flush to the shared database."""
+        with self._lock:
+            increments, self._increments = self._increments, {}
+            maxima, self._maxima = self._maxima, {}
+        if not increments and not maxima:
+            return
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT INTO stage_metrics (stage, name, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT (stage, name) DO UPDATE SET value = value + excluded.value",
+                    [(stage, name, value) for (stage, name), value in increments.items()])
+                conn.executemany(
+                    "INSERT INTO stage_metrics (stage, name, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT (stage, name) DO UPDATE SET value = max(value, excluded.value)",
+                    [(stage, name, value) for (stage, name), value in maxima.items()])
+        except Exception:
+            # keep them for the next flush
+            with self._lock:
+                for key, value in increments.items():
+                    self._increments[key] = self._increments.get(key, 0) + value
+                for key, value in maxima.items():
+                    self._maxima[key] = max(self._maxima.get(key, 0), value)
+            raise
+
+    def start(self, interval_seconds: float) -> None:
+        """Flush every interval_seconds on a daemon thread, and at exit (once per process)."""
+        if self._thread is not None:
+            return
+        atexit.register(self.flush)
+        self._thread = threading.Thread(target=self._run, args=(interval_seconds,),
+                                        name="stage-metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flush thread and flush what is left."""
+        self._stop.set()
+        self.flush()
+
+    def _run(self, interval_seconds: float) -> None:
+        while not self._stop.wait(interval_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"✗ Flushing stage metrics to {self.db_path} failed: {e}")
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Return the totals of every stage.
+
+        Returns:
+            Per stage: count, seconds (sum), errors, rowsIn, rowsOut,
+            processPeakRssBytes and cumulative histogram buckets as (upper bound, count) pairs
+        """
+        self.flush()
+        with self._connect() as conn:
+            rows = conn.execute("SELECT stage, name, value FROM stage_metrics").fetchall()
+        values: Dict[str, Dict[str, float]] = {}
+        for stage, name, value in rows:
+            values.setdefault(stage, {})[name] = value
+
+        stages = {}
+        for stage, stage_values in sorted(values.items()):
+            cumulative, buckets = 0, []
+            for bound in [str(bound) for bound in self.buckets] + ["+Inf"]:
+                cumulative += int(stage_values.get(f"bucket:{bound}", 0))
+                buckets.append((bound, cumulative))
+            stages[stage] = {
+                "count": int(stage_values.get("count", 0)),
+                "seconds": stage_values.get("seconds", 0.0),
+                "errors": int(stage_values.get("errors", 0)),
+                "rowsIn": int(stage_values.get("rows_in", 0)),
+                "rowsOut": int(stage_values.get("rows_out", 0)),
+                "processPeakRssBytes": (int(stage_values["process_peak_rss_bytes"])
+                                        if "process_peak_rss_bytes" in stage_values else None),
+                "buckets": buckets,
+            }
+        return stages
+
+    def _connect(self) -> sqlite3.Connection:
+        # one short-lived connection per call, so threads and workers never share one
+        return sqlite3.connect(self.db_path, timeout=30)
+
+
+def render_prometheus(stages: Dict[str, Dict[str, Any]]) -> str:
+    """Format a StageMetrics snapshot in the Prometheus text exposition format."""
+    name = f"{METRIC_PREFIX}_stage_seconds"
+    lines = [f"# HELP {name} Wall time of pipeline stages.", f"# TYPE {name} histogram"]
+    for stage, values in stages.items():
+        for bound, count in values["buckets"]:
+            lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {values["seconds"]:.6f}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {values["count"]}')
+
+    counters = [("errors", "stage_errors_total", "Pipeline stage runs that raised."),
+                ("rowsIn", "stage_rows_in_total", "Rows consumed by pipeline stages."),
+                ("rowsOut", "stage_rows_out_total", "Rows produced by pipeline stages.")]
+    for key, suffix, help_text in counters:
+        lines += [f"# HELP {METRIC_PREFIX}_{suffix} {help_text}", f"# TYPE {METRIC_PREFIX}_{suffix} counter"]
+        lines += [f'{METRIC_PREFIX}_{suffix}{{stage="{stage}"}} {values[key]}' for stage, values in stages.items()]
+
+    name = f"{METRIC_PREFIX}_process_peak_rss_bytes"
+    lines += [f"# HELP {name} Highest process peak RSS (ru_maxrss, since process start) seen at the end "
+              f"of a stage; includes earlier stages and requests of the process.", f"# TYPE {name} gauge"]
+    lines += [f'{name}{{stage="{stage}"}} {values["processPeakRssBytes"]}'
+              for stage, values in stages.items() if values["processPeakRssBytes"] is not None]
+    return "\n".join(lines) + "\n"
@@ -1,13 +1,323 @@
 # TASK-1:: Extract data from DOCX agreement file
+import contextlib
+import io
 import os
 import re
-from typing import Any, Dict
+import zipfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
 
-from docx import Document
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.feather as pa_feather
+import pyarrow.parquet as pq
 
+from metrics import count_stage_rows_in, timed_stage
 
-def extract_agreement_data(docx_filepath: str) -> Dict[str, Any]:
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DOCUMENT_XML_PART = "word/document.xml"
+
+# One alternation for the three agreement fields, so the text is walked once.
+# Like the values, the services list may sit on the paragraph after its label,
+# but never starts with another field's label.
+RECORD_TOKEN_PATTERN = re.compile(
+    r"UID:\s*(?P<uid>\d+)"
+    r"|system\s+hours:\s*(?P<hours>\d+)"
+    r"|services\s+performed:\s*(?P<services>(?!UID:|system\s+hours:|services\s+performed:).*)",
+    re.IGNORECASE
+)
+
+
+# Inputs are paths, or bytes / seekable binary file objects for uploads kept in memory
+BUFFER_TYPES = (bytes, bytearray, memoryview)
+
+
+def _is_path(source) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+
+def source_name(source, name: Optional[str] = None) -> str:
+    """
+    File name used to pick the reader for an input.
+
+    Paths name themselves; buffers and file objects use the given name, falling
+    back to the object's own ``name`` attribute when that is a string.
+    """
+    if _is_path(source):
+        return os.fspath(source)
+    if name is None:
+        name = getattr(source, "name", None)
+    return name if isinstance(name, str) else ""
+
+
+def _binary_stream(source):
+    """Path or binary file object; bytes-like buffers are wrapped in BytesIO."""
+    if isinstance(source, BUFFER_TYPES):
+        return io.BytesIO(source)
+    return source
+
+
+def _arrow_source(source):
+    """Path or file object for Arrow readers; bytes-like buffers are read without a copy."""
+    if isinstance(source, BUFFER_TYPES):
+        return pa.BufferReader(pa.py_buffer(source))
+    return source
+
+
+def _rewind(source) -> None:
+    """Seek a file object back to the start so it can be read again."""
+    if not _is_path(source) and hasattr(source, "seek"):
+        source.seek(0)
+
+
+def _iter_docx_paragraphs(docx_filepath: str) -> Iterator[str]:
+    """
+    Yield the text of each top-level body paragraph of a DOCX file.
+
+    Reads word/document.xml straight out of the zip with incremental XML
+    parsing, so only the paragraph being assembled is kept in memory. The
+    text matches python-docx's ``Document(...).paragraphs[i].text``.
+    docx_filepath may also be a seekable binary file object.
+    """
+    body_tag = f"{WORD_NAMESPACE}body"
+    paragraph_tag = f"{WORD_NAMESPACE}p"
+    run_tag = f"{WORD_NAMESPACE}r"
+    hyperlink_tag = f"{WORD_NAMESPACE}hyperlink"
+    run_text = {
+        f"{WORD_NAMESPACE}tab": "\t",
+        f"{WORD_NAMESPACE}ptab": "\t",
+        f"{WORD_NAMESPACE}br": "\n",
+        f"{WORD_NAMESPACE}cr": "\n",
+        f"{WORD_NAMESPACE}noBreakHyphen": "-",
+    }
+    text_tag = f"{WORD_NAMESPACE}t"
+    # run content lives at w:p/w:r or w:p/w:hyperlink/w:r
+    run_paths = ([paragraph_tag, run_tag], [paragraph_tag, hyperlink_tag, run_tag])
+
+    with zipfile.ZipFile(docx_filepath) as archive:
+        with archive.open(DOCUMENT_XML_PART) as document_xml:
+            body = None
+            path: List[str] = []   # tags from the body down to the current element
+            parts: List[str] = []
+            for event, elem in ElementTree.iterparse(document_xml, events=("start", "end")):
+                if event == "start":
+                    if body is not None:
+                        path.append(elem.tag)
+                    elif elem.tag == body_tag:
+                        body = elem
+                    continue
+                if elem is body:
+                    break
+                if body is None:
+                    continue
+
+                tag = path.pop()
+                if tag == text_tag and path in run_paths:
+                    parts.append(elem.text or "")
+                elif tag in run_text and path in run_paths:
+                    parts.append(run_text[tag])
+                elif not path:
+                    # a top-level block just closed; drop it so the tree never grows
+                    if tag == paragraph_tag:
+                        yield "".join(parts)
+                    parts = []
+                    body.clear()
+
+
+class AgreementRecordScanner:
+    """
+    Single-pass scanner turning agreement text into record tuples.
+
+    Text is fed in pieces (e.g. one paragraph at a time) and scanned once with
+    RECORD_TOKEN_PATTERN. A UID starts a new block; the first system hours and
+    services performed inside the block complete it. Blocks missing a field and
+    fields found outside any block are collected in ``skipped``.
+    """
+
+    def __init__(self):
+        self.skipped: List[Dict[str, Any]] = []
+        self._buffer = ""
+        self._uid: Optional[int] = None
+        self._hours: Optional[int] = None
+        self._services: Optional[str] = None
+
+    def feed(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """Scan more text and yield (uid, systemHours, servicesPerformed) for finished blocks."""
+        self._buffer += text
+        yield from self._scan(final=False)
+
+    def close(self) -> Iterator[Tuple[int, int, str]]:
+        """Scan whatever is left and yield the last block."""
+        yield from self._scan(final=True)
+        yield from self._finish_block()
+        self._buffer = ""
+
+    def _scan(self, final: bool) -> Iterator[Tuple[int, int, str]]:
+        buffer = self._buffer
+        resume = 0
+        for match in RECORD_TOKEN_PATTERN.finditer(buffer):
+            if not final and match.end() == len(buffer):
+                # the token may still grow with the next piece of text
+                resume = match.start()
+                break
+            resume = match.end()
+            field = match.lastgroup
+            if field == "uid":
+                yield from self._finish_block()
+                self._uid = int(match.group("uid"))
+            elif self._uid is None:
+                self.skipped.append({
+                    "uid": None,
+                    "reason": f"{match.group(0).split(':')[0].strip()} outside a UID block"
+                })
+            elif field == "hours":
+                if self._hours is None:
+                    self._hours = int(match.group("hours"))
+            elif self._services is None:
+                self._services = match.group("services").strip() # clean up whitespace
+        else:
+            if not final:
+                # a partial token can only start on the last non-blank line
+                last_line = buffer.rfind("\n", 0, len(buffer.rstrip())) + 1
+                resume = max(resume, last_line)
+        self._buffer = buffer[resume:]
+
+    def _finish_block(self) -> Iterator[Tuple[int, int, str]]:
+        if self._uid is None:
+            return
+        if self._hours is None:
+            self.skipped.append({"uid": self._uid, "reason": "missing system hours"})
+        elif not self._services:
+            self.skipped.append({"uid": self._uid, "reason": "missing services performed"})
+        else:
+            yield self._uid, self._hours, self._services
+        self._uid = self._hours = self._services = None
+
+
+def iter_agreement_records(docx_filepath: str,
+                           scanner: Optional[AgreementRecordScanner] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream agreement records out of a DOCX agreement file.
+
+    Each paragraph is fed to an AgreementRecordScanner as soon as it has been
+    read, and every completed UID block is yielded straight away.
+
+    Args:
+        docx_filepath: Path to the DOCX file, or a seekable binary file object
+        scanner: Optional scanner to use, e.g. to inspect ``scanner.skipped`` afterwards
+
+    Yields:
+        Dictionaries with uid, systemHours and servicesPerformed
+    """
+    if scanner is None:
+        scanner = AgreementRecordScanner()
+
+    for paragraph in _iter_docx_paragraphs(docx_filepath):
+        for uid, hours, services in scanner.feed(paragraph + "\n"):
+            yield {"uid": uid, "systemHours": hours, "servicesPerformed": services}
+    for uid, hours, services in scanner.close():
+        yield {"uid": uid, "systemHours": hours, "servicesPerformed": services}
+
+
+# Parquet and Arrow IPC (Feather) inputs are read column-wise, memory-mapped where possible
+COLUMNAR_EXTENSIONS = (".parquet", ".feather", ".arrow")
+AGREEMENT_RECORD_COLUMNS = ["uid", "systemHours", "servicesPerformed"]
+
+
+def is_columnar_file(filepath: str) -> bool:
+    """True for Parquet and Feather/Arrow files."""
+    return os.path.splitext(filepath)[1].lower() in COLUMNAR_EXTENSIONS
+
+
+def _is_parquet(filepath: str) -> bool:
+    return filepath.lower().endswith(".parquet")
+
+
+def _validate_columns(columns: List[str], required: List[str], source: str) -> None:
+    """Raise ValueError naming the first required column that is missing."""
+    for col in required:
+        if col not in columns:
+            raise ValueError(f"Missing required column in {source}: {col}")
+
+
+def _open_ipc_file(filepath):
+    """Memory-map an Arrow IPC path; in-memory inputs are read as they are (and left open)."""
+    if _is_path(filepath):
+        return pa.memory_map(filepath)
+    return contextlib.nullcontext(_arrow_source(filepath))
+
+
+def read_columnar_schema(filepath: str, name: Optional[str] = None) -> pa.Schema:
+    """Read only the schema of a Parquet or Feather/Arrow file (path, bytes or file object)."""
+    if _is_parquet(source_name(filepath, name)):
+        return pq.read_schema(_arrow_source(filepath), memory_map=True)
+    with _open_ipc_file(filepath) as source:
+        return pa.ipc.open_file(source).schema
+
+
+def read_columnar_table(filepath: str, columns: List[str], source: str,
+                        name: Optional[str] = None) -> pa.Table:
+    """
+    Read the given columns of a Parquet or Feather/Arrow file.
+
+    Args:
+        filepath: Path to the file, or its bytes / a seekable binary file object
+        columns: Columns to read; all of them are required
+        source: File description used in the missing column error
+        name: File name of an in-memory input, used to tell Parquet from Feather
+
+    Returns:
+        Arrow table with only the requested columns
+    """
+    _validate_columns(read_columnar_schema(filepath, name).names, columns, source)
+    if _is_parquet(source_name(filepath, name)):
+        return pq.read_table(_arrow_source(filepath), columns=columns, memory_map=True)
+    return pa_feather.read_table(_arrow_source(filepath), columns=columns, memory_map=True)
+
+
+def iter_columnar_batches(filepath: str, columns: List[str], source: str,
+                          batch_size: int, name: Optional[str] = None) -> Iterator[pa.RecordBatch]:
+    """
+    Yield record batches of the given columns of a Parquet or Feather/Arrow file.
+
+    Parquet files are read in batches of batch_size rows; Arrow IPC files are
+    memory-mapped and yield the batches they were written with. In-memory
+    inputs are accepted as for read_columnar_table.
+    """
+    _validate_columns(read_columnar_schema(filepath, name).names, columns, source)
+    if _is_parquet(source_name(filepath, name)):
+        yield from pq.ParquetFile(_arrow_source(filepath), memory_map=True).iter_batches(
+            batch_size=batch_size, columns=columns)
+        return
+    with _open_ipc_file(filepath) as source_file:
+        reader = pa.ipc.open_file(source_file)
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i).select(columns)
+
+
+def _extract_columnar_agreement_records(filepath: str, name: Optional[str] = None
+                                        ) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+    """Read pre-extracted agreement records, skipping rows without uid or system hours."""
+    table = read_columnar_table(filepath, AGREEMENT_RECORD_COLUMNS, "agreement file", name)
+    records = pd.DataFrame({
+        "uid": table["uid"].cast(pa.int64()).to_pandas(),
+        "systemHours": table["systemHours"].cast(pa.int64()).to_pandas(),
+        "servicesPerformed": table["servicesPerformed"].cast(pa.string()).to_pandas(),
+    })
+    missing_hours = records["systemHours"].isna()
+    skipped = [{"uid": None if pd.isna(uid) else int(uid), "reason": "missing system hours"}
+               for uid in records.loc[missing_hours, "uid"]]
+    skipped += [{"uid": None, "reason": "missing uid"}] * int(records["uid"].isna().sum())
+    records = records[records["uid"].notna() & ~missing_hours].reset_index(drop=True)
+    return records.astype({"uid": "int64", "systemHours": "int64"}), skipped
+
+
+@timed_stage("docx_extract", rows_out=lambda result: result["totalRecord"])
+def extract_agreement_data(docx_filepath: str, name: Optional[str] = None) -> Dict[str, Any]:
     """
     Extract structured data from a DOCX agreement file and return as JSON.
     
@@ -15,105 +325,485 @@ def extract_agreement_data(docx_filepath: str) -> Dict[str, Any]:
         system hours: 7
         services performed: electrical, engineering, plumbing
 
+    Agreements that were already extracted can be passed as a Parquet or
+    Feather/Arrow file with uid, systemHours and servicesPerformed columns;
+    their records are then returned as a DataFrame instead of a list of dicts
+    (group_agreement_records accepts both).
+
     Args:
-        docx_filepath: Path to the DOCX file
+        docx_filepath: Path to the DOCX file (or Parquet/Feather/Arrow records file),
+            or its bytes / a seekable binary file object, so uploads can be read
+            without saving them first
+        name: File name of an in-memory input (defaults to the object's ``name``);
+            a .parquet/.feather/.arrow name selects the records reader
         
     Returns:
         Dictionary with extracted data in the required format
     """
      # Check file exists
-    if not os.path.exists(docx_filepath) or not os.path.isfile(docx_filepath):
+    if _is_path(docx_filepath) and (not os.path.exists(docx_filepath) or not os.path.isfile(docx_filepath)):
         raise FileNotFoundError(f"DOCX file not found: {docx_filepath}")
     
-    
-    # Read the DOCX file
-    doc = Document(docx_filepath)
-    
-    # Extract all text from the document
-    full_text = "\n".join([para.text for para in doc.paragraphs])
-    
-    # Split records by UID pattern
-    records = []
-    uid_pattern = r"UID:\s*(\d+)"
-    hours_pattern = r"system\s+hours:\s*(\d+)"
-    services_pattern = r"services\s+performed:\s*(.*\n)"
-    
-    # Find all UID positions
-    uid_matches = list(re.finditer(uid_pattern, full_text, re.IGNORECASE))
-    
-    for i, uid_match in enumerate(uid_matches):
-        # Get the text section for this record
-        start_pos = uid_match.start()
-        end_pos = uid_matches[i + 1].start() if i + 1 < len(uid_matches) else len(full_text)
-        record_text = full_text[start_pos:end_pos]
-        
-        # Extract fields for this record
-        uid_match_obj = re.search(uid_pattern, record_text, re.IGNORECASE)
-        hours_match_obj = re.search(hours_pattern, record_text, re.IGNORECASE)
-        services_match_obj = re.search(services_pattern, record_text, re.IGNORECASE)
-        
-        if uid_match_obj:
-            record = {
-                "uid": int(uid_match_obj.group(1)),
-                "systemHours": int(hours_match_obj.group(1)) if hours_match_obj else None,
-                "servicesPerformed": services_match_obj.group(1) if services_match_obj else None
-            }
-            if record["systemHours"] is not None and record["servicesPerformed"] is not None:
-                record["servicesPerformed"] = record["servicesPerformed"].strip() # clean up whitespace
-                records.append(record)
+    filename = source_name(docx_filepath, name)
+    if is_columnar_file(filename):
+        records, skipped = _extract_columnar_agreement_records(docx_filepath, filename)
+    else:
+        # Stream records out of word/document.xml without building a Document tree
+        scanner = AgreementRecordScanner()
+        records = list(iter_agreement_records(_binary_stream(docx_filepath), scanner))
+        skipped = scanner.skipped
+    if skipped:
+        print(f"Skipped {len(skipped)} malformed agreement blocks")
     
     # Create the final JSON structure
     result = {
-        "documentName": "agreement.docx",
+        "documentName": os.path.basename(filename) if is_columnar_file(filename) else "agreement.docx",
         "totalRecord": len(records),
-        "records": records
+        "records": records,
+        "skippedRecords": skipped
     }
     
     return result
 
+# Services performed are held as bits of a categorical vocabulary
+SERVICE_SEPARATOR = ", "
+MAX_SERVICES = 64  # one bit per service in a uint64 mask; larger vocabularies use Python ints
+AGREEMENT_INDEX_NAMES = ["uidKey", "servicesKey"]
+# Version of the grouped agreement frame (extraction, grouping and index columns);
+# bump it on every change to that frame, so frames cached by older code are not served
+GROUPED_AGREEMENT_VERSION = 3
+
+
+class ServiceVocabulary:
+    """
+    Categorical vocabulary of individual services, one bit per service.
+
+    A set of services (e.g. all punches of one uid-day) is a uint64 bitmask, so
+    aggregating and joining service sets are integer operations. Human-readable
+    strings are only rebuilt once per distinct mask, in alphabetical order.
+
+    servicesPerformed is free text, so a file may hold more than MAX_SERVICES
+    distinct services (spelling and casing variants alone get there). Masks are
+    then arbitrary-precision Python ints in object arrays: slower, but the same
+    sets and the same results.
+    """
+
+    def __init__(self):
+        self.services: List[str] = []
+        self._bits: Dict[str, int] = {}
+        self._masks: Dict[str, int] = {}
+
+    def mask_of(self, value: Optional[str]) -> int:
+        """Bitmask of a comma separated services string, adding unseen services."""
+        mask = self._masks.get(value)
+        if mask is None:
+            mask = 0
+            for service in (value or "").split(","):
+                service = service.strip()
+                if not service:
+                    continue
+                if service not in self._bits:
+                    self._bits[service] = 1 << len(self.services)
+                    self.services.append(service)
+                mask |= self._bits[service]
+            self._masks[value] = mask
+        return mask
+
+    @property
+    def wide(self) -> bool:
+        """True once the services no longer fit a uint64 mask."""
+        return len(self.services) > MAX_SERVICES
+
+    def encode(self, values) -> np.ndarray:
+        """Encode an Arrow array or pandas Series of services strings as masks (see mask_array)."""
+        if isinstance(values, pa.ChunkedArray):
+            values = values.combine_chunks()
+        elif not isinstance(values, pa.Array):
+            values = pa.array(values, type=pa.string())
+        # cast also covers large_string and dictionary columns from Parquet/Feather files
+        encoded = pc.dictionary_encode(pc.fill_null(values.cast(pa.string()), ""))
+        lookup = self.mask_array([self.mask_of(value) for value in encoded.dictionary.to_pylist()])
+        return lookup[encoded.indices.to_numpy(zero_copy_only=False)]
+
+    def mask_array(self, masks) -> np.ndarray:
+        """Masks as uint64, or as Python ints (object) once the vocabulary is wide."""
+        if self.wide:
+            masks = np.asarray(masks)
+            return masks.astype(object) if masks.dtype != object else masks
+        return np.asarray(masks, dtype=np.uint64)
+
+    def decode(self, mask: int) -> str:
+        """Canonical services string of a mask."""
+        mask = int(mask)
+        return SERVICE_SEPARATOR.join(sorted(
+            service for bit, service in enumerate(self.services) if mask >> bit & 1))
+
+    def to_categorical(self, masks: np.ndarray) -> pd.Categorical:
+        """Categorical of canonical services strings, decoding each distinct mask once."""
+        uniques, codes = np.unique(self.mask_array(masks), return_inverse=True)
+        categories = np.array([self.decode(mask) for mask in uniques], dtype=object)
+        # alphabetical categories, so sorting by codes sorts like the strings did
+        order = np.argsort(categories, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        return pd.Categorical.from_codes(rank[codes.reshape(-1)], categories[order])
+
+
+def _group_bitwise_or(group_ids: np.ndarray, masks: np.ndarray) -> np.ndarray:
+    """OR together the masks (uint64 or object) of each group; group_ids must be 0..n-1."""
+    if len(group_ids) == 0:
+        return np.zeros(0, dtype=masks.dtype)
+    order = np.argsort(group_ids, kind="stable")
+    sorted_ids = group_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    return np.bitwise_or.reduceat(masks[order], starts)
+
+def canonical_services(value: Optional[str]) -> str:
+    """Order-insensitive form of a services string: distinct services, alphabetical."""
+    services = {service.strip() for service in (value or "").split(",")}
+    return SERVICE_SEPARATOR.join(sorted(service for service in services if service))
+
+
+def services_key(values) -> np.ndarray:
+    """
+    Hash each services string to a uint64 key that ignores order and repeats.
+
+    "electrical, engineering" and "engineering, electrical" get the same key.
+    Each distinct value (or category) is canonicalised and hashed once; the
+    hash is deterministic, so keys can be stored with cached agreements.
+    """
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    canonical = np.array([canonical_services(value) for value in uniques], dtype=object)
+    keys = np.append(pd.util.hash_array(canonical), np.uint64(0))
+    return keys[codes]   # missing values (code -1) map to the trailing 0
+
+
+def agreement_lookup_keys(df: pd.DataFrame) -> List[np.ndarray]:
+    """Join keys (uid, servicesKey) of a frame with uid and servicesPerformed columns."""
+    return [df["uid"].to_numpy(), services_key(df["servicesPerformed"])]
+
+
+def build_agreement_index(agreement_grouped: pd.DataFrame) -> pd.DataFrame:
+    """
+    Index grouped agreement rows by (uid, servicesKey) for a single hash-join lookup.
+
+    Rows whose services only differ in order are folded together. A frame that
+    is already indexed is returned unchanged.
+
+    Args:
+        agreement_grouped: Result of group_agreement_records
+
+    Returns:
+        The same columns with a unique AGREEMENT_INDEX_NAMES MultiIndex
+    """
+    if list(agreement_grouped.index.names) == AGREEMENT_INDEX_NAMES:
+        return agreement_grouped
+    index = pd.MultiIndex.from_arrays(agreement_lookup_keys(agreement_grouped),
+                                      names=AGREEMENT_INDEX_NAMES)
+    agreement_index = agreement_grouped.set_axis(index)
+    if not agreement_index.index.is_unique:
+        aggregations = {col: "first" for col in agreement_index.columns}
+        aggregations["totalSystemHours"] = "sum"
+        agreement_index = agreement_index.groupby(level=AGREEMENT_INDEX_NAMES, sort=False).agg(aggregations)
+    return agreement_index
+
+
+# TASK-3:: Group agreement records for comparison
+@timed_stage("agreement_group", rows_in=lambda agreement_ref: len(agreement_ref["records"]), rows_out=len)
+def group_agreement_records(agreement_ref: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Convert agreement records to a DataFrame grouped by uid and servicesPerformed.
+
+    Args:
+        agreement_ref: Result of extract_agreement_data; records may be a list of
+            dicts or a DataFrame with the same columns
+
+    Returns:
+        DataFrame with uid, servicesPerformed, totalSystemHours and allServicesPerformed
+    """
+    agreement_ref_df = pd.DataFrame(agreement_ref['records'], columns=AGREEMENT_RECORD_COLUMNS)
+
+    # Services as bitmasks, so the grouping runs on integers and ignores service order
+    vocabulary = ServiceVocabulary()
+    agreement_ref_df["servicesMask"] = vocabulary.encode(agreement_ref_df["servicesPerformed"])
+
+    # Group agreement data by uid and servicesPerformed to get max allowed hours and remove duplicates
+    agreement_grouped = agreement_ref_df.groupby(['uid', 'servicesMask']).agg(
+        totalSystemHours = ('systemHours', 'sum') # assuming systemHours in agreement is the max allowed
+    ).reset_index()
+
+    services = vocabulary.to_categorical(agreement_grouped.pop("servicesMask").to_numpy())
+    agreement_grouped.insert(1, "servicesPerformed", services)
+    agreement_grouped["allServicesPerformed"] = services
+    agreement_grouped = agreement_grouped.sort_values(['uid', 'servicesPerformed'], ignore_index=True)
+
+    return agreement_grouped
+
 # TASK-2:: Extract data from CSV attendance file
-def extract_attendance_data(csv_filepath: str) -> Dict[str, Any]:
+ATTENDANCE_REQUIRED_COLUMNS = ["uid", "punchInDateTime", "punchOutDateTime", "servicesPerformed"]
+ATTENDANCE_GROUP_KEYS = ["uid", "attendanceDate"]
+# Punch timestamps come in day-first, e.g. "1/11/2025 9:00" is 1 November 2025
+ATTENDANCE_DATETIME_FORMAT = "%d/%m/%Y %H:%M"
+# Declared CSV schema; timestamps are read as text and parsed with the explicit format
+ATTENDANCE_SCHEMA = {
+    "uid": pa.int64(),
+    "punchInDateTime": pa.string(),
+    "punchOutDateTime": pa.string(),
+    "servicesPerformed": pa.string(),
+}
+# Compressed CSV exports are decompressed as a stream straight into the parser
+COMPRESSED_CSV_SUFFIXES = {".csv.gz": "gzip", ".csv.zst": "zstd", ".csv.bz2": "bz2"}
+
+
+class DecompressedSizeExceeded(ValueError):
+    """Raised when a compressed CSV expands beyond the allowed number of bytes."""
+
+
+class _SizeLimitedStream(io.RawIOBase):
+    """Readable stream that raises DecompressedSizeExceeded after max_bytes."""
+
+    def __init__(self, stream, max_bytes: int):
+        self._stream = stream
+        self._max_bytes = max_bytes
+        self._bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read() if size is None or size < 0 else self._stream.read(size)
+        self._bytes_read += len(data)
+        if self._bytes_read > self._max_bytes:
+            raise DecompressedSizeExceeded(
+                f"Decompressed CSV is larger than {self._max_bytes} bytes")
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        self._stream.close()
+        super().close()
+
+
+def csv_compression(filepath: str) -> Optional[str]:
+    """Arrow codec of a .csv.gz/.csv.zst/.csv.bz2 file name, None for anything else."""
+    name = filepath.lower()
+    for suffix, codec in COMPRESSED_CSV_SUFFIXES.items():
+        if name.endswith(suffix):
+            return codec
+    return None
+
+
+def is_csv_file(filepath: str) -> bool:
+    """True for plain and compressed CSV file names."""
+    return filepath.lower().endswith(".csv") or csv_compression(filepath) is not None
+
+
+def open_csv_stream(source, compression: str, max_decompressed_bytes: Optional[int] = None):
     """
-    Extract structured data from a CSV attendance file and return as JSON.
+    Open a compressed CSV as a decompressing stream, without a temporary file.
+
+    Args:
+        source: Path or binary file object holding the compressed bytes
+        compression: Arrow codec name, see csv_compression
+        max_decompressed_bytes: If set, reading past this many decompressed bytes
+            raises DecompressedSizeExceeded
+
+    Returns:
+        Readable binary stream of the decompressed CSV
     """
-    # Check file exists
-    if not os.path.exists(csv_filepath) or not os.path.isfile(csv_filepath):
-        raise FileNotFoundError(f"CSV file not found: {csv_filepath}")
+    stream = pa.input_stream(source, compression=compression)
+    if max_decompressed_bytes is None:
+        return stream
+    return _SizeLimitedStream(stream, max_decompressed_bytes)
 
-    # Read the CSV file to data frame
-    df = pd.read_csv(csv_filepath)
 
-    # Validate required columns
-    required_columns = ["uid", "punchInDateTime", "punchOutDateTime", "servicesPerformed"]
-    for col in required_columns:
-        if col not in df.columns:
-            raise ValueError(f"Missing required column in CSV: {col}")
+def _validate_attendance_columns(columns: List[str]) -> None:
+    """Raise ValueError if a required attendance column is missing."""
+    _validate_columns(columns, ATTENDANCE_REQUIRED_COLUMNS, "CSV")
 
-    # Convert DataFrame to list of records
-    records = df.to_dict(orient="records")
 
-    # constructing document summary
-    doc_summary = {
-        "documentName": "attendance",
-        "totalRecord": len(records),
-        "records": records
-    }
+def _attendance_convert_options() -> pa_csv.ConvertOptions:
+    # only the required columns are parsed, each with its declared type
+    return pa_csv.ConvertOptions(
+        include_columns=ATTENDANCE_REQUIRED_COLUMNS,
+        column_types=ATTENDANCE_SCHEMA,
+        strings_can_be_null=True
+    )
+
+
+def _attendance_csv_source(csv_filepath: str, max_decompressed_bytes: Optional[int],
+                           name: Optional[str] = None):
+    compression = csv_compression(source_name(csv_filepath, name))
+    if compression is None:
+        return _arrow_source(csv_filepath)
+    return open_csv_stream(_arrow_source(csv_filepath), compression, max_decompressed_bytes)
+
+
+def _open_attendance_csv(csv_filepath: str, open_csv, max_decompressed_bytes: Optional[int] = None,
+                         name: Optional[str] = None):
+    """Call open_csv with the typed convert options, reporting missing columns like before."""
+    try:
+        return open_csv(_attendance_csv_source(csv_filepath, max_decompressed_bytes, name),
+                        convert_options=_attendance_convert_options())
+    except KeyError:
+        # include_columns names a column the header does not have
+        _rewind(csv_filepath)
+        header = pa_csv.open_csv(_attendance_csv_source(csv_filepath, None, name)).schema.names
+        _validate_attendance_columns(header)
+        raise
+
 
-    # Ensure datetime columns are parsed correctly
-    df["punchInDateTime"] = pd.to_datetime(df["punchInDateTime"].str.strip())
-    df["punchOutDateTime"] = pd.to_datetime(df["punchOutDateTime"].str.strip())
+def _punch_timestamps(column, datetime_format: str):
+    """Punch column as Arrow timestamps; text is parsed with the explicit format."""
+    # Parquet/Feather files may already store real timestamps
+    if pa.types.is_timestamp(column.type):
+        return column
+    # Parse timestamps with the explicit format inside Arrow (no Python objects per row)
+    return pc.strptime(pc.utf8_trim_whitespace(column.cast(pa.string())),
+                       format=datetime_format, unit="s")
+
+
+def _summarise_attendance(table: pa.Table, datetime_format: str,
+                          vocabulary: ServiceVocabulary) -> pd.DataFrame:
+    """Compute hoursWorked per punch and group by uid and attendanceDate."""
+    # Rows without a uid cannot be matched to anything
+    table = table.filter(pc.is_valid(table["uid"]))
+
+    punch_in = _punch_timestamps(table["punchInDateTime"], datetime_format)
+    punch_out = _punch_timestamps(table["punchOutDateTime"], datetime_format)
+    df = pd.DataFrame({
+        "uid": table["uid"].cast(pa.int64()).to_pandas(),
+        "punchInDateTime": punch_in.to_pandas(),
+        "punchOutDateTime": punch_out.to_pandas(),
+        "servicesMask": vocabulary.encode(table["servicesPerformed"])
+    })
 
     # Calculate hours worked
     df["hoursWorked"] = (df["punchOutDateTime"] - df["punchInDateTime"]).dt.total_seconds() / 3600
 
-    # Extract attendance date
-    df["attendanceDate"] = df["punchInDateTime"].dt.date
+    # Attendance date, kept as datetime64 until after grouping
+    df["attendanceDate"] = df["punchInDateTime"].dt.normalize()
+    df = df[df["attendanceDate"].notna()]
+
+    # Group by UID and attendanceDate; services of a uid-day are OR-ed together
+    groups = df.groupby(ATTENDANCE_GROUP_KEYS, sort=True)
+    summary = groups[["hoursWorked"]].sum()
+    summary["servicesMask"] = _group_bitwise_or(groups.ngroup().to_numpy(),
+                                                df["servicesMask"].to_numpy())
+    return summary
+
+
+def _combine_attendance_summaries(summary: pd.DataFrame, partial: pd.DataFrame,
+                                  vocabulary: ServiceVocabulary) -> pd.DataFrame:
+    """Merge two partial (uid, attendanceDate) aggregates."""
+    index = summary.index.union(partial.index)
+    # an earlier chunk may still hold uint64 masks after the vocabulary became wide
+    masks = (vocabulary.mask_array(summary["servicesMask"].reindex(index, fill_value=0).to_numpy())
+             | vocabulary.mask_array(partial["servicesMask"].reindex(index, fill_value=0).to_numpy()))
+    return pd.DataFrame({
+        "hoursWorked": summary["hoursWorked"].reindex(index).add(
+            partial["hoursWorked"].reindex(index), fill_value=0),
+        "servicesMask": masks
+    }, index=index)
 
-    # Group by UID and attendanceDate
-    grouped = df.groupby(["uid", "attendanceDate"]).agg({
-        "hoursWorked": "sum",
-        "servicesPerformed": lambda x: ", ".join(x.str.strip())
-    }).reset_index()
+
+def _fold_attendance_chunk(summary: Optional[pd.DataFrame], batches: List[pa.RecordBatch],
+                           schema: pa.Schema, datetime_format: str,
+                           vocabulary: ServiceVocabulary) -> pd.DataFrame:
+    """Aggregate one chunk of record batches and merge it into the running summary."""
+    partial = _summarise_attendance(pa.Table.from_batches(batches, schema=schema),
+                                    datetime_format, vocabulary)
+    return partial if summary is None else _combine_attendance_summaries(summary, partial, vocabulary)
+
+
+@timed_stage("csv_extract", rows_out=len)
+def extract_attendance_data(csv_filepath: str, chunksize: Optional[int] = None,
+                            datetime_format: str = ATTENDANCE_DATETIME_FORMAT,
+                            max_decompressed_bytes: Optional[int] = None,
+                            name: Optional[str] = None) -> pd.DataFrame:
+    """
+    Extract structured data from a CSV attendance file and return as JSON.
+
+    The CSV is read with the pyarrow CSV reader using ATTENDANCE_SCHEMA, and
+    punch timestamps are parsed with an explicit format rather than inferred.
+    Parquet and Feather/Arrow files are read column-wise (memory-mapped) with
+    the same required columns; punch columns stored as timestamps are used as is.
+    .csv.gz, .csv.zst and .csv.bz2 files are decompressed as a stream while parsing.
+    Uploads can be passed in memory (bytes or a binary file object) together
+    with their file name.
+
+    Args:
+        csv_filepath: Path to the CSV (optionally compressed), Parquet or Feather/Arrow file,
+            or its bytes / a seekable binary file object
+        chunksize: If set, read the CSV in chunks of about this many rows and merge
+            the per-chunk (uid, attendanceDate) aggregates as it goes, so peak memory
+            depends on the number of uid-days rather than the number of punches.
+            The result is the same as reading the whole file at once.
+        datetime_format: strptime format of punchInDateTime/punchOutDateTime
+        max_decompressed_bytes: If set, a compressed CSV that expands beyond this
+            many bytes raises DecompressedSizeExceeded
+        name: File name of an in-memory input (defaults to the object's ``name``);
+            its extension selects the reader and the decompression
+
+    Returns:
+        DataFrame with uid, attendanceDate, totalHoursWorked and servicesPerformed
+    """
+    # Check file exists
+    if _is_path(csv_filepath) and (not os.path.exists(csv_filepath) or not os.path.isfile(csv_filepath)):
+        raise FileNotFoundError(f"CSV file not found: {csv_filepath}")
+
+    vocabulary = ServiceVocabulary()
+    filename = source_name(csv_filepath, name)
+    columnar = is_columnar_file(filename)
+
+    if chunksize:
+        # Stream record batches and fold each chunk into the running aggregate
+        if columnar:
+            schema = read_columnar_schema(csv_filepath, filename)
+            schema = pa.schema([schema.field(col) for col in ATTENDANCE_REQUIRED_COLUMNS
+                                if col in schema.names])
+            reader = iter_columnar_batches(csv_filepath, ATTENDANCE_REQUIRED_COLUMNS,
+                                           "attendance file", chunksize, filename)
+        else:
+            reader = _open_attendance_csv(csv_filepath, pa_csv.open_csv, max_decompressed_bytes, filename)
+            schema = reader.schema
+        summary = None
+        batches = []
+        rows = 0
+        for batch in reader:
+            batches.append(batch)
+            rows += batch.num_rows
+            count_stage_rows_in(batch.num_rows)
+            if rows >= chunksize:
+                summary = _fold_attendance_chunk(summary, batches, schema, datetime_format,
+                                                 vocabulary)
+                batches = []
+                rows = 0
+        if batches or summary is None:
+            summary = _fold_attendance_chunk(summary, batches, schema, datetime_format,
+                                             vocabulary)
+    else:
+        if columnar:
+            table = read_columnar_table(csv_filepath, ATTENDANCE_REQUIRED_COLUMNS, "attendance file",
+                                        filename)
+        else:
+            # Read the whole CSV (multi-threaded) into a typed Arrow table
+            table = _open_attendance_csv(csv_filepath, pa_csv.read_csv, max_decompressed_bytes, filename)
+        count_stage_rows_in(table.num_rows)
+        summary = _summarise_attendance(table, datetime_format, vocabulary)
+
+    grouped = summary.reset_index()
+    grouped["attendanceDate"] = grouped["attendanceDate"].dt.date
+    # services strings are rebuilt once per distinct set
+    grouped["servicesPerformed"] = vocabulary.to_categorical(grouped.pop("servicesMask").to_numpy())
 
     # Rename columns
     grouped.rename(columns={
@@ -121,3 +811,87 @@ def extract_attendance_data(csv_filepath: str) -> Dict[str, Any]:
     }, inplace=True)
 
     return grouped
+
+
+# Batch inputs: agreement and attendance files of a site are paired by name, e.g.
+#   site01_agreement.docx + site01_attendance.csv.gz   -> site01
+#   site01/agreement.docx + site01/attendance.csv      -> site01
+#   site01.docx + site01.csv                           -> site01
+AGREEMENT_NAME_TOKENS = ("agreement", "invoice")
+ATTENDANCE_NAME_TOKENS = ("attendance",)
+ROLE_TOKEN_PATTERN = re.compile(
+    r"(?:^|[\s._-]+)(?:" + "|".join(AGREEMENT_NAME_TOKENS + ATTENDANCE_NAME_TOKENS) + r")(?=$|[\s._-])",
+    re.IGNORECASE
+)
+
+
+def _input_stem(filename: str) -> str:
+    """File name without its extension (.csv.gz etc. count as one extension)."""
+    name = os.path.basename(filename)
+    for suffix in COMPRESSED_CSV_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return os.path.splitext(name)[0]
+
+
+def input_role(filename: str) -> Optional[str]:
+    """
+    'agreement' or 'attendance' for a batch input file, None for anything else.
+
+    DOCX files are agreements and CSVs (plain or compressed) are attendance;
+    Parquet/Feather files need an agreement/invoice or attendance token in
+    their name.
+    """
+    name = filename.lower()
+    if name.endswith(".docx"):
+        return "agreement"
+    if is_csv_file(name):
+        return "attendance"
+    if is_columnar_file(name):
+        tokens = set(re.split(r"[\s._-]+", _input_stem(name)))
+        if tokens & set(AGREEMENT_NAME_TOKENS):
+            return "agreement"
+        if tokens & set(ATTENDANCE_NAME_TOKENS):
+            return "attendance"
+    return None
+
+
+def pair_key(filename: str) -> str:
+    """Site a batch input belongs to: its directory plus its name without the role token."""
+    stem = ROLE_TOKEN_PATTERN.sub("", _input_stem(filename)).strip(" ._-")
+    directory = os.path.dirname(filename).replace(os.sep, "/").strip("/")
+    return "/".join(part for part in (directory, stem) if part) or "default"
+
+
+def pair_input_files(filenames: List[str]) -> Tuple[Dict[str, Dict[str, str]], List[str]]:
+    """
+    Pair agreement and attendance files by site.
+
+    Args:
+        filenames: Paths (or archive member names) of the batch inputs
+
+    Returns:
+        Pairs keyed by site (sorted), each with 'agreement' and 'attendance',
+        and a list of problems: files with no role, no partner, or a site that
+        has more than one file of the same role
+    """
+    sites: Dict[str, Dict[str, List[str]]] = {}
+    problems = []
+    for filename in sorted(filenames):
+        role = input_role(filename)
+        if role is None:
+            problems.append(f"{filename}: not an agreement or attendance file")
+            continue
+        sites.setdefault(pair_key(filename), {}).setdefault(role, []).append(filename)
+
+    pairs = {}
+    for site in sorted(sites):
+        files = sites[site]
+        if any(len(names) > 1 for names in files.values()):
+            problems.append(f"{site}: more than one file per role ({', '.join(sum(files.values(), []))})")
+        elif len(files) < 2:
+            problems.append(f"{site}: no matching {'attendance' if 'agreement' in files else 'agreement'} "
+                            f"file for {sum(files.values(), [])[0]}")
+        else:
+            pairs[site] = {"agreement": files["agreement"][0], "attendance": files["attendance"][0]}
+    return pairs, problems
@@ -0,0 +1,157 @@
+"""
+Opt-in profiling of single reconciliation runs.
+
+A slow customer file cannot always be reproduced locally, so an authorised
+caller can ask for one run to be profiled instead (see profiling_requested in
+app.py, and --profile in the CLI). ProfileCapture wraps that run in cProfile
+and tracemalloc and stores, in a directory per run:
+
+- profile.prof: the cProfile dump (pstats, snakeviz, ...)
+- profile.txt: the functions with the highest cumulative time
+- allocations.txt: the source lines holding the most memory at the end of the run
+- metadata.json: label, duration, peak traced memory and error, if any
+
+Only the newest keep captures are retained. Nothing is imported or started
+unless a capture is requested, so runs that are not profiled pay nothing.
+
+cProfile only sees the thread that runs the capture, and tracemalloc traces
+the whole process, so a process runs one capture at a time; a run asking for
+a capture while another is in progress goes ahead unprofiled.
+"""
+import contextlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+
+PROFILE_METADATA_NAME = "metadata.json"
+PROFILE_STATS_LINES = 60
+
+
+class ProfileCapture:
+    """cProfile + tracemalloc captures of single runs, with bounded retention."""
+
+    def __init__(self, profiles_dir: str, keep: int = 20, top_allocations: int = 30,
+                 traceback_frames: int = 1):
+        """
+        Initialise capture store.
+
+        Args:
+            profiles_dir: Directory receiving one sub-directory per capture
+            keep: Captures retained; older ones are removed when a new one is written
+            top_allocations: Source lines listed in allocations.txt
+            traceback_frames: Frames tracemalloc stores per allocation
+        """
+        self.profiles_dir = profiles_dir
+        self.keep = keep
+        self.top_allocations = top_allocations
+        self.traceback_frames = traceback_frames
+        self._busy = threading.Lock()
+
+    @contextlib.contextmanager
+    def capture(self, label: str, profile_id: Optional[str] = None) -> Iterator[Optional[str]]:
+        """
+        Profile the enclosed block.
+
+        Args:
+            label: What is profiled, e.g. "upload", stored in the metadata
+            profile_id: Name of the capture directory (default: timestamp + random suffix)
+
+        Yields:
+            The capture id, or None when another capture is running in this process
+        """
+        if not self._busy.acquire(blocking=False):
+            print(f"✗ Profiling already running in this process, {label} runs unprofiled")
+            yield None
+            return
+
+        import cProfile
+        import tracemalloc
+
+        profile_id = profile_id or f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(self.traceback_frames)
+        tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+        metadata: Dict[str, Any] = {"profileId": profile_id, "label": label, "pid": os.getpid(),
+                                    "createdAt": datetime.now().isoformat(timespec="seconds"), "error": None}
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            yield profile_id
+        except BaseException as e:
+            metadata["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            profiler.disable()
+            metadata["seconds"] = round(time.perf_counter() - started, 3)
+            try:
+                snapshot = tracemalloc.take_snapshot()
+                metadata["tracedPeakBytes"] = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+                self._write(profile_id, profiler, snapshot, metadata)
+                self._enforce_retention()
+                print(f"✓ Profile {profile_id} written to {self.path(profile_id)}")
+            except Exception as e:   # a failed capture never fails the run it profiled
+                print(f"✗ Writing profile {profile_id} failed: {e}")
+            finally:
+                self._busy.release()
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Return the metadata of every retained capture, newest first."""
+        captures = []
+        for name in self._capture_names():
+            try:
+                with open(os.path.join(self.profiles_dir, name, PROFILE_METADATA_NAME), "r", encoding="utf-8") as f:
+                    captures.append(json.load(f))
+            except (OSError, ValueError):   # still being written, or removed meanwhile
+                continue
+        return captures
+
+    def path(self, profile_id: str) -> Optional[str]:
+        """Return the directory of a finished capture, or None."""
+        path = os.path.join(self.profiles_dir, profile_id)
+        return path if os.path.exists(os.path.join(path, PROFILE_METADATA_NAME)) else None
+
+    def _write(self, profile_id: str, profiler, snapshot, metadata: Dict[str, Any]) -> None:
+        import pstats
+        import tracemalloc
+
+        path = os.path.join(self.profiles_dir, profile_id)
+        os.makedirs(path, exist_ok=True)
+        profiler.dump_stats(os.path.join(path, "profile.prof"))
+        with open(os.path.join(path, "profile.txt"), "w", encoding="utf-8") as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(PROFILE_STATS_LINES)
+
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                           tracemalloc.Filter(False, "<frozen importlib._bootstrap>")])
+        with open(os.path.join(path, "allocations.txt"), "w", encoding="utf-8") as f:
+            f.write(f"Peak traced memory: {metadata['tracedPeakBytes'] / 2 ** 20:.1f} MB\n\n")
+            for stat in snapshot.statistics("lineno")[:self.top_allocations]:
+                f.write(f"{stat}\n")
+
+        # written last: a capture without metadata is still being written
+        with open(os.path.join(path, PROFILE_METADATA_NAME), "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2)
+
+    def _capture_names(self) -> List[str]:
+        entries = []
+        if os.path.isdir(self.profiles_dir):
+            for entry in os.scandir(self.profiles_dir):
+                if entry.is_dir():
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.name))
+                    except FileNotFoundError:
+                        continue
+        return [name for _, name in sorted(entries, reverse=True)]
+
+    def _enforce_retention(self) -> None:
+        for name in self._capture_names()[self.keep:]:
+            shutil.rmtree(os.path.join(self.profiles_dir, name), ignore_errors=True)   # another worker may get there first
@@ -0,0 +1,339 @@
+"""
+Durable background queue publishing finished artifacts to object storage.
+
+A reconciliation should not wait on S3, nor fail because S3 is slow. Finished
+artifacts are handed to a PublishQueue instead: enqueue() copies the file into
+a spool directory and records it in an on-disk journal (one JSON file per
+entry, written to a temp name and renamed), then returns. Background threads
+drain the journal:
+
+- at most max_workers uploads run at the same time
+- a failed upload is retried with exponential backoff and jitter; after
+  max_attempts it is moved to failed/ for inspection instead of retried forever
+- entries left behind by a crash or restart are picked up again by the next
+  queue started on the same directory
+
+Several processes (gunicorn workers, CLI runs) may share a directory. An entry
+is claimed with a lock file holding the claiming pid; the claim of a process
+that has exited is taken over.
+"""
+import json
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import stage_timer
+
+
+JOURNAL_SUFFIX = ".json"
+DATA_SUFFIX = ".data"
+LOCK_SUFFIX = ".lock"
+FAILED_FOLDER = "failed"
+ORPHAN_MIN_AGE_SECONDS = 60 * 60
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True   # exists, owned by someone else
+    return True
+
+
+def s3_publisher(bucket_name: str, endpoint_url: Optional[str] = None) -> Callable[[str, str], Any]:
+    """
+    Return a publish function uploading a file to an S3 bucket.
+
+    boto3 is imported on the first upload, so it is only needed when publishing
+    is configured. Credentials come from the usual boto3 sources (environment,
+    instance role); endpoint_url may point at a local S3 stand-in.
+    """
+    state: Dict[str, Any] = {}
+    lock = threading.Lock()
+
+    def publish(path: str, key: str) -> None:
+        with lock:
+            if "client" not in state:
+                import boto3
+                from botocore.config import Config
+                state["client"] = boto3.client("s3", endpoint_url=endpoint_url,
+                                               config=Config(retries={"max_attempts": 3, "mode": "standard"}))
+        # thread-safe; multipart and concurrent parts are handled by upload_file
+        with stage_timer("upload"):
+            state["client"].upload_file(path, bucket_name, key)
+
+    return publish
+
+
+class PublishQueue:
+    """On-disk journal of artifacts to publish, drained by a bounded pool of background threads."""
+
+    def __init__(self, spool_dir: str, publish: Callable[[str, str], Any],
+                 max_workers: int = 4,
+                 max_attempts: int = 10,
+                 base_delay_seconds: float = 2,
+                 max_delay_seconds: float = 600,
+                 poll_interval_seconds: float = 5):
+        """
+        Initialise queue.
+
+        Args:
+            spool_dir: Directory holding the journal and the spooled artifact copies
+            publish: Called with the spooled file path and the object key; raises on failure
+            max_workers: Uploads running at the same time in this process
+            max_attempts: Attempts before an entry is moved to failed/
+            base_delay_seconds: Delay after the first failure, doubled after every further one
+            max_delay_seconds: Upper bound for the delay between attempts
+            poll_interval_seconds: How often the journal is rescanned for entries of other processes
+        """
+        self.spool_dir = spool_dir
+        self.failed_dir = os.path.join(spool_dir, FAILED_FOLDER)
+        self.publish = publish
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.published = 0
+        self.retried = 0
+        self.given_up = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+    def enqueue(self, path: str, key: str) -> str:
+        """
+        Copy a file into the spool and journal it for publishing under key.
+
+        Returns:
+            The entry id
+        """
+        return self._add(key, os.path.basename(path), lambda data_path: shutil.copyfile(path, data_path))
+
+    def enqueue_bytes(self, data: bytes, key: str) -> str:
+        """Same as enqueue, for an artifact held in memory."""
+        def write(data_path: str) -> None:
+            with open(data_path, "wb") as f:
+                f.write(data)
+        return self._add(key, os.path.basename(key), write)
+
+    def start(self) -> None:
+        """Start draining the journal on a daemon thread (once per process)."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._remove_orphans()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="publish")
+        self._thread = threading.Thread(target=self._run, name="publish-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        """Stop taking new entries; with wait, let running uploads finish."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def drain(self, timeout: Optional[float] = None) -> int:
+        """
+        Wait until the journal is empty (published or given up), or until timeout.
+
+        Returns:
+            Number of entries still pending
+        """
+        self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = len(self._journal_ids())
+            if remaining == 0 or (deadline is not None and time.monotonic() >= deadline):
+                return remaining
+            time.sleep(0.1)
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Return the journal entries waiting to be published, oldest first."""
+        entries = [entry for entry in map(self._read_entry, self._journal_ids()) if entry is not None]
+        return sorted(entries, key=lambda entry: entry["createdAt"])
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the journal size and this process's publish counters."""
+        return {
+            "pid": os.getpid(),
+            "pending": len(self._journal_ids()),
+            "failed": sum(name.endswith(JOURNAL_SUFFIX) for name in os.listdir(self.failed_dir)),
+            **self._counters(),
+        }
+
+    def _counters(self) -> Dict[str, int]:
+        with self._lock:
+            return {"published": self.published, "retried": self.retried, "givenUp": self.given_up}
+
+    def _add(self, key: str, name: str, write_data: Callable[[str], None]) -> str:
+        entry_id = uuid.uuid4().hex
+        data_path = self._path(entry_id, DATA_SUFFIX)
+        write_data(data_path)
+        self._fsync(data_path)
+        # the journal entry is written after its data, so a journaled entry always has its file
+        self._write_entry({"id": entry_id, "key": key, "name": name, "attempts": 0,
+                           "nextAttemptAt": time.time(), "lastError": None,
+                           "createdAt": datetime.now().isoformat(timespec="milliseconds")})
+        self._wake.set()
+        return entry_id
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.clear()
+            next_due = time.time() + self.poll_interval_seconds
+            try:
+                for entry in self.pending():
+                    if entry["nextAttemptAt"] > time.time():
+                        next_due = min(next_due, entry["nextAttemptAt"])
+                        continue
+                    if not self._slots.acquire(blocking=False):
+                        break   # all workers busy, a finishing upload wakes the loop
+                    if not self._claim(entry["id"]):
+                        self._slots.release()
+                        continue
+                    self._executor.submit(self._publish, entry["id"])
+            except Exception as e:
+                print(f"✗ Scanning publish journal {self.spool_dir} failed: {e}")
+            self._wake.wait(max(0.0, next_due - time.time()))
+
+    def _publish(self, entry_id: str) -> None:
+        try:
+            entry = self._read_entry(entry_id)   # re-read: another process may have finished it
+            if entry is None:
+                return
+            data_path = self._path(entry_id, DATA_SUFFIX)
+            try:
+                self.publish(data_path, entry["key"])
+            except Exception as e:
+                self._failed(entry, e)
+                return
+            self._remove(entry_id)
+            with self._lock:
+                self.published += 1
+            print(f"✓ Published {entry['name']} -> {entry['key']}")
+        except Exception as e:
+            print(f"✗ Publishing entry {entry_id} failed: {e}")
+        finally:
+            self._release(entry_id)
+            self._slots.release()
+            self._wake.set()
+
+    def _failed(self, entry: Dict[str, Any], error: Exception) -> None:
+        entry["attempts"] += 1
+        entry["lastError"] = f"{type(error).__name__}: {error}"
+        if entry["attempts"] >= self.max_attempts:
+            for suffix in (DATA_SUFFIX, JOURNAL_SUFFIX):
+                os.replace(self._path(entry["id"], suffix),
+                           os.path.join(self.failed_dir, f"{entry['id']}{suffix}"))
+            with self._lock:
+                self.given_up += 1
+            print(f"✗ Giving up publishing {entry['name']} after {entry['attempts']} attempts: {error}")
+            return
+        # full jitter on the upper half, so workers retrying together spread out
+        delay = min(self.base_delay_seconds * 2 ** (entry["attempts"] - 1), self.max_delay_seconds)
+        delay *= random.uniform(0.5, 1.0)
+        entry["nextAttemptAt"] = time.time() + delay
+        self._write_entry(entry)
+        with self._lock:
+            self.retried += 1
+        print(f"✗ Publishing {entry['name']} failed (attempt {entry['attempts']}/{self.max_attempts}), "
+              f"retrying in {delay:.1f}s: {error}")
+
+    def _claim(self, entry_id: str) -> bool:
+        lock_path = self._path(entry_id, LOCK_SUFFIX)
+        for _ in range(2):
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    with open(lock_path, "r") as f:
+                        owner = int(f.read() or 0)
+                except (OSError, ValueError):
+                    return False   # being written by its owner
+                if owner and _pid_alive(owner):
+                    return False
+                try:
+                    os.remove(lock_path)   # owner exited mid-upload, take the entry over
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+
+    def _release(self, entry_id: str) -> None:
+        try:
+            os.remove(self._path(entry_id, LOCK_SUFFIX))
+        except FileNotFoundError:
+            pass
+
+    def _journal_ids(self) -> List[str]:
+        return [name[:-len(JOURNAL_SUFFIX)] for name in os.listdir(self.spool_dir)
+                if name.endswith(JOURNAL_SUFFIX)]
+
+    def _read_entry(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(entry_id, JOURNAL_SUFFIX), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):   # published meanwhile
+            return None
+
+    def _write_entry(self, entry: Dict[str, Any]) -> None:
+        path = self._path(entry["id"], JOURNAL_SUFFIX)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _remove(self, entry_id: str) -> None:
+        # journal first: an entry without its journal file is never picked up again
+        for suffix in (JOURNAL_SUFFIX, DATA_SUFFIX):
+            try:
+                os.remove(self._path(entry_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _remove_orphans(self) -> None:
+        # spooled data whose journal entry was never written (crash inside enqueue), or
+        # was removed before the data (crash after publishing); younger files may belong
+        # to an enqueue still in progress in another process
+        journaled = set(self._journal_ids())
+        cutoff = time.time() - ORPHAN_MIN_AGE_SECONDS
+        for entry in os.scandir(self.spool_dir):
+            entry_id = entry.name.split(".", 1)[0]
+            if not entry.is_file() or entry_id in journaled:
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def _path(self, entry_id: str, suffix: str) -> str:
+        return os.path.join(self.spool_dir, f"{entry_id}{suffix}")
+
+    @staticmethod
+    def _fsync(path: str) -> None:
+        with open(path, "rb") as f:
+            os.fsync(f.fileno())
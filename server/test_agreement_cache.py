@@ -0,0 +1,118 @@
+"""Unit tests of the grouped agreement cache."""
+import io
+import os
+
+import pandas as pd
+import pytest
+
+from agreement_cache import AgreementCache, file_digest
+from process import build_agreement_index, extract_agreement_data, group_agreement_records
+
+
+def load_agreement(path):
+    return build_agreement_index(group_agreement_records(extract_agreement_data(path)))
+
+
+class CountingLoader:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, path):
+        self.calls += 1
+        return load_agreement(path)
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / "cache")
+
+
+def test_miss_then_memory_hit(cache_dir, sample_agreement):
+    cache = AgreementCache(cache_dir)
+    loader = CountingLoader()
+
+    first = cache.get_or_load(sample_agreement, loader)
+    second = cache.get_or_load(sample_agreement, loader)
+
+    assert loader.calls == 1
+    pd.testing.assert_frame_equal(first, second)
+    assert (cache.misses, cache.memory_hits, cache.disk_hits) == (1, 1, 0)
+
+
+def test_disk_hit_in_another_worker_keeps_the_index(cache_dir, sample_agreement):
+    expected = AgreementCache(cache_dir).get_or_load(sample_agreement, load_agreement)
+    loader = CountingLoader()
+    other_worker = AgreementCache(cache_dir)
+
+    frame = other_worker.get_or_load(sample_agreement, loader)
+
+    assert loader.calls == 0
+    assert other_worker.disk_hits == 1
+    pd.testing.assert_frame_equal(frame, expected)
+
+
+def test_hits_are_copies(cache_dir, sample_agreement):
+    cache = AgreementCache(cache_dir)
+    frame = cache.get_or_load(sample_agreement, load_agreement)
+    frame["totalSystemHours"] = 0
+
+    assert (cache.get(file_digest(sample_agreement))["totalSystemHours"] != 0).all()
+
+
+def test_in_memory_upload_has_the_same_key(sample_agreement):
+    with open(sample_agreement, "rb") as f:
+        stream = io.BytesIO(f.read())
+
+    assert file_digest(stream) == file_digest(sample_agreement)
+    assert stream.tell() == 0
+
+
+def test_frames_of_another_version_are_not_served(cache_dir, sample_agreement):
+    digest = file_digest(sample_agreement)
+    AgreementCache(cache_dir, version=1).put(digest, load_agreement(sample_agreement), {"documentName": "old"})
+    cache = AgreementCache(cache_dir, version=2)
+
+    assert cache.get(digest) is None
+    assert cache.metadata(digest) is None
+    assert cache.entries() == []
+    assert cache.misses == 1
+
+
+def test_disk_budget_evicts_least_recently_used_first(cache_dir, sample_agreement):
+    frame = load_agreement(sample_agreement)
+    stale = AgreementCache(cache_dir, version=1)
+    stale.put("stale", frame)
+    cache = AgreementCache(cache_dir, version=2)
+    cache.put("a", frame)
+    frame_bytes = os.path.getsize(cache._disk_path("a"))
+    cache.max_disk_bytes = 2 * frame_bytes
+    os.utime(stale._disk_path("stale"), (0, 0))
+
+    cache.put("b", frame)
+
+    assert not os.path.exists(stale._disk_path("stale"))
+    assert sorted(entry["digest"] for entry in cache.entries()) == ["a", "b"]
+    assert cache.get("a") is not None and cache.get("b") is not None
+
+
+def test_memory_layer_is_bounded_by_entries(cache_dir, sample_agreement):
+    frame = load_agreement(sample_agreement)
+    cache = AgreementCache(cache_dir, max_memory_entries=1)
+    cache.put("a", frame)
+    cache.put("b", frame)
+
+    cache.get("a")
+
+    assert cache.stats()["memoryEntries"] == 1
+    assert cache.disk_hits == 1
+
+
+def test_metadata_and_remove(cache_dir, sample_agreement):
+    cache = AgreementCache(cache_dir)
+    cache.put("a", load_agreement(sample_agreement), {"documentName": "agreement.docx"})
+
+    assert cache.metadata("a") == {"documentName": "agreement.docx"}
+    assert [entry["digest"] for entry in cache.entries()] == ["a"]
+    assert cache.remove("a") is True
+    assert cache.get("a") is None
+    assert cache.remove("a") is False
@@ -0,0 +1,25 @@
+"""Unit tests of reconciling one batch pair in-process."""
+import os
+
+from docx import Document
+
+from batch import PAIR_SUCCEEDED, reconcile_pair
+
+
+def test_report_is_produced_with_more_than_64_services(tmp_path):
+    services = [f"service {number:02d}" for number in range(70)]
+    document = Document()
+    for uid, service in enumerate(services, start=1):
+        for paragraph in (f"UID: {uid}", "system hours: 1", f"services performed: {service}"):
+            document.add_paragraph(paragraph)
+    agreement = str(tmp_path / "agreement.docx")
+    document.save(agreement)
+    attendance = tmp_path / "attendance.csv"
+    attendance.write_text("uid,punchInDateTime,punchOutDateTime,servicesPerformed\n" + "".join(
+        f"{uid},1/11/2025 9:00,1/11/2025 10:30,{service}\n" for uid, service in enumerate(services, start=1)))
+
+    entry = reconcile_pair("site", agreement, str(attendance), str(tmp_path / "out"), {"formats": ["csv"]})
+
+    assert entry["status"] == PAIR_SUCCEEDED, entry.get("error")
+    assert (entry["attendanceRecords"], entry["agreementRecords"], entry["mergedRecords"]) == (70, 70, 70)
+    assert all(os.path.getsize(tmp_path / "out" / name) > 0 for name in entry["files"])
@@ -0,0 +1,157 @@
+"""Unit tests of the background job store and runner."""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from job_store import (JOB_DATABASE_NAME, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED,
+                       STAGE_DONE, STAGE_FAILED, JobRunner, JobStore)
+
+
+STAGES = ["extract", "merge", "export"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs"))
+
+
+def set_owner(store, job_id, **fields):
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with sqlite3.connect(store.db_path) as conn:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_job_lifecycle(store):
+    job_id = store.create(STAGES, {"csvFile": "attendance.csv"})
+    assert store.get(job_id)["status"] == JOB_QUEUED
+
+    store.start_stage(job_id, "extract")
+    store.start_stage(job_id, "merge")
+    job = store.get(job_id)
+    assert (job["status"], job["stage"], job["progress"]) == (JOB_RUNNING, "merge", round(1 / 3, 3))
+
+    store.succeed(job_id, os.path.join(store.job_dir(job_id), "result.xlsx"))
+    job = store.get(job_id)
+    assert (job["status"], job["artifact"]) == (JOB_SUCCEEDED, "result.xlsx")
+    assert job["params"] == {"csvFile": "attendance.csv"}
+    assert store.artifact_path(job_id).endswith("result.xlsx")
+
+
+def test_job_of_a_live_owner_with_a_heartbeat_stays_active(store):
+    job_id = store.create(STAGES)
+    set_owner(store, job_id, owner="other-worker", pid=os.getppid(), heartbeat_at=time.time())
+
+    assert store.get(job_id)["status"] == JOB_QUEUED
+
+
+def test_job_without_a_recent_heartbeat_fails(store):
+    job_id = store.create(STAGES)
+    store.start_stage(job_id, "extract")
+    # the pid belongs to some live process, but the owner stopped beating
+    set_owner(store, job_id, owner="other-worker", pid=os.getppid(),
+              heartbeat_at=time.time() - store.heartbeat_timeout_seconds - 1)
+
+    job = store.get(job_id)
+
+    assert job["status"] == JOB_FAILED
+    assert job["stages"][0]["status"] == STAGE_FAILED
+    assert "exited" in job["error"]
+
+
+def test_job_of_an_earlier_process_with_this_pid_fails(store):
+    job_id = store.create(STAGES)
+    set_owner(store, job_id, owner="previous-worker", pid=os.getpid(), heartbeat_at=time.time())
+
+    assert store.get(job_id)["status"] == JOB_FAILED
+
+
+def test_job_of_an_exited_process_fails(store):
+    job_id = store.create(STAGES)
+    set_owner(store, job_id, owner="exited-worker", pid=exited_pid(), heartbeat_at=time.time())
+
+    assert store.get(job_id)["status"] == JOB_FAILED
+    assert not store.is_active(job_id)
+
+
+def test_heartbeat_is_refreshed(tmp_path):
+    store = JobStore(str(tmp_path / "jobs"), heartbeat_seconds=0.05)
+    job_id = store.create(STAGES)
+    set_owner(store, job_id, heartbeat_at=0)
+
+    deadline = time.time() + 5
+    while store._row(job_id)["heartbeat_at"] == 0 and time.time() < deadline:
+        time.sleep(0.05)
+
+    assert store._row(job_id)["heartbeat_at"] > 0
+
+
+def test_database_of_the_first_release_is_migrated(tmp_path):
+    jobs_dir = tmp_path / "jobs"
+    jobs_dir.mkdir()
+    with sqlite3.connect(str(jobs_dir / JOB_DATABASE_NAME)) as conn:
+        conn.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, pid INTEGER NOT NULL, "
+                     "params TEXT NOT NULL, stages TEXT NOT NULL, error TEXT, artifact TEXT, "
+                     "created_at TEXT NOT NULL, started_at TEXT, finished_at TEXT)")
+        conn.execute("INSERT INTO jobs (id, status, pid, params, stages, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                     ("a" * 32, JOB_RUNNING, os.getppid(), "{}", json.dumps([]), "2025-11-01T00:00:00"))
+
+    store = JobStore(str(jobs_dir))
+
+    # written before owners and heartbeats existed; its pid is taken by another process now
+    assert store.get("a" * 32)["status"] == JOB_FAILED
+    assert store.get(store.create(STAGES))["status"] == JOB_QUEUED
+
+
+def test_finished_job_is_not_failed_by_a_stale_read(store):
+    job_id = store.create(STAGES)
+    store.succeed(job_id, "result.xlsx")
+
+    store._finish(job_id, JOB_FAILED, STAGE_FAILED, active_only=True, error="stale")
+
+    assert store.get(job_id)["status"] == JOB_SUCCEEDED
+
+
+def test_runner_records_success_and_failure(store):
+    runner = JobRunner(store, max_workers=1, max_pending=2)
+    succeeded, failed = store.create(STAGES), store.create(STAGES)
+
+    def task(on_stage):
+        for stage in STAGES:
+            on_stage(stage)
+        return "result.xlsx"
+
+    def broken(on_stage):
+        on_stage("extract")
+        raise ValueError("bad attendance file")
+
+    assert runner.submit(succeeded, task)
+    assert runner.submit(failed, broken)
+    runner._executor.shutdown(wait=True)
+
+    job = store.get(succeeded)
+    assert job["status"] == JOB_SUCCEEDED
+    assert [stage["status"] for stage in job["stages"]] == [STAGE_DONE, STAGE_DONE, STAGE_DONE]
+    job = store.get(failed)
+    assert (job["status"], job["error"]) == (JOB_FAILED, "bad attendance file")
+
+
+def test_runner_refuses_jobs_beyond_max_pending(store):
+    runner = JobRunner(store, max_workers=1, max_pending=1)
+    release = threading.Event()
+
+    assert runner.submit(store.create(STAGES), lambda on_stage: release.wait() and "result.xlsx")
+    assert not runner.submit(store.create(STAGES), lambda on_stage: "result.xlsx")
+    release.set()
+    runner._executor.shutdown(wait=True)
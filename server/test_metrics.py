@@ -0,0 +1,61 @@
+"""Unit tests of the stage timing helpers and the shared stage metrics."""
+import sqlite3
+
+import pytest
+
+from metrics import StageMetrics, StageRecord, add_stage_observer, remove_stage_observer, render_prometheus, stage_timer
+
+
+def record(stage, seconds, rows_in=None, rows_out=None, failed=False, process_peak_rss_bytes=None):
+    result = StageRecord(stage, rows_in)
+    result.seconds, result.rows_out, result.failed = seconds, rows_out, failed
+    result.process_peak_rss_bytes = process_peak_rss_bytes
+    return result
+
+
+def stored_rows(metrics):
+    with sqlite3.connect(metrics.db_path) as conn:
+        return conn.execute("SELECT count(*) FROM stage_metrics").fetchone()[0]
+
+
+def test_records_stay_in_memory_until_flushed(tmp_path):
+    metrics = StageMetrics(str(tmp_path))
+    metrics.observe(record("merge", 0.02, rows_in=10, rows_out=4))
+
+    assert stored_rows(metrics) == 0
+    metrics.flush()
+    assert stored_rows(metrics) > 0
+
+
+def test_workers_are_totalled(tmp_path):
+    first, second = StageMetrics(str(tmp_path)), StageMetrics(str(tmp_path))
+    first.observe(record("merge", 0.02, rows_in=10, rows_out=4, process_peak_rss_bytes=100))
+    second.observe(record("merge", 3, rows_in=5, rows_out=1, failed=True, process_peak_rss_bytes=300))
+    second.flush()
+
+    merge = first.snapshot()["merge"]   # flushes its own records first
+
+    assert (merge["count"], merge["errors"], merge["rowsIn"], merge["rowsOut"]) == (2, 1, 15, 5)
+    assert merge["seconds"] == pytest.approx(3.02)
+    assert merge["processPeakRssBytes"] == 300
+    assert dict(merge["buckets"])["0.025"] == 1
+    assert dict(merge["buckets"])["+Inf"] == 2
+
+
+def test_stage_timer_reports_to_observers(tmp_path):
+    metrics = StageMetrics(str(tmp_path))
+    add_stage_observer(metrics.observe)
+    try:
+        with stage_timer("export", rows_in=3) as stage:
+            stage.rows_out = 3
+        with pytest.raises(ValueError):
+            with stage_timer("export"):
+                raise ValueError("disk full")
+    finally:
+        remove_stage_observer(metrics.observe)
+
+    text = render_prometheus(metrics.snapshot())
+
+    assert 'reconciliation_stage_seconds_count{stage="export"} 2' in text
+    assert 'reconciliation_stage_errors_total{stage="export"} 1' in text
+    assert 'reconciliation_process_peak_rss_bytes{stage="export"}' in text
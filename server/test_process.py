@@ -0,0 +1,210 @@
+"""Unit tests of the agreement and attendance extraction in process.py."""
+import datetime
+import gzip
+import re
+
+import pandas as pd
+import pytest
+from docx import Document
+
+from process import (AgreementRecordScanner, _iter_docx_paragraphs, extract_agreement_data,
+                     extract_attendance_data)
+
+
+def baseline_agreement_records(docx_filepath):
+    """The original python-docx + per-block re.search extraction, kept as the reference."""
+    full_text = "\n".join(para.text for para in Document(docx_filepath).paragraphs)
+    uid_pattern = r"UID:\s*(\d+)"
+    hours_pattern = r"system\s+hours:\s*(\d+)"
+    services_pattern = r"services\s+performed:\s*(.*\n)"
+    uid_matches = list(re.finditer(uid_pattern, full_text, re.IGNORECASE))
+    records = []
+    for i, uid_match in enumerate(uid_matches):
+        end_pos = uid_matches[i + 1].start() if i + 1 < len(uid_matches) else len(full_text)
+        record_text = full_text[uid_match.start():end_pos]
+        hours = re.search(hours_pattern, record_text, re.IGNORECASE)
+        services = re.search(services_pattern, record_text, re.IGNORECASE)
+        if hours and services:
+            records.append({"uid": int(uid_match.group(1)), "systemHours": int(hours.group(1)),
+                            "servicesPerformed": services.group(1).strip()})
+    return records
+
+
+AGREEMENTS = [
+    (88888888, 7, "electrical, engineering, plumbing"),
+    (88895688, 6, "plumbing"),
+    (88895685, 12, "engineering, electrical"),
+]
+
+
+def write_docx(path, paragraphs):
+    document = Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    document.save(str(path))
+    return str(path)
+
+
+def same_line_layout():
+    for uid, hours, services in AGREEMENTS:
+        yield from [f"UID: {uid}", f"system hours: {hours}", f"services performed: {services}", ""]
+
+
+def next_paragraph_layout():
+    # labels on their own paragraph, values on the paragraph after
+    for uid, hours, services in AGREEMENTS:
+        yield from ["UID:", str(uid), "System Hours:", str(hours), "Services performed:", services, ""]
+
+
+@pytest.mark.parametrize("layout", [same_line_layout, next_paragraph_layout])
+def test_scanner_matches_baseline(tmp_path, layout):
+    path = write_docx(tmp_path / "agreement.docx", layout())
+
+    result = extract_agreement_data(path)
+
+    expected = [{"uid": uid, "systemHours": hours, "servicesPerformed": services}
+                for uid, hours, services in AGREEMENTS]
+    assert baseline_agreement_records(path) == expected
+    assert result["records"] == expected
+    assert result["totalRecord"] == len(AGREEMENTS)
+    assert result["skippedRecords"] == []
+
+
+def test_sample_agreement_matches_baseline(sample_agreement):
+    assert extract_agreement_data(sample_agreement)["records"] == baseline_agreement_records(sample_agreement)
+
+
+@pytest.mark.parametrize("layout", [same_line_layout, next_paragraph_layout])
+def test_scanner_result_does_not_depend_on_how_text_is_fed(layout):
+    text = "\n".join(layout()) + "\n"
+    whole = AgreementRecordScanner()
+    by_character = AgreementRecordScanner()
+
+    records = [*whole.feed(text), *whole.close()]
+    fed = [record for char in text for record in by_character.feed(char)] + list(by_character.close())
+
+    assert records == fed == AGREEMENTS
+
+
+def test_empty_services_does_not_swallow_next_uid(tmp_path):
+    path = write_docx(tmp_path / "agreement.docx", [
+        "UID: 1", "system hours: 3", "services performed:", "",
+        "UID: 2", "system hours: 4", "services performed: plumbing", "",
+    ])
+
+    result = extract_agreement_data(path)
+
+    assert result["records"] == [{"uid": 2, "systemHours": 4, "servicesPerformed": "plumbing"}]
+    assert result["skippedRecords"] == [{"uid": 1, "reason": "missing services performed"}]
+
+
+def test_incomplete_blocks_are_reported(tmp_path):
+    path = write_docx(tmp_path / "agreement.docx", [
+        "system hours: 5",
+        "UID: 1", "services performed: electrical",
+        "UID: 2", "system hours: 4", "services performed: plumbing",
+    ])
+
+    result = extract_agreement_data(path)
+
+    assert result["records"] == [{"uid": 2, "systemHours": 4, "servicesPerformed": "plumbing"}]
+    assert result["skippedRecords"] == [{"uid": None, "reason": "system hours outside a UID block"},
+                                        {"uid": 1, "reason": "missing system hours"}]
+
+
+def test_paragraphs_match_python_docx(tmp_path):
+    document = Document()
+    document.add_paragraph("UID: 88888888")
+    run = document.add_paragraph("system hours").add_run(": ")
+    run.add_tab()
+    run.add_text("7")
+    run.add_break()
+    run.add_text("continued")
+    document.add_table(rows=1, cols=1).cell(0, 0).text = "UID: 1 inside a table"
+    document.add_paragraph("")
+    document.add_paragraph("services performed: electrical")
+    path = tmp_path / "agreement.docx"
+    document.save(str(path))
+
+    paragraphs = list(_iter_docx_paragraphs(str(path)))
+
+    assert paragraphs == [para.text for para in Document(str(path)).paragraphs]
+    assert "UID: 1 inside a table" not in paragraphs
+
+
+def test_agreement_from_bytes_matches_path(sample_agreement):
+    with open(sample_agreement, "rb") as f:
+        data = f.read()
+
+    assert extract_agreement_data(data)["records"] == extract_agreement_data(sample_agreement)["records"]
+
+
+def write_csv(path, rows):
+    path.write_text("uid,punchInDateTime,punchOutDateTime,servicesPerformed\n"
+                    + "".join(f"{row}\n" for row in rows))
+    return str(path)
+
+
+def test_attendance_dates_are_day_first(sample_attendance):
+    df = extract_attendance_data(sample_attendance)
+
+    # "1/11/2025 9:00" is 1 November, not 11 January
+    assert sorted(set(df["attendanceDate"])) == [datetime.date(2025, 11, 1), datetime.date(2025, 11, 2)]
+    day = df[(df["uid"] == 88888888) & (df["attendanceDate"] == datetime.date(2025, 11, 1))].iloc[0]
+    assert day["totalHoursWorked"] == pytest.approx((3 * 60 + 54 + 4 * 60 + 13) / 60)
+    assert day["servicesPerformed"] == "electrical, engineering"
+
+
+def test_attendance_day_after_the_twelfth_parses(tmp_path):
+    path = write_csv(tmp_path / "attendance.csv", ["1,13/11/2025 9:00,13/11/2025 17:30,plumbing"])
+
+    df = extract_attendance_data(path)
+
+    assert df["attendanceDate"].tolist() == [datetime.date(2025, 11, 13)]
+    assert df["totalHoursWorked"].tolist() == [8.5]
+
+
+def test_attendance_datetime_format_can_be_overridden(tmp_path):
+    path = write_csv(tmp_path / "attendance.csv", ["1,11/13/2025 9:00,11/13/2025 10:00,plumbing"])
+
+    df = extract_attendance_data(path, datetime_format="%m/%d/%Y %H:%M")
+
+    assert df["attendanceDate"].tolist() == [datetime.date(2025, 11, 13)]
+
+
+def test_attendance_chunked_and_compressed_reads_match(tmp_path, sample_attendance):
+    with open(sample_attendance, "rb") as f:
+        data = f.read()
+    compressed = tmp_path / "attendance.csv.gz"
+    compressed.write_bytes(gzip.compress(data))
+
+    expected = extract_attendance_data(sample_attendance)
+
+    pd.testing.assert_frame_equal(extract_attendance_data(sample_attendance, chunksize=3), expected)
+    pd.testing.assert_frame_equal(extract_attendance_data(str(compressed)), expected)
+
+
+def test_attendance_missing_column_is_reported(tmp_path):
+    path = tmp_path / "attendance.csv"
+    path.write_text("uid,punchInDateTime\n1,1/11/2025 9:00\n")
+
+    with pytest.raises(ValueError, match="punchOutDateTime"):
+        extract_attendance_data(str(path))
+
+
+def test_more_services_than_fit_a_uint64_mask(tmp_path):
+    # free text: casing variants alone make this 140 distinct services
+    services = [f"Service {number:02d}" for number in range(70)] + [f"service {number:02d}" for number in range(70)]
+    rows = [f"{uid},1/11/2025 9:00,1/11/2025 10:00,{service}" for uid, service in enumerate(services, start=1)]
+    rows.append("1,1/11/2025 11:00,1/11/2025 12:30,service 69")
+    path = write_csv(tmp_path / "attendance.csv", rows)
+
+    whole = extract_attendance_data(path)
+    chunked = extract_attendance_data(path, chunksize=50)
+
+    pd.testing.assert_frame_equal(chunked, whole)
+    by_uid = dict(zip(whole["uid"], whole["servicesPerformed"]))
+    assert len(by_uid) == len(services)
+    assert by_uid[1] == "Service 00, service 69"
+    assert by_uid[140] == "service 69"
+    assert whole.loc[whole["uid"] == 1, "totalHoursWorked"].tolist() == [2.5]
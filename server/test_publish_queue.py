@@ -0,0 +1,156 @@
+"""Unit tests of the durable publish queue, including replay of entries left by a crashed process."""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from publish_queue import DATA_SUFFIX, JOURNAL_SUFFIX, LOCK_SUFFIX, ORPHAN_MIN_AGE_SECONDS, PublishQueue
+
+
+class RecordingPublisher:
+    """Publish function keeping what it was given; fails its first `failures` calls."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.published = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, path, key):
+        with self._lock:
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise ConnectionError("endpoint unreachable")
+            with open(path, "rb") as f:
+                self.published[key] = f.read()
+
+
+def new_queue(spool_dir, publish, **options):
+    options = {"base_delay_seconds": 0.01, "max_delay_seconds": 0.05, "poll_interval_seconds": 0.05, **options}
+    return PublishQueue(str(spool_dir), publish, **options)
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+@pytest.fixture
+def spool_dir(tmp_path):
+    return tmp_path / "publish"
+
+
+def test_enqueued_file_is_published_and_removed(spool_dir, tmp_path):
+    report = tmp_path / "result.xlsx"
+    report.write_bytes(b"report")
+    publisher = RecordingPublisher()
+    queue = new_queue(spool_dir, publisher)
+
+    queue.enqueue(str(report), "jobs/1/result.xlsx")
+    report.unlink()   # the spooled copy is what gets published
+    remaining = queue.drain(timeout=5)
+    queue.stop()
+
+    assert remaining == 0
+    assert publisher.published == {"jobs/1/result.xlsx": b"report"}
+    assert os.listdir(spool_dir) == ["failed"]
+
+
+def test_entries_of_a_crashed_process_are_published_by_the_next_queue(spool_dir):
+    # journaled, but the process exited before its threads published anything
+    crashed = new_queue(spool_dir, RecordingPublisher())
+    crashed.enqueue_bytes(b"first", "watch/first.csv")
+    crashed.enqueue_bytes(b"second", "watch/second.csv")
+    publisher = RecordingPublisher()
+    queue = new_queue(spool_dir, publisher)
+
+    remaining = queue.drain(timeout=5)
+    queue.stop()
+
+    assert remaining == 0
+    assert publisher.published == {"watch/first.csv": b"first", "watch/second.csv": b"second"}
+
+
+def test_claim_of_an_exited_process_is_taken_over(spool_dir):
+    entry_id = new_queue(spool_dir, RecordingPublisher()).enqueue_bytes(b"report", "result.csv")
+    (spool_dir / f"{entry_id}{LOCK_SUFFIX}").write_text(str(exited_pid()))
+    publisher = RecordingPublisher()
+    queue = new_queue(spool_dir, publisher)
+
+    remaining = queue.drain(timeout=5)
+    queue.stop()
+
+    assert remaining == 0
+    assert publisher.published == {"result.csv": b"report"}
+
+
+def test_claim_of_a_live_process_is_left_alone(spool_dir):
+    entry_id = new_queue(spool_dir, RecordingPublisher()).enqueue_bytes(b"report", "result.csv")
+    (spool_dir / f"{entry_id}{LOCK_SUFFIX}").write_text(str(os.getppid()))
+    publisher = RecordingPublisher()
+    queue = new_queue(spool_dir, publisher)
+
+    remaining = queue.drain(timeout=0.3)
+    queue.stop()
+
+    assert remaining == 1
+    assert publisher.calls == 0
+
+
+def test_failed_upload_is_retried(spool_dir):
+    publisher = RecordingPublisher(failures=2)
+    queue = new_queue(spool_dir, publisher)
+    queue.enqueue_bytes(b"report", "result.csv")
+
+    remaining = queue.drain(timeout=5)
+    queue.stop()
+
+    assert remaining == 0
+    assert publisher.published == {"result.csv": b"report"}
+    assert (queue.retried, queue.published) == (2, 1)
+
+
+def test_entry_is_moved_to_failed_after_max_attempts(spool_dir):
+    queue = new_queue(spool_dir, RecordingPublisher(failures=100), max_attempts=3)
+    entry_id = queue.enqueue_bytes(b"report", "result.csv")
+
+    remaining = queue.drain(timeout=5)
+    queue.stop()
+
+    assert remaining == 0
+    assert sorted(os.listdir(spool_dir / "failed")) == [f"{entry_id}{DATA_SUFFIX}", f"{entry_id}{JOURNAL_SUFFIX}"]
+    assert queue.stats()["failed"] == 1
+    assert queue.given_up == 1
+
+
+def test_old_spooled_data_without_a_journal_entry_is_removed(spool_dir):
+    queue = new_queue(spool_dir, RecordingPublisher())
+    old, young = spool_dir / f"old{DATA_SUFFIX}", spool_dir / f"young{DATA_SUFFIX}"
+    old.write_bytes(b"crashed inside enqueue")
+    young.write_bytes(b"enqueue in progress elsewhere")
+    stale = time.time() - ORPHAN_MIN_AGE_SECONDS - 1
+    os.utime(old, (stale, stale))
+
+    queue.start()
+    queue.stop()
+
+    assert not old.exists()
+    assert young.exists()
+
+
+def test_journal_of_the_command_line_queue_is_published_here(spool_dir, cli_process):
+    # process.py --watch and the server may share a spool directory
+    cli_queue = cli_process.PublishQueue(str(spool_dir), RecordingPublisher())
+    cli_queue.enqueue_bytes(b"report", "watch/result.csv")
+    publisher = RecordingPublisher()
+    queue = new_queue(spool_dir, publisher)
+
+    remaining = queue.drain(timeout=5)
+    queue.stop()
+
+    assert remaining == 0
+    assert publisher.published == {"watch/result.csv": b"report"}
@@ -0,0 +1,121 @@
+"""Unit tests of the multipart S3 upload of the command-line process.py, against a stubbed client."""
+import threading
+
+import pytest
+
+
+PART_SIZE = 5 * 1024 * 1024
+
+
+class ClientError(Exception):
+    """Shaped like botocore.exceptions.ClientError."""
+
+    def __init__(self, code, status):
+        super().__init__(f"An error occurred ({code})")
+        self.response = {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}
+
+
+class StubS3Client:
+    """Records the calls of an upload; failures maps a part number to the errors it raises first."""
+
+    def __init__(self, failures=None):
+        self.failures = {number: list(errors) for number, errors in (failures or {}).items()}
+        self.parts = {}
+        self.attempts = {}
+        self.objects = {}
+        self.completed = []
+        self.aborted = []
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+        return {"ETag": '"single"'}
+
+    def create_multipart_upload(self, Bucket, Key):
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self._lock:
+            self.attempts[PartNumber] = self.attempts.get(PartNumber, 0) + 1
+            errors = self.failures.get(PartNumber)
+            if errors:
+                raise errors.pop(0)
+            self.parts[PartNumber] = Body
+        return {"ETag": f'"part-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed.append(MultipartUpload["Parts"])
+        self.objects[Key] = b"".join(self.parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+        return {"ETag": '"multipart"'}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(UploadId)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(cli_process, monkeypatch):
+    monkeypatch.setattr(cli_process.time, "sleep", lambda seconds: None)
+
+
+def uploader(cli_process, client):
+    return cli_process.S3Uploader("bucket", client=client, part_size=PART_SIZE, max_concurrency=2)
+
+
+def payload(size):
+    return bytes(range(256)) * (size // 256) + b"x" * (size % 256)
+
+
+def test_small_object_is_sent_in_one_put(cli_process):
+    client = StubS3Client()
+
+    result = uploader(cli_process, client).upload_buffer(b"report", "reports/result.csv")
+
+    assert client.objects == {"reports/result.csv": b"report"}
+    assert (result["parts"], result["etag"]) == (1, '"single"')
+
+
+def test_large_object_is_sent_in_parts(cli_process, tmp_path):
+    data = payload(2 * PART_SIZE + 123)
+    path = tmp_path / "result.xlsx"
+    path.write_bytes(data)
+    client = StubS3Client()
+
+    result = uploader(cli_process, client).upload_file(str(path), "reports/result.xlsx")
+
+    assert client.objects["reports/result.xlsx"] == data
+    assert [part["PartNumber"] for part in client.completed[0]] == [1, 2, 3]
+    assert (result["parts"], result["bytes"]) == (3, len(data))
+    assert client.aborted == []
+
+
+def test_failed_part_is_sent_again_alone(cli_process):
+    data = payload(3 * PART_SIZE)
+    client = StubS3Client(failures={2: [ClientError("SlowDown", 503), ConnectionResetError("reset")]})
+
+    uploader(cli_process, client).upload_buffer(data, "reports/result.xlsx")
+
+    assert client.objects["reports/result.xlsx"] == data
+    assert client.attempts == {1: 1, 2: 3, 3: 1}
+
+
+def test_upload_is_aborted_when_a_part_keeps_failing(cli_process):
+    errors = [ClientError("InternalError", 500)] * cli_process.S3_MAX_PART_ATTEMPTS
+    client = StubS3Client(failures={2: errors})
+
+    with pytest.raises(ClientError):
+        uploader(cli_process, client).upload_buffer(payload(3 * PART_SIZE), "reports/result.xlsx")
+
+    assert client.attempts[2] == cli_process.S3_MAX_PART_ATTEMPTS
+    assert client.aborted == ["upload-1"]
+    assert client.completed == []
+
+
+@pytest.mark.parametrize("code", ["AccessDenied", "NoSuchBucket", "NoSuchUpload"])
+def test_permanent_errors_are_not_retried(cli_process, code):
+    client = StubS3Client(failures={1: [ClientError(code, 403 if code == "AccessDenied" else 404)]})
+
+    with pytest.raises(ClientError):
+        uploader(cli_process, client).upload_buffer(payload(2 * PART_SIZE), "reports/result.xlsx")
+
+    assert client.attempts[1] == 1
+    assert client.aborted == ["upload-1"]
@@ -0,0 +1,149 @@
+"""
+Per-request scratch workspaces and a sweeper bounding what they leave behind.
+
+Requests that need the disk get their own uniquely named directory under a
+shared root, so concurrent requests in different gunicorn workers never write
+to the same path. Workspaces are removed when their request or job is done;
+WorkspaceSweeper removes whatever a failed or killed one left behind:
+
+- entries older than a TTL
+- the oldest entries while the root is above its disk quota
+
+Every worker runs its own sweeper thread, so removals tolerate another worker
+getting there first. Entries younger than min_age are never removed, which
+keeps in-flight requests of other workers safe.
+"""
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+def create_workspace(root: str, prefix: str = "") -> str:
+    """Create a uniquely named directory under root and return its path."""
+    name = f"{prefix}{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:12]}"
+    path = os.path.join(root, name)
+    os.makedirs(path)
+    return path
+
+
+def _entry_usage(path: str) -> Tuple[int, float]:
+    """Total bytes and newest modification time of a file or directory tree."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 0, 0.0
+    if not os.path.isdir(path):
+        return stat.st_size, stat.st_mtime
+    size, mtime = 0, stat.st_mtime
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                file_stat = os.stat(os.path.join(dirpath, filename))
+            except FileNotFoundError:
+                continue
+            size += file_stat.st_size
+            mtime = max(mtime, file_stat.st_mtime)
+    return size, mtime
+
+
+class WorkspaceSweeper:
+    """Removes expired entries under a root directory and keeps it under a disk quota."""
+
+    def __init__(self, root: str, ttl_seconds: float, max_bytes: int,
+                 min_age_seconds: float = 300,
+                 keep: Sequence[str] = (),
+                 is_active: Optional[Callable[[str], bool]] = None,
+                 on_remove: Optional[Callable[[str], None]] = None):
+        """
+        Initialise sweeper.
+
+        Args:
+            root: Directory whose entries (files or workspace directories) are swept
+            ttl_seconds: Entries untouched for longer than this are removed
+            max_bytes: Upper bound for everything under root
+            min_age_seconds: Entries touched more recently than this are never removed
+            keep: Entry names that are never removed (e.g. a database file)
+            is_active: Optional check by entry name; active entries are never removed
+            on_remove: Optional callback with the name of each removed entry
+        """
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.min_age_seconds = min_age_seconds
+        self.keep = set(keep)
+        self.is_active = is_active or (lambda name: False)
+        self.on_remove = on_remove or (lambda name: None)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(root, exist_ok=True)
+
+    def sweep(self) -> Dict[str, int]:
+        """
+        Remove expired entries, then the oldest ones until root fits its quota.
+
+        Returns:
+            Number of removed entries, bytes freed and bytes left under root
+        """
+        now = time.time()
+        entries = sorted(self._entries(), key=lambda e: e[2])   # oldest first
+        total = sum(size for _, size, _ in entries)
+        removed = freed = 0
+        for name, size, mtime in entries:
+            age = now - mtime
+            expired = age > self.ttl_seconds
+            if not expired and total <= self.max_bytes:
+                continue
+            if age < self.min_age_seconds or self.is_active(name):
+                continue
+            self._remove(name)
+            removed += 1
+            freed += size
+            total -= size
+        if removed:
+            print(f"✓ Swept {removed} entries ({freed} bytes) from {self.root}")
+        return {"removed": removed, "freedBytes": freed, "diskBytes": total}
+
+    def start(self, interval_seconds: float) -> None:
+        """Sweep every interval_seconds on a daemon thread (once per process)."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval_seconds,),
+                                        name=f"sweeper-{os.path.basename(self.root)}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the sweeper thread."""
+        self._stop.set()
+
+    def _run(self, interval_seconds: float) -> None:
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"✗ Sweeping {self.root} failed: {e}")
+            self._stop.wait(interval_seconds)
+
+    def _entries(self) -> List[Tuple[str, int, float]]:
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name in self.keep:
+                continue
+            size, mtime = _entry_usage(entry.path)
+            if mtime:
+                entries.append((entry.name, size, mtime))
+        return entries
+
+    def _remove(self, name: str) -> None:
+        path = os.path.join(self.root, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass   # another worker swept it first
+        self.on_remove(name)